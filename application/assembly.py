@@ -0,0 +1,184 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+CGMs assembled from IGMs that are parsed once.
+
+A CGM is a dozen TSO IGMs plus the boundary set. ``ModelAssembly`` parses each of them once, through the
+validator's pipeline but into a store of its own, and keeps it as a member together with the ``ModelHistogram`` of
+its triples. ``union`` views any selection of members as one graph (``CimUnionView``) in constant time and memory,
+so the resident IGMs make up every CGM variant without being parsed or copied again. ``validate`` runs the IGM
+scoped shapes on every IGM together with the boundary set, and the CGM scoped shapes on the union of them all.
+``compile_shapes`` sorts shape files into the two scopes by the QoCDC file names, after their owl:imports are
+resolved: ``*_CGM.ttl`` and ``*_IGMCGM.ttl`` are validated on the CGM, any other file on every IGM. A bundle that
+imports files of both scopes, like ``MainShapeQoCDC33.ttl``, is loaded without its CGM scoped imports for the
+IGMs, and those are validated on the CGM::
+
+    validator = ModelValidator(store='Compact')
+    validator.load_datatype_mapping(datatype_mapping)
+    assembly = ModelAssembly(validator)
+    assembly.load_boundary(['BD.zip'])
+    assembly.load_member('TSO_A', ['A.zip'])
+    assembly.load_member('TSO_B', ['B.zip'])
+    igm_results, cgm_result = assembly.validate(*assembly.compile_shapes(shacl_files))
+
+With the Oxigraph store (and without named graphs) the members share one store instead, each in a named graph of
+its own. Native SPARQL constraints (``application.sparqlconstraints``) then query the named graphs of a view as
+their default graph rather than a copy of the view. Oxigraph matches a triple once per graph that holds it, so
+views whose members share triples, which IGMs of different TSOs do not, are still copied for them; whether a
+member shares triples is looked up once, the first time a view with it is validated natively.
+"""
+
+import os
+from urllib.parse import quote
+
+from rdflib import URIRef
+from rdflib.store import Store
+
+from application import cimplugin
+from application.CimGraph import CimGraph, CimUnionView
+from application.pruning import ModelHistogram
+
+CGM_SHAPE_SUFFIXES = ('_CGM', '_IGMCGM')
+# the named graphs of the members in a shared store
+MEMBER_GRAPH = 'urn:modshape:member:'
+BOUNDARY_GRAPH = 'urn:modshape:boundary'
+# the other graphs that hold triples of a graph
+SHARING_GRAPHS = 'SELECT DISTINCT ?graph WHERE {{ GRAPH <{0}> {{ ?s ?p ?o }} GRAPH ?graph {{ ?s ?p ?o }} ' \
+                 'FILTER(?graph != <{0}>) }}'
+
+
+def cgm_scoped(path):
+    return os.path.splitext(os.path.basename(path))[0].upper().endswith(CGM_SHAPE_SUFFIXES)
+
+
+def split_shapes(shacl_files, resolver):
+    """
+    (IGM scoped, CGM scoped) shape files, see the module documentation. The CGM scoped files include those the
+    IGM scoped ones import through ``resolver``, which the IGM scoped ones are to be loaded without.
+    """
+    igm_files = [path for path in shacl_files if not cgm_scoped(path)]
+    cgm_files = [path for path in shacl_files if cgm_scoped(path)]
+    scoped = {os.path.abspath(path) for path in cgm_files}
+    cgm_files += [location for location in resolver.closure(igm_files)
+                  if cgm_scoped(location) and location not in scoped]
+    return igm_files, cgm_files
+
+
+class Member:
+    """A parsed model: its graph and the histogram of its triples."""
+
+    def __init__(self, graph, histogram):
+        self.graph = graph
+        self.histogram = histogram
+        # the graph names of the members that share triples with it in the shared store, once looked up
+        self.sharing = None
+
+
+class ModelAssembly:
+    """Parsed IGMs and boundary set, combined into CGMs on demand; see the module documentation."""
+
+    def __init__(self, validator):
+        self.validator = validator
+        self.members = {}
+        self.boundary = None
+        # the store of all members, see the module documentation; None gives every member a store of its own
+        self.store = None
+        if validator.store == 'Oxigraph' and not validator.named_graphs:
+            self.store = cimplugin.get('Oxigraph', Store)()
+
+    def compile_shapes(self, shacl_files, use_cache=True, catalogs=()):
+        """The ``CompiledShapes`` of the IGM and of the CGM scope (None if a scope has no files)."""
+        validator = self.validator
+        for catalog in catalogs:
+            validator.import_resolver.add_catalog(catalog)
+        igm_files, cgm_files = split_shapes(shacl_files, validator.import_resolver)
+        igm_shapes = validator.compile_shacl(igm_files, use_cache, catalogs, cgm_files) if igm_files else None
+        cgm_shapes = validator.compile_shacl(cgm_files, use_cache, catalogs) if cgm_files else None
+        return igm_shapes, cgm_shapes
+
+    def parse(self, file_paths, graph_name):
+        # the parser, datatype mapping, model cache, progress and metrics of the validator, and a store of its own
+        # or the named graph graph_name of the shared store
+        validator = self.validator
+        if self.store is not None:
+            self.forget(URIRef(graph_name))  # a member loaded again
+            validator.reset_instance_data(CimGraph(store=self.store, identifier=URIRef(graph_name)))
+        else:
+            validator.reset_instance_data()
+        try:
+            validator.load_instance_data(file_paths)
+            return Member(validator.merged_instance_graph, validator.model_histogram)
+        finally:
+            validator.reset_instance_data()
+
+    def load_member(self, name, file_paths):
+        self.members[name] = self.parse(file_paths, MEMBER_GRAPH + quote(name, safe=''))
+
+    def load_boundary(self, file_paths):
+        self.boundary = self.parse(file_paths, BOUNDARY_GRAPH)
+
+    def remove_member(self, name):
+        # its memory is freed with the last view of it, or right away in the shared store
+        member = self.members.pop(name)
+        if self.store is not None:
+            self.forget(member.graph.identifier)
+
+    def forget(self, graph_name):
+        # empties a named graph of the shared store
+        self.store.remove_graph(graph_name)
+        for member in self.all_members():
+            if member.sharing is not None:
+                member.sharing.discard(graph_name)
+
+    def all_members(self):
+        return list(self.members.values()) + ([self.boundary] if self.boundary is not None else [])
+
+    def sharing_graphs(self, member):
+        """The graph names of the members that hold triples of member as well."""
+        if member.sharing is None:
+            name = member.graph.identifier
+            member.sharing = set()
+            for solution in self.store.inner.query(SHARING_GRAPHS.format(name)):
+                other = URIRef(solution['graph'].value)
+                member.sharing.add(other)
+                for member_of_other in self.all_members():
+                    if member_of_other.graph.identifier == other and member_of_other.sharing is not None:
+                        member_of_other.sharing.add(name)
+        return member.sharing
+
+    def union(self, names=None, boundary=True):
+        """
+        Read-only view of the named members (all by default) and the boundary set, with their histogram. In the
+        shared store the view knows whether they share no triples, and native SPARQL then runs on their named graphs.
+        """
+        from application.oxigraphstore import graph_name
+
+        members = [self.members[name] for name in (self.members if names is None else names)]
+        if boundary and self.boundary is not None:
+            members.append(self.boundary)
+        view = CimUnionView((member.graph for member in members), histograms=(member.histogram for member in members))
+        view.histogram = ModelHistogram.combined(member.histogram for member in members)
+        if self.store is not None:
+            graphs = {member.graph.identifier for member in members}
+            view.disjoint = not any(self.sharing_graphs(member) & graphs for member in members)
+            if view.disjoint and self.validator.native_sparql:
+                view.dataset = self.store.inner, {'default_graph': [graph_name(member.graph) for member in members]}
+        return view
+
+    def validate(self, igm_shapes=None, cgm_shapes=None, names=None):
+        """
+        Results of the IGM scoped ``CompiledShapes`` per member, ``{name: (conforms, graph, text)}``, and of the
+        CGM scoped ones on the union of the members (None without CGM shapes).
+        """
+        names = list(self.members if names is None else names)
+        igm_results = {}
+        if igm_shapes is not None:
+            for name in names:
+                view = self.union([name])
+                igm_results[name] = self.validator.validate(view, igm_shapes, view.histogram)
+        cgm_result = None
+        if cgm_shapes is not None:
+            view = self.union(names)
+            cgm_result = self.validator.validate(view, cgm_shapes, view.histogram)
+        return igm_results, cgm_result
@@ -0,0 +1,86 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Helpers shared by the on-disk caches of ModShape.
+
+All caches live below one directory, ``~/.modshape/cache`` by default or ``$MODSHAPE_CACHE_DIR`` if set.
+Entries are addressed by the content hash of their source files, so a changed file never hits a stale entry.
+"""
+
+import hashlib
+import os
+import tempfile
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def cache_dir(*parts):
+    base = os.environ.get('MODSHAPE_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.modshape', 'cache')
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def files_digest(paths, *extra):
+    """Digest over the content of several files (in the given order) and any extra key material."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(file_digest(path).encode())
+    for item in extra:
+        digest.update(str(item).encode())
+    return digest.hexdigest()
+
+
+def atomic_write(path, data):
+    """Write bytes to path so that concurrent readers see either the old or the complete new file."""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def touch(path):
+    """Mark an entry as recently used, for ``evict``."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict(directory, max_bytes, keep=()):
+    """Delete the least recently used files of a cache directory until it holds at most max_bytes."""
+    entries = []
+    for entry in os.scandir(directory):
+        # .tmp files are writes of other processes still in progress, see atomic_write
+        if entry.is_file() and entry.path not in keep and not entry.name.endswith('.tmp'):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # evicted by another process meanwhile
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries) + sum(os.path.getsize(path) for path in keep if os.path.exists(path))
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
@@ -0,0 +1,227 @@
+"""
+A streaming fast-path parser for the CGMES subset of RDF/XML.
+
+CGMES instance files are flat: ``rdf:RDF`` holds node elements with
+``rdf:ID`` or ``rdf:about``, whose children are property elements carrying
+either a literal or an ``rdf:resource``. ``CIMFastXMLParser`` drives
+``xml.parsers.expat`` directly with a two-level state machine for exactly
+this shape and emits the same triples as ``CIMRDFXMLParser``.
+
+Anything outside the subset (``rdf:parseType``, nested node elements,
+reification via ``rdf:ID`` on a property, ``rdf:nodeID``, blank nodes,
+``xml:base``/``xml:lang``, property attributes, elements without a namespace,
+...) makes the parser fall back to the generic ``CIMRDFXMLParser`` for the
+whole document. The fast path only ever emits triples the generic parser emits
+as well, so re-parsing into the same graph after a fallback yields exactly the
+generic result.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import urldefrag, urljoin
+from xml.parsers import expat
+
+from rdflib.exceptions import ParserError
+from rdflib.graph import Graph
+from rdflib.namespace import RDF
+from rdflib.parser import InputSource, Parser
+from rdflib.plugins.parsers.RDFVOC import RDFVOC
+from rdflib.term import Literal, URIRef
+
+from application.cimrdfxml import (
+    CIMRDFXMLParser,
+    NODE_ELEMENT_EXCEPTIONS,
+    PROPERTY_ELEMENT_EXCEPTIONS,
+)
+
+__all__ = ["CIMFastXMLParser", "FallBack"]
+
+# expat reports names as "namespace local"; a space occurs in neither, a name without one has no namespace
+NS_SEPARATOR = " "
+RDFNS_STR = str(RDFVOC)
+RDF_ID = RDFNS_STR + NS_SEPARATOR + "ID"
+RDF_ABOUT = RDFNS_STR + NS_SEPARATOR + "about"
+RDF_RESOURCE = RDFNS_STR + NS_SEPARATOR + "resource"
+RDF_DATATYPE = RDFNS_STR + NS_SEPARATOR + "datatype"
+RDF_RDF = RDFNS_STR + NS_SEPARATOR + "RDF"
+
+BATCH_SIZE = 100_000
+READ_SIZE = 1024 * 1024
+
+
+class FallBack(Exception):
+    """Raised when the document leaves the CGMES subset handled by the fast path."""
+
+
+class CIMFastXMLHandler:
+    """Two-level state machine below rdf:RDF: node elements at depth 2, property elements at depth 3."""
+
+    def __init__(
+        self,
+        sink: Graph,
+        datamapping: Optional[Mapping[URIRef, URIRef]],
+        base: Optional[str],
+    ):
+        self.sink = sink
+        self.datamapping = datamapping if datamapping is not None else {}
+        self.base = base
+        # see RDFXMLHandler.absolutize for the fragment fast path
+        self.concat = base is not None and urljoin(base, "#_") == base + "#_"
+        self.uris: Dict[str, URIRef] = {}
+        self.names: Dict[str, URIRef] = {}
+        self.batch: List[Tuple[Any, Any, Any, Graph]] = []
+
+        self.depth = 0
+        self.subject: Optional[URIRef] = None
+        self.predicate: Optional[URIRef] = None
+        self.datatype: Optional[URIRef] = None
+        self.data: Optional[List[str]] = None
+
+    def absolutize(self, uri: str) -> URIRef:
+        result = self.uris.get(uri)
+        if result is None:
+            if self.concat and uri[:1] == "#":
+                value = self.base + uri
+            else:
+                value = urljoin(self.base, uri, allow_fragments=True)
+                if uri and uri[-1] == "#" and value[-1] != "#":
+                    value = "%s#" % value
+            result = self.uris[uri] = URIRef(value)
+        return result
+
+    def name(self, name: str) -> URIRef:
+        result = self.names.get(name)
+        if result is None:
+            namespace, separator, local = name.partition(NS_SEPARATOR)
+            if not separator:
+                raise FallBack("element %s without a namespace" % name)
+            result = self.names[name] = URIRef(namespace + local)
+        return result
+
+    def emit(self, s, p, o) -> None:
+        batch = self.batch
+        batch.append((s, p, o, self.sink))
+        if len(batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.batch:
+            self.sink.addN(self.batch)
+            self.batch = []
+
+    def start_namespace(self, prefix: Optional[str], uri: str) -> None:
+        self.sink.bind(prefix, uri or "", override=False)
+
+    def start_element(self, name: str, attrs: Dict[str, str]) -> None:
+        depth = self.depth = self.depth + 1
+        if depth == 3:
+            self.property_element_start(name, attrs)
+        elif depth == 2:
+            self.node_element_start(name, attrs)
+        elif depth == 1:
+            if name != RDF_RDF or attrs:
+                raise FallBack("document element is not a plain rdf:RDF")
+        else:
+            raise FallBack("nested node element")
+
+    def node_element_start(self, name: str, attrs: Dict[str, str]) -> None:
+        if len(attrs) != 1:
+            raise FallBack("node element without exactly one of rdf:ID, rdf:about")
+        value = attrs.get(RDF_ID)
+        if value is not None:
+            subject = self.absolutize("#" + value)
+        else:
+            value = attrs.get(RDF_ABOUT)
+            if value is None:
+                raise FallBack("node element without rdf:ID or rdf:about")
+            subject = self.absolutize(value)
+        node_type = self.name(name)
+        if node_type in NODE_ELEMENT_EXCEPTIONS:
+            raise FallBack("invalid node element %s" % name)
+        if node_type != RDFVOC.Description:
+            self.emit(subject, RDF.type, node_type)
+        self.subject = subject
+
+    def property_element_start(self, name: str, attrs: Dict[str, str]) -> None:
+        predicate = self.name(name)
+        if predicate.startswith(RDFNS_STR) and (
+            predicate == RDFVOC.li or predicate in PROPERTY_ELEMENT_EXCEPTIONS
+        ):
+            raise FallBack("rdf:li or invalid property element %s" % name)
+        self.predicate = predicate
+        self.datatype = None
+        self.data = None
+        if attrs:
+            resource = attrs.get(RDF_RESOURCE)
+            if resource is not None:
+                if len(attrs) != 1:
+                    raise FallBack("rdf:resource combined with other attributes")
+                self.emit(self.subject, predicate, self.absolutize(resource))
+                return
+            datatype = attrs.get(RDF_DATATYPE)
+            if datatype is None or len(attrs) != 1:
+                raise FallBack("unsupported property element attributes")
+            self.datatype = self.absolutize(datatype)
+        self.data = []
+
+    def characters(self, data: str) -> None:
+        if self.data is not None and self.depth == 3:
+            self.data.append(data)
+
+    def end_element(self, name: str) -> None:
+        depth = self.depth
+        self.depth = depth - 1
+        if depth == 3 and self.data is not None:
+            predicate = self.predicate
+            datatype = self.datamapping.get(predicate) or self.datatype
+            self.emit(self.subject, predicate, Literal("".join(self.data), None, datatype))
+            self.data = None
+        elif depth == 2:
+            self.subject = None
+
+
+class CIMFastXMLParser(Parser):
+    def __init__(self):
+        super().__init__()
+
+    def parse(self, source: InputSource, sink: Graph, **args: Any) -> None:
+        stream = source.getByteStream()
+        start = stream.tell() if stream.seekable() else None
+        # the generic parser adds the batches flushed before a fallback once more; the graph
+        # keeps them once, its histogram (see CimGraph.histogram) must count them once too
+        histogram = getattr(sink, "histogram", None)
+        counted = histogram.snapshot() if histogram is not None else None
+        try:
+            self.parse_fast(source, sink, **args)
+        except FallBack:
+            if start is None:
+                raise ParserError(
+                    "Document is outside the CGMES subset and the stream cannot be "
+                    "re-read; parse it with the 'cimxml' format instead"
+                )
+            stream.seek(start)
+            if histogram is not None:
+                histogram.restore(counted)
+            CIMRDFXMLParser().parse(source, sink, **args)
+
+    def parse_fast(self, source: InputSource, sink: Graph, **args: Any) -> None:
+        system_id = source.getPublicId() or source.getSystemId()
+        base = urldefrag(system_id)[0] if system_id else None
+        handler = CIMFastXMLHandler(sink, args.get("datatype_mapping"), base)
+
+        parser = expat.ParserCreate(namespace_separator=NS_SEPARATOR)
+        parser.buffer_text = True
+        parser.buffer_size = READ_SIZE
+        parser.StartNamespaceDeclHandler = handler.start_namespace
+        parser.StartElementHandler = handler.start_element
+        parser.EndElementHandler = handler.end_element
+        parser.CharacterDataHandler = handler.characters
+
+        stream = source.getByteStream()
+        try:
+            parser.ParseFile(stream)
+        except expat.ExpatError as e:
+            raise ParserError(
+                "%s:%s:%s: %s" % (system_id, e.lineno, e.offset, expat.ErrorString(e.code))
+            )
+        handler.flush()
@@ -0,0 +1,160 @@
+"""
+A CIM RDF/XML parser for RDFLib backed by pyoxigraph's native RDF/XML parser.
+
+Into an Oxigraph store (``application.oxigraphstore``) the triples go
+straight from pyoxigraph's parser to the native store, as pyoxigraph terms:
+only the literals of predicates in the CGMES datatype mapping are rebuilt
+with their datatype, and the histogram of the graph is counted per distinct
+predicate. Into any other store, or when the parsed model is being cached
+(``application.modelcache``), the triples are converted to rdflib terms in
+batches; IRIs are interned, so each distinct node is built once per parse.
+Either way the datatype mapping is resolved once per distinct predicate
+instead of once per literal. The SAX based ``CIMRDFXMLParser`` stays the
+reference implementation; all of them produce the same triples.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Dict, Mapping, Optional
+from urllib.parse import urlparse
+
+import pyoxigraph
+from rdflib.graph import Graph
+from rdflib.namespace import XSD
+from rdflib.parser import InputSource, Parser
+from rdflib.term import BNode, Literal, URIRef
+
+if TYPE_CHECKING:
+    from rdflib.graph import _ObjectType
+
+__all__ = ["CIMOxigraphParser", "TermConverter"]
+
+# pyoxigraph only resolves against absolute IRIs. Documents without an
+# absolute base are parsed against this placeholder, which is stripped again
+# so subjects come out relative ("#_mRID") exactly as with the SAX parser.
+PLACEHOLDER_BASE = "http://modshape.invalid/"
+
+BATCH_SIZE = 100_000
+XSD_STRING = XSD.string.toPython()
+RDF_TYPE = pyoxigraph.NamedNode("http://www.w3.org/1999/02/22-rdf-syntax-ns#type")
+
+
+class TermConverter:
+    """Converts pyoxigraph terms to rdflib terms, building each distinct node once."""
+
+    def __init__(
+        self,
+        datamapping: Optional[Mapping[URIRef, URIRef]] = None,
+        strip_base: Optional[str] = None,
+    ):
+        self.datamapping = datamapping if datamapping is not None else {}
+        self.strip_base = strip_base
+        self.nodes: Dict[Any, Any] = {}
+        self.datatypes: Dict[Any, Optional[URIRef]] = {}
+
+    def node(self, term) -> Any:
+        node = self.nodes.get(term)
+        if node is None:
+            if isinstance(term, pyoxigraph.BlankNode):
+                node = BNode()
+            else:
+                value = term.value
+                if self.strip_base and value.startswith(self.strip_base):
+                    value = value[len(self.strip_base):]
+                node = URIRef(value)
+            self.nodes[term] = node
+        return node
+
+    def datatype(self, predicate) -> Optional[URIRef]:
+        # one mapping lookup per distinct predicate
+        try:
+            return self.datatypes[predicate]
+        except KeyError:
+            datatype = self.datatypes[predicate] = self.datamapping.get(self.node(predicate))
+            return datatype
+
+    def object(self, predicate, term) -> _ObjectType:
+        if not isinstance(term, pyoxigraph.Literal):
+            return self.node(term)
+        # not interned: the measured values of SSH and SV files hardly ever repeat
+        datatype = self.datatype(predicate)
+        if datatype is not None:
+            return Literal(term.value, None, datatype)
+        if term.language is not None:
+            return Literal(term.value, term.language)
+        if term.datatype.value == XSD_STRING:
+            # untyped in the document, as the SAX parser leaves it
+            return Literal(term.value)
+        return Literal(term.value, None, URIRef(term.datatype.value))
+
+
+def native_quads(triples, graph_name, datamapping, predicates, classes):
+    """
+    Quads of the parsed triples in the graph ``graph_name``, with the mapped datatypes, all as pyoxigraph terms.
+    ``predicates`` and ``classes`` count the triples per predicate and the rdf:type objects on the way.
+    """
+    datatypes: Dict[Any, Any] = {}
+    quad, literal = pyoxigraph.Quad, pyoxigraph.Literal
+    for triple in triples:
+        predicate, term = triple.predicate, triple.object
+        predicates[predicate] += 1
+        if predicate == RDF_TYPE:
+            classes[term] += 1
+        # one mapping lookup per distinct predicate
+        try:
+            datatype = datatypes[predicate]
+        except KeyError:
+            datatype = datamapping.get(URIRef(predicate.value))
+            datatype = datatypes[predicate] = None if datatype is None else pyoxigraph.NamedNode(datatype)
+        if datatype is not None and isinstance(term, literal):
+            term = literal(term.value, datatype=datatype)
+        yield quad(triple.subject, predicate, term, graph_name)
+
+
+class CIMOxigraphParser(Parser):
+    def __init__(self):
+        super().__init__()
+
+    def parse(self, source: InputSource, sink: Graph, **args: Any) -> None:
+        from application.oxigraphstore import OxigraphStore
+        from application.pruning import ModelHistogram
+
+        public_id = source.getPublicId() or source.getSystemId() or ""
+        if urlparse(public_id).scheme:
+            base_iri, strip_base = public_id, None
+        else:
+            base_iri, strip_base = PLACEHOLDER_BASE + public_id, PLACEHOLDER_BASE
+
+        triples = pyoxigraph.parse(
+            source.getByteStream(), "application/rdf+xml", base_iri=base_iri
+        )
+        datamapping = args.get("datatype_mapping") or {}
+        histogram = getattr(sink, "histogram", None)
+        if isinstance(sink.store, OxigraphStore) and (histogram is None or isinstance(histogram, ModelHistogram)):
+            # relative IRIs stay under PLACEHOLDER_BASE, where the store keeps them
+            self.load_native(triples, sink, datamapping, histogram)
+            return
+
+        converter = TermConverter(datamapping, strip_base)
+        node = converter.node
+        convert_object = converter.object
+        for batch in iter(lambda: list(islice(triples, BATCH_SIZE)), []):
+            sink.addN(
+                (node(t.subject), node(t.predicate), convert_object(t.predicate, t.object), sink)
+                for t in batch
+            )
+
+    @staticmethod
+    def load_native(triples, sink: Graph, datamapping: Mapping[URIRef, URIRef], histogram) -> None:
+        from application.oxigraphstore import from_oxigraph, graph_name
+
+        predicates: Counter = Counter()
+        classes: Counter = Counter()
+        sink.store.inner.bulk_extend(native_quads(triples, graph_name(sink), datamapping, predicates, classes))
+        if histogram is not None:
+            # the graph adds nothing itself here, so its histogram gets the counts per distinct predicate and class
+            histogram.update(
+                {from_oxigraph(predicate): count for predicate, count in predicates.items()},
+                {from_oxigraph(cls): count for cls, count in classes.items()},
+            )
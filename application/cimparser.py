@@ -298,7 +298,13 @@ class FileInputSource(InputSource):
         self, file: Union[BinaryIO, TextIO, TextIOBase, RawIOBase, BufferedIOBase]
     ):
         base = pathlib.Path.cwd().as_uri()
-        system_id = URIRef(pathlib.Path(file.name).absolute().as_uri(), base=base)  # type: ignore[union-attr]
+        name = getattr(file, "name", None)
+        # streams without a file name (e.g. spooled archive members) have no system id
+        system_id = (
+            URIRef(pathlib.Path(name).absolute().as_uri(), base=base)
+            if isinstance(name, str)
+            else None
+        )
         super(FileInputSource, self).__init__(system_id)
         self.file = file
         if isinstance(file, TextIOBase):  # Python3 unicode fp
@@ -26,6 +26,7 @@ information.
 """
 
 from importlib.metadata import EntryPoint, entry_points
+from importlib.util import find_spec
 from typing import (
     TYPE_CHECKING,
     Any,
@@ -39,7 +40,7 @@ from typing import (
     overload,
 )
 
-import rdflib.plugins.stores.berkeleydb
+import rdflib.plugin
 from rdflib.exceptions import Error
 from rdflib.parser import Parser
 from rdflib.query import (
@@ -178,8 +179,8 @@ def plugins(
 
 # Register Stores
 
-if rdflib.plugins.stores.berkeleydb.has_bsddb:
-    # Checks for BerkeleyDB before registering it
+if find_spec("berkeleydb") is not None:
+    # Checks for BerkeleyDB before registering it, without importing it
     register(
         "BerkeleyDB",
         Store,
@@ -198,6 +199,31 @@ register(
     "rdflib.plugins.stores.memory",
     "Memory",
 )
+register(
+    "Oxigraph",
+    Store,
+    "application.oxigraphstore",
+    "OxigraphStore",
+)
+# Graph(store="...") resolves store names through rdflib's own plugin registry
+rdflib.plugin.register(
+    "Oxigraph",
+    Store,
+    "application.oxigraphstore",
+    "OxigraphStore",
+)
+register(
+    "Compact",
+    Store,
+    "application.compactstore",
+    "CompactStore",
+)
+rdflib.plugin.register(
+    "Compact",
+    Store,
+    "application.compactstore",
+    "CompactStore",
+)
 register(
     "SimpleMemory",
     Store,
@@ -379,6 +405,18 @@ register(
     "application.cimrdfxml",
     "CIMRDFXMLParser",
 )
+register(
+    "cimxml-oxigraph",
+    CIMParser,
+    "application.cimoxigraph",
+    "CIMOxigraphParser",
+)
+register(
+    "cimxml-fast",
+    CIMParser,
+    "application.cimfastxml",
+    "CIMFastXMLParser",
+)
 register(
     "xml",
     Parser,
@@ -3,7 +3,7 @@ An RDF/XML parser for RDFLib
 """
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, Dict, List, NoReturn, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, NoReturn, Optional, Tuple
 from urllib.parse import urldefrag, urljoin
 from xml.sax import handler, make_parser, xmlreader
 from xml.sax.handler import ErrorHandler
@@ -15,9 +15,6 @@ from rdflib.namespace import RDF, is_ncname
 from rdflib.parser import InputSource, Parser
 from rdflib.plugins.parsers.RDFVOC import RDFVOC
 from rdflib.term import BNode, Identifier, Literal, URIRef
-import polars as pl
-
-from application.ModShape import ModShape
 
 
 if TYPE_CHECKING:
@@ -29,6 +26,7 @@ if TYPE_CHECKING:
 __all__ = ["create_parser", "BagID", "ElementHandler", "RDFXMLHandler", "CIMRDFXMLParser"]
 
 RDFNS = RDFVOC
+RDFNS_STR = str(RDFNS)
 
 # http://www.w3.org/TR/rdf-syntax-grammar/#eventterm-attribute-URI
 # A mapping from unqualified terms to their qualified version.
@@ -138,9 +136,9 @@ class ElementHandler:
 
 
 class RDFXMLHandler(handler.ContentHandler):
-    def __init__(self, store: Graph,datamapping):
+    def __init__(self, store: Graph, datamapping: Optional[Mapping[URIRef, URIRef]] = None):
         self.store = store
-        self.datamapping = datamapping
+        self.datamapping = datamapping if datamapping is not None else {}
         self.preserve_bnode_ids = False
         self.reset()
 
@@ -160,6 +158,12 @@ class RDFXMLHandler(handler.ContentHandler):
             {}
         ]  # contains uri -> prefix dicts
         self._current_context: Dict[str, Optional[str]] = self._ns_contexts[-1]
+        # Per-parse interning. CGMES documents repeat a few hundred class and
+        # property names and every rdf:ID is referenced again via rdf:resource,
+        # so each distinct name is resolved once and the URIRef is shared.
+        self._uri_memo: Dict[Optional[str], Tuple[Dict[str, URIRef], bool]] = {}
+        self._name_memo: Dict[Tuple[Optional[str], str], URIRef] = {}
+        self._att_memo: Dict[Tuple[Optional[str], str], Optional[URIRef]] = {}
 
     # ContentHandler methods
 
@@ -262,38 +266,65 @@ class RDFXMLHandler(handler.ContentHandler):
     parent = property(get_parent)
 
     def absolutize(self, uri: str) -> URIRef:
-        # type error: Argument "allow_fragments" to "urljoin" has incompatible type "int"; expected "bool"
-        result = urljoin(self.current.base, uri, allow_fragments=1)  # type: ignore[arg-type]
-        if uri and uri[-1] == "#" and result[-1] != "#":
-            result = "%s#" % result
-        return URIRef(result)
+        base = self.current.base
+        try:
+            memo, concat = self._uri_memo[base]
+        except KeyError:
+            # the base never carries a fragment, so for hierarchical (and empty)
+            # bases joining a "#fragment" is plain concatenation
+            concat = base is not None and urljoin(base, "#_") == base + "#_"
+            memo = {}
+            self._uri_memo[base] = (memo, concat)
+        cached = memo.get(uri)
+        if cached is not None:
+            return cached
+        if concat and uri[:1] == "#":
+            # rdf:ID / "#_mRID" fast path
+            result = base + uri
+        else:
+            # type error: Argument "allow_fragments" to "urljoin" has incompatible type "int"; expected "bool"
+            result = urljoin(base, uri, allow_fragments=1)  # type: ignore[arg-type]
+            if uri and uri[-1] == "#" and result[-1] != "#":
+                result = "%s#" % result
+        cached = memo[uri] = URIRef(result)
+        return cached
 
     def convert(
         self, name: Tuple[Optional[str], str], qname, attrs: AttributesImpl
     ) -> Tuple[URIRef, Dict[URIRef, str]]:
-        if name[0] is None:
-            # type error: Incompatible types in assignment (expression has type "URIRef", variable has type "Tuple[Optional[str], str]")
-            name = URIRef(name[1])  # type: ignore[assignment]
-        else:
-            # type error: Incompatible types in assignment (expression has type "URIRef", variable has type "Tuple[Optional[str], str]")
-            # type error: Argument 1 to "join" of "str" has incompatible type "Tuple[Optional[str], str]"; expected "Iterable[str]"
-            name = URIRef("".join(name))  # type: ignore[assignment, arg-type]
+        converted = self._name_memo.get(name)
+        if converted is None:
+            if name[0] is None:
+                converted = URIRef(name[1])
+            else:
+                # type error: Argument 1 to "join" of "str" has incompatible type "Tuple[Optional[str], str]"; expected "Iterable[str]"
+                converted = URIRef("".join(name))  # type: ignore[arg-type]
+            self._name_memo[name] = converted
         atts = {}
+        att_memo = self._att_memo
         for n, v in attrs.items():
-            if n[0] is None:
-                att = n[1]
-            else:
-                att = "".join(n)
-            if att.startswith(XMLNS) or att[0:3].lower() == "xml":
-                pass
-            elif att in UNQUALIFIED:
-                # if not RDFNS[att] in atts:
-                # type error: Variable "att" is not valid as a type
-                atts[RDFNS[att]] = v  # type: ignore[misc, valid-type]
-            else:
-                atts[URIRef(att)] = v
-        # type error: Incompatible return value type (got "Tuple[Tuple[Optional[str], str], Dict[Any, Any]]", expected "Tuple[URIRef, Dict[URIRef, str]]")
-        return name, atts  # type: ignore[return-value]
+            try:
+                att_name = att_memo[n]
+            except KeyError:
+                att_name = att_memo[n] = self.convert_attribute(n)
+            if att_name is not None:
+                atts[att_name] = v
+        return converted, atts
+
+    @staticmethod
+    def convert_attribute(n: Tuple[Optional[str], str]) -> Optional[URIRef]:
+        # None for the xml:* attributes, which are not converted
+        if n[0] is None:
+            att = n[1]
+        else:
+            att = "".join(n)  # type: ignore[arg-type]
+        if att.startswith(XMLNS) or att[0:3].lower() == "xml":
+            return None
+        elif att in UNQUALIFIED:
+            # type error: Variable "att" is not valid as a type
+            return RDFNS[att]  # type: ignore[misc, valid-type]
+        else:
+            return URIRef(att)
 
     def document_element_start(
         self, name: Tuple[str, str], qname, attrs: AttributesImpl
@@ -365,7 +396,7 @@ class RDFXMLHandler(handler.ContentHandler):
         object: _ObjectType
         language = current.language
         for att in atts:
-            if not att.startswith(str(RDFNS)):
+            if not att.startswith(RDFNS_STR):
                 predicate = absolutize(att)
                 try:
                     object = Literal(atts[att], language)
@@ -418,7 +449,7 @@ class RDFXMLHandler(handler.ContentHandler):
         current.list = None
 
         # type error: "Tuple[str, str]" has no attribute "startswith"
-        if not name.startswith(str(RDFNS)):  # type: ignore[attr-defined]
+        if not name.startswith(RDFNS_STR):  # type: ignore[attr-defined]
             # type error: Argument 1 has incompatible type "Tuple[str, str]"; expected "str"
             current.predicate = absolutize(name)  # type: ignore[arg-type]
         elif name == RDFVOC.li:
@@ -502,7 +533,7 @@ class RDFXMLHandler(handler.ContentHandler):
             datatype = absolutize(datatype)
         else:
             for att in atts:
-                if not att.startswith(str(RDFNS)):
+                if not att.startswith(RDFNS_STR):
                     predicate = absolutize(att)
                 elif att in PROPERTY_ELEMENT_ATTRIBUTES:
                     continue
@@ -541,9 +572,8 @@ class RDFXMLHandler(handler.ContentHandler):
             if current.datatype is not None:
                 literalLang = None
 
-            #datatypes_mapping
-            # datatype_from_map = self.datamapping.filter(pl.col("Property") == current.predicate)
-            datatype_from_map = current.predicate if current.predicate in self.datamapping["Property-AttributeAssociation"] else None
+            # datatype of the attribute according to the CGMES datatype mapping (see application.datatypes)
+            datatype_from_map = self.datamapping.get(current.predicate)
             if datatype_from_map is None:
                 current.object = Literal(current.data, literalLang, current.datatype)
             else:
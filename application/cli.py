@@ -0,0 +1,225 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Headless batch validation.
+
+Validates a list of models against one set of SHACL shapes without starting Qt. The datatype mapping and the
+shapes are loaded once per process and reused for every model; both are compiled once and then loaded from the
+on-disk cache (see ``application.shapecache``). A job description is a JSON file::
+
+    {
+        "datatype_mapping": ["CGMES_v2_4_constraints/DatatypeMapping/rdfs_info_CGMES2415simple.json"],
+        "shacl": ["CGMES_v2_4_constraints/MainShapeQoCDC33.ttl"],
+        "catalog": ["CGMES_v2_4_constraints/catalog-v001.xml"],
+        "output_dir": "reports",
+        "parser": "oxigraph",
+        "named_graphs": false,
+        "store": "Oxigraph",
+        "native_sparql": true,
+        "shape_workers": 4,
+        "prune_shapes": true,
+        "cache_models": true,
+        "models": [
+            {"name": "IGM_A", "instance_data": ["IGM_A.zip"]},
+            {"name": "IGM_B", "instance_data": ["B_EQ.xml", "B_SSH.xml"], "report": "reports/B.xlsx"},
+            {"name": "IGM_C", "instance_data": ["C.zip"], "difference_models": ["C_SSH_0100.xml", "C_SSH_0200.xml"]}
+        ]
+    }
+
+``parser`` selects the instance data parser backend and ``named_graphs`` loads every file into its own named
+graph of one store. ``store`` names the rdflib store plugin the instance data is loaded into ("Memory",
+"Oxigraph", or "Compact", which needs several times less memory, see ``application.compactstore``), and
+``native_sparql`` runs the sh:sparql constraints on Oxigraph's SPARQL engine instead of pySHACL's.
+``shape_workers`` splits the shapes of every validation over that many processes, and ``prune_shapes`` (on by
+default) skips the shapes whose targets match nothing in the model. ``cache_models`` loads the instance files
+parsed before from the parsed model cache (see ``application.modelcache``). ``catalog`` lists XML catalogs that
+map owl:imports IRIs of the shapes to local files (a ``catalog-v001.xml`` next to a shape file is used without
+being listed). ``difference_models`` are applied to a model one after the other, each validated incrementally (see
+``application.incremental``) into a report of its own. Relative paths are resolved against the directory of the
+job file.
+``boundary`` lists the boundary set files the validation service keeps resident (see ``application.service``).
+``--metrics`` appends the timing spans and counters of every model to a JSON lines file (see
+``application.metrics``).
+Usage::
+
+    python -m application.cli job.json --workers 4 --metrics metrics.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from application.metrics import Metrics
+from application.validator import PARSER_FORMATS, ModelValidator
+
+# validator of the current process, loaded once and reused for every model
+_validator = None
+
+
+def load_job(job_file):
+    with open(job_file, "r") as json_file:
+        job = json.load(json_file)
+
+    base_dir = os.path.dirname(os.path.abspath(job_file))
+
+    def resolve(path):
+        return os.path.normpath(os.path.join(base_dir, path))
+
+    job['datatype_mapping'] = [resolve(path) for path in job.get('datatype_mapping', [])]
+    job['shacl'] = [resolve(path) for path in job.get('shacl', [])]
+    job['catalog'] = [resolve(path) for path in job.get('catalog', [])]
+    job['output_dir'] = resolve(job.get('output_dir', '.'))
+    job['boundary'] = [resolve(path) for path in job.get('boundary', [])]
+
+    models = []
+    for model in job.get('models', []):
+        if isinstance(model, str):
+            model = {'instance_data': [model]}
+        instance_data = [resolve(path) for path in model['instance_data']]
+        name = model.get('name') or os.path.splitext(os.path.basename(instance_data[0]))[0]
+        report = model.get('report')
+        report = resolve(report) if report else os.path.join(job['output_dir'], f"{name}.xlsx")
+        difference_models = [resolve(path) for path in model.get('difference_models', [])]
+        models.append({'name': name, 'instance_data': instance_data, 'report': report,
+                       'difference_models': difference_models})
+    job['models'] = models
+    return job
+
+
+def create_validator(datatype_mapping, shacl_files, parser='sax', named_graphs=False, store='Memory',
+                     native_sparql=False, catalogs=(), shape_workers=1, prune_shapes=True, cache_models=False,
+                     metrics=None):
+    validator = ModelValidator(parser, named_graphs, store, native_sparql, shape_workers, prune_shapes, cache_models)
+    if metrics is not None:
+        # the datatype mapping and the shapes loaded here are timed in the first run of the process
+        validator.metrics = Metrics(**metrics)
+    validator.load_datatype_mapping(datatype_mapping)
+    validator.load_shacl(shacl_files, catalogs=catalogs)
+    return validator
+
+
+def init_validator(datatype_mapping, shacl_files, *options):
+    global _validator
+    _validator = create_validator(datatype_mapping, shacl_files, *options)
+
+
+def validate_model(model):
+    # polars and the dependency analysis of incremental validation load on first use, not with the CLI
+    from application.incremental import IncrementalValidator
+    from application.results import results_frame
+
+    start_time = time.time()
+    _validator.reset_instance_data()
+    _validator.load_instance_data(model['instance_data'])
+    differences = []
+    if model.get('difference_models'):
+        incremental = IncrementalValidator(_validator)
+        conforms, results_graph, results_text = incremental.validate()
+    else:
+        conforms, results_graph, results_text = _validator.validate()
+
+    os.makedirs(os.path.dirname(model['report']) or '.', exist_ok=True)
+    results = results_frame(results_graph)
+    _validator.write_excel_report(results, model['report'])
+    pruned_shapes = [str(shape) for shape in _validator.pruned_shapes]
+
+    for difference_model in model.get('difference_models', []):
+        difference_conforms, results_graph, results_text = incremental.apply_files([difference_model])
+        name = os.path.splitext(os.path.basename(difference_model))[0]
+        report = os.path.join(os.path.dirname(model['report']), f"{model['name']}-{name}.xlsx")
+        difference_results = results_frame(results_graph)
+        _validator.write_excel_report(difference_results, report)
+        differences.append({'difference_model': difference_model, 'conforms': difference_conforms, 'report': report,
+                            'severities': severity_counts(difference_results)})
+    _validator.reset_instance_data()
+    _validator.metrics.finish(model=model['name'], conforms=conforms, report=model['report'])
+
+    return {'name': model['name'], 'conforms': conforms, 'report': model['report'], 'pruned_shapes': pruned_shapes,
+            'severities': severity_counts(results), 'differences': differences, 'time': time.time() - start_time}
+
+
+def severity_counts(results):
+    # number of results per severity, by the local name of the severity
+    from application.results import summarize
+
+    return {severity.rsplit('#', 1)[-1]: count for severity, count in summarize(results, 'severity').iter_rows()
+            if severity is not None}
+
+
+def validator_options(job):
+    # the arguments of create_validator after the datatype mapping and the shapes
+    return (job.get('parser', 'sax'), job.get('named_graphs', False), job.get('store', 'Memory'),
+            job.get('native_sparql', False), job.get('catalog', []), job.get('shape_workers', 1),
+            job.get('prune_shapes', True), job.get('cache_models', False), job.get('metrics'))
+
+
+def run_job(job, workers=1):
+    options = validator_options(job)
+    if workers <= 1 or len(job['models']) <= 1:
+        init_validator(job['datatype_mapping'], job['shacl'], *options)
+        for model in job['models']:
+            yield validate_model(model)
+    else:
+        # every worker process loads the datatype mapping and the shapes once in its initializer
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_validator,
+                                 initargs=(job['datatype_mapping'], job['shacl'], *options)) as executor:
+            yield from executor.map(validate_model, job['models'])
+
+
+def format_severities(severities):
+    return "".join(f"{severity}={count} " for severity, count in severities.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="modshape", description="Validate CGMES models without the GUI.")
+    parser.add_argument("job", help="JSON job description with datatype mapping, SHACL files and models")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of models validated in parallel (default: 1, sequential)")
+    parser.add_argument("-p", "--parser", choices=sorted(PARSER_FORMATS),
+                        help="parser backend for the instance data (default: the job's 'parser' or 'sax')")
+    parser.add_argument("-s", "--shape-workers", type=int,
+                        help="processes the shapes of each validation are split over (default: the job's "
+                             "'shape_workers' or 1)")
+    parser.add_argument("--native-sparql", action="store_true",
+                        help="evaluate sh:sparql constraints on Oxigraph's SPARQL engine")
+    parser.add_argument("--cache-models", action="store_true",
+                        help="load instance files parsed before from the parsed model cache")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="append the timing spans and counters of every model to FILE as JSON lines")
+    parser.add_argument("--profile", metavar="SPAN", nargs="+", default=[],
+                        help="write a cProfile of these spans (e.g. parse validate, or all) next to the metrics file")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record the peak Python allocations of every span with tracemalloc (slow)")
+    args = parser.parse_args(argv)
+
+    job = load_job(args.job)
+    if args.parser:
+        job['parser'] = args.parser
+    if args.shape_workers:
+        job['shape_workers'] = args.shape_workers
+    if args.native_sparql:
+        job['native_sparql'] = True
+    if args.cache_models:
+        job['cache_models'] = True
+    if args.metrics or args.profile or args.trace_memory:
+        job['metrics'] = {'output': args.metrics, 'profile': args.profile, 'trace_memory': args.trace_memory}
+    all_conform = True
+    for result in run_job(job, args.workers):
+        all_conform = all_conform and result['conforms']
+        print(f"{result['name']}: conforms={result['conforms']} report={result['report']} "
+              f"{format_severities(result['severities'])}pruned_shapes={len(result['pruned_shapes'])} "
+              f"time={result['time']:.1f} seconds")
+        for difference in result['differences']:
+            all_conform = all_conform and difference['conforms']
+            print(f"{result['name']} + {difference['difference_model']}: conforms={difference['conforms']} "
+                  f"report={difference['report']} {format_severities(difference['severities'])}".rstrip())
+
+    return 0 if all_conform else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
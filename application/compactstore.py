@@ -0,0 +1,253 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+A compact, read-mostly rdflib Store for CIM instance data.
+
+rdflib's ``Memory`` store keeps every triple in several nested dicts and sets of rdflib terms, about a kilobyte per
+triple. CIM instance data is loaded once and then only read by the validation, so this store is laid out for
+exactly that:
+
+- every distinct term is encoded once, as a plain string, into an integer ID dictionary; a literal carries the ID
+  of its datatype instead of the datatype IRI
+- the triples are three columns of 32 bit IDs, kept sorted in the orders SPO, POS and OSP; each lookup is a binary
+  search for the range of rows that share the bound terms
+- rdflib terms are only built for the triples a lookup returns (and the most recent ones are cached)
+
+Loading appends the IDs of the new triples to a buffer; the sorted columns are (re)built on the first lookup after
+a change, which also drops duplicate triples. Removing triples is batched the same way, so the rare updates of
+incremental validation cost one rebuild each. The store is not context aware: graphs of different names opened
+on it share its triples, which is what the validation reads anyway (see ``CimUnionGraph``)::
+
+    graph = CimGraph(store="Compact")
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+from rdflib import BNode, Literal, URIRef
+from rdflib.store import Store
+
+# terms are keyed by their IRI; blank nodes and literals by a prefix no IRI can start with
+BLANK = '\x02'
+LITERAL = '\x01'
+LANGUAGE = '@'
+ID_TYPE = 'I'  # 32 bit unsigned
+SHIFT = 32
+MASK = (1 << SHIFT) - 1
+# decoded terms kept for reuse; lookups in pySHACL return the same classes, predicates and subjects over and over
+TERM_CACHE_SIZE = 1 << 16
+PERMUTATIONS = {'spo': (0, 1, 2), 'pos': (1, 2, 0), 'osp': (2, 0, 1)}
+
+
+class CompactStore(Store):
+    """Dictionary encoded rdflib Store with sorted integer triple columns, see the module documentation."""
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        super().__init__(configuration, identifier)
+        self.identifier = identifier
+        self._ids = {}
+        self._keys = []
+        self._cache = {}
+        # sorted columns of every order; appended triples and removed keys wait for the next rebuild
+        self._columns = {name: (array(ID_TYPE), array(ID_TYPE), array(ID_TYPE)) for name in PERMUTATIONS}
+        self._added = array(ID_TYPE)
+        self._removed = set()
+        self._namespaces = {}
+        self._prefixes = {}
+
+    # terms
+
+    def _key(self, term):
+        if isinstance(term, URIRef):
+            return str(term)
+        if isinstance(term, Literal):
+            if term.language is not None:
+                tag = LANGUAGE + term.language
+            elif term.datatype is not None:
+                tag = str(self._encode(term.datatype))
+            else:
+                tag = ''
+            return f"{LITERAL}{tag}{LITERAL}{term}"
+        if isinstance(term, BNode):
+            return BLANK + term
+        raise ValueError(f"Unsupported term for the compact store: {term!r}")
+
+    def _encode(self, term):
+        key = self._key(term)
+        term_id = self._ids.get(key)
+        if term_id is None:
+            term_id = self._ids[key] = len(self._keys)
+            self._keys.append(key)
+        return term_id
+
+    def _lookup(self, term):
+        # ID of a term in a lookup pattern, None if the store has none of it
+        if isinstance(term, Literal) and term.datatype is not None and term.language is None:
+            datatype = self._ids.get(str(term.datatype))
+            if datatype is None:
+                return None
+            return self._ids.get(f"{LITERAL}{datatype}{LITERAL}{term}")
+        try:
+            return self._ids.get(self._key(term))
+        except ValueError:
+            return None
+
+    def _term(self, term_id):
+        term = self._cache.get(term_id)
+        if term is None:
+            key = self._keys[term_id]
+            if key[0] == LITERAL:
+                tag, lexical = key[1:].split(LITERAL, 1)
+                # the lexical form is kept as it was added, normalized or not
+                if not tag:
+                    term = Literal(lexical, normalize=False)
+                elif tag[0] == LANGUAGE:
+                    term = Literal(lexical, lang=tag[1:], normalize=False)
+                else:
+                    term = Literal(lexical, datatype=self._term(int(tag)), normalize=False)
+            elif key[0] == BLANK:
+                term = BNode(key[1:])
+            else:
+                term = URIRef(key)
+            if len(self._cache) >= TERM_CACHE_SIZE:
+                self._cache.clear()
+            self._cache[term_id] = term
+        return term
+
+    # triples
+
+    def add(self, triple, context, quoted=False):
+        if quoted:
+            raise ValueError("The compact store is not formula-aware")
+        s, p, o = triple
+        self._added.extend((self._encode(s), self._encode(p), self._encode(o)))
+        super().add(triple, context, quoted)
+
+    def addN(self, quads):  # noqa: N802
+        encode = self._encode
+        added = self._added
+        for s, p, o, _ in quads:
+            added.extend((encode(s), encode(p), encode(o)))
+
+    def remove(self, triple, context=None):
+        s, p, o = triple
+        if s is not None and p is not None and o is not None:
+            if self._added:
+                self._rebuild()  # a triple added before it is removed goes, one added again after stays
+            ids = (self._lookup(s), self._lookup(p), self._lookup(o))
+            if None not in ids:
+                self._removed.add(pack(*ids))
+            return
+        for ids in list(self._matches(triple)):
+            self._removed.add(pack(*ids))
+
+    def _rebuild(self):
+        # one sorted, duplicate free list of packed SPO keys, from which every order is built in turn. Removals
+        # only ever apply to the built columns: remove() rebuilds first while triples are waiting
+        removed = self._removed
+        keys = [key for key in map(pack, *self._columns['spo']) if key not in removed]
+        added = self._added
+        keys.extend(map(pack, added[0::3], added[1::3], added[2::3]))
+        self._added = array(ID_TYPE)
+        self._removed = set()
+        keys.sort()
+        keys = [key for index, key in enumerate(keys) if not index or key != keys[index - 1]]
+        columns = unpack(keys)
+        del keys
+        self._columns = {'spo': columns}
+        for name, order in PERMUTATIONS.items():
+            if name != 'spo':
+                keys = sorted(map(pack, *(columns[position] for position in order)))
+                self._columns[name] = unpack(keys)
+                del keys
+
+    def _matches(self, triple):
+        # (s, p, o) IDs of the triples matching a pattern of terms or None
+        if self._added or self._removed:
+            self._rebuild()
+        ids = []
+        for term in triple:
+            if term is None:
+                ids.append(None)
+            else:
+                term_id = self._lookup(term)
+                if term_id is None:
+                    return
+                ids.append(term_id)
+        s, p, o = ids
+        # the order whose leading columns are the bound terms
+        if s is not None:
+            name, bound = ('osp', (o, s)) if p is None and o is not None else ('spo', (s, p, o))
+        elif p is not None:
+            name, bound = 'pos', (p, o)
+        else:
+            name, bound = 'osp', (o,)
+        columns = self._columns[name]
+        low, high = 0, len(columns[0])
+        for column, term_id in zip(columns, bound):
+            if term_id is None:
+                break
+            low = bisect_left(column, term_id, low, high)
+            high = bisect_right(column, term_id, low, high)
+        first, second, third = columns
+        if name == 'spo':
+            for index in range(low, high):
+                yield first[index], second[index], third[index]
+        elif name == 'pos':
+            for index in range(low, high):
+                yield third[index], first[index], second[index]
+        else:
+            for index in range(low, high):
+                yield second[index], third[index], first[index]
+
+    def triples(self, triple_pattern, context=None):
+        term = self._term
+        s, p, o = triple_pattern
+        for s_id, p_id, o_id in self._matches(triple_pattern):
+            # bound terms are handed back as they came
+            yield (s if s is not None else term(s_id), p if p is not None else term(p_id),
+                   o if o is not None else term(o_id)), iter(())
+
+    def __len__(self, context=None):
+        if self._added or self._removed:
+            self._rebuild()
+        return len(self._columns['spo'][0])
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    # namespaces
+
+    def bind(self, prefix, namespace, override=True):
+        bound = self._namespaces.get(prefix)
+        if bound is not None and not override:
+            return
+        if bound is not None:
+            self._prefixes.pop(bound, None)
+        self._namespaces[prefix] = namespace
+        self._prefixes[namespace] = prefix
+
+    def prefix(self, namespace):
+        return self._prefixes.get(namespace)
+
+    def namespace(self, prefix):
+        return self._namespaces.get(prefix)
+
+    def namespaces(self):
+        yield from self._namespaces.items()
+
+
+def pack(first, second, third):
+    # three IDs as one integer that sorts in the order of the three
+    return first << 2 * SHIFT | second << SHIFT | third
+
+
+def unpack(keys):
+    return (array(ID_TYPE, (key >> 2 * SHIFT for key in keys)), array(ID_TYPE, (key >> SHIFT & MASK for key in keys)),
+            array(ID_TYPE, (key & MASK for key in keys)))
@@ -0,0 +1,110 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Compiled CGMES datatype mapping.
+
+CGMES instance files carry untyped literals; the datatype of each attribute comes from the RDFS profiles.
+CimPal exports this property -> XSD datatype mapping as JSON, RDF or Excel. ``DatatypeMap`` compiles any of
+these into a dict from predicate ``URIRef`` to datatype ``URIRef`` so the parsers can type a literal with a
+single hash lookup. The compiled pairs are cached on disk, keyed by the content hash of the source files.
+"""
+
+import json
+import os
+import pickle
+
+from rdflib import Graph, RDFS, URIRef
+
+from application.cache import atomic_write, cache_dir, files_digest
+
+# bump when the cached format changes
+CACHE_VERSION = 1
+
+JSON_PROPERTY_KEY = 'Property-AttributeAssociation'
+JSON_DATATYPE_KEY = 'XSDdatatype'
+XLSX_SHEET = 'RDFS Datatypes'
+
+
+def read_json_mapping(path):
+    with open(path, 'r') as json_file:
+        mapping = json.load(json_file)
+    return list(zip(mapping[JSON_PROPERTY_KEY], mapping[JSON_DATATYPE_KEY]))
+
+
+def read_rdf_mapping(path):
+    graph = Graph()
+    graph.parse(path, format='xml')
+    return [(str(s), str(o)) for s, o in graph.subject_objects(RDFS.range)]
+
+
+def read_xlsx_mapping(path):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        ws = wb[XLSX_SHEET] if XLSX_SHEET in wb.sheetnames else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header = [str(cell) for cell in next(rows)]
+        property_idx, datatype_idx = header.index('Property'), header.index('Datatype')
+        return [(row[property_idx], row[datatype_idx]) for row in rows
+                if row[property_idx] and row[datatype_idx]]
+    finally:
+        wb.close()
+
+
+MAPPING_READERS = {
+    '.json': read_json_mapping,
+    '.rdf': read_rdf_mapping,
+    '.xml': read_rdf_mapping,
+    '.xlsx': read_xlsx_mapping,
+}
+
+
+class DatatypeMap(dict):
+    """
+    Mapping from predicate URIRef to datatype URIRef.
+
+    Datatype URIRefs are shared between all predicates, so the whole map holds only a handful of distinct
+    datatype objects. ``digest`` identifies the source files and can be used as a cache key by consumers.
+    """
+
+    def __init__(self, pairs=(), digest=None):
+        super().__init__()
+        self.digest = digest
+        datatypes = {}
+        for prop, datatype in pairs:
+            self[URIRef(prop)] = datatypes.setdefault(datatype, URIRef(datatype))
+
+    def pairs(self):
+        return [(str(prop), str(datatype)) for prop, datatype in self.items()]
+
+    @staticmethod
+    def read_pairs(path):
+        _, ext = os.path.splitext(path)
+        reader = MAPPING_READERS.get(ext.lower())
+        if reader is None:
+            raise ValueError(f"Unsupported datatype mapping format: {path}")
+        return reader(path)
+
+    @classmethod
+    def load(cls, files, use_cache=True):
+        """Compile the mapping of one or more files; later files override earlier ones."""
+        digest = files_digest(files, CACHE_VERSION)
+        cache_file = os.path.join(cache_dir('datatypes'), f"{digest}.pickle") if use_cache else None
+
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as file:
+                    return cls(pickle.load(file), digest)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass  # corrupt entry, rebuild it below
+
+        pairs = []
+        for path in files:
+            pairs.extend(cls.read_pairs(path))
+        datatype_map = cls(pairs, digest)
+
+        if cache_file:
+            atomic_write(cache_file, pickle.dumps(datatype_map.pairs(), protocol=pickle.HIGHEST_PROTOCOL))
+        return datatype_map
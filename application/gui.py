@@ -14,10 +14,23 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 class Ui_Dialog(object):
     def setupUi(self, Dialog):
         Dialog.setObjectName("Dialog")
-        Dialog.resize(972, 245)
+        Dialog.resize(972, 300)
         self.buttonOK = QtWidgets.QPushButton(Dialog)
-        self.buttonOK.setGeometry(QtCore.QRect(390, 180, 141, 41))
+        self.buttonOK.setGeometry(QtCore.QRect(320, 240, 141, 41))
         self.buttonOK.setObjectName("buttonOK")
+        self.buttonCancel = QtWidgets.QPushButton(Dialog)
+        self.buttonCancel.setEnabled(False)
+        self.buttonCancel.setGeometry(QtCore.QRect(480, 240, 141, 41))
+        self.buttonCancel.setObjectName("buttonCancel")
+        self.progressBar = QtWidgets.QProgressBar(Dialog)
+        self.progressBar.setGeometry(QtCore.QRect(20, 170, 751, 23))
+        self.progressBar.setMaximum(1000)
+        self.progressBar.setProperty("value", 0)
+        self.progressBar.setObjectName("progressBar")
+        self.labelProgress = QtWidgets.QLabel(Dialog)
+        self.labelProgress.setGeometry(QtCore.QRect(20, 200, 751, 21))
+        self.labelProgress.setText("")
+        self.labelProgress.setObjectName("labelProgress")
         self.splitter = QtWidgets.QSplitter(Dialog)
         self.splitter.setGeometry(QtCore.QRect(780, 40, 181, 121))
         self.splitter.setOrientation(QtCore.Qt.Vertical)
@@ -54,6 +67,7 @@ class Ui_Dialog(object):
         _translate = QtCore.QCoreApplication.translate
         Dialog.setWindowTitle(_translate("Dialog", "Dialog"))
         self.buttonOK.setText(_translate("Dialog", "Validate"))
+        self.buttonCancel.setText(_translate("Dialog", "Cancel"))
         self.RDFDatatypes.setText(_translate("Dialog", "Select Datatype mapping"))
         self.InstanceData.setText(_translate("Dialog", "Select data to validate"))
         self.SHACLConstraints.setText(_translate("Dialog", "Select SHACL Constraints"))
@@ -0,0 +1,274 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+owl:imports resolution for SHACL shape bundles.
+
+``ImportResolver.load`` reads shape files and everything they import, transitively, into one graph. Every
+source is loaded once: an import of a location that was already loaded is skipped, which also ends import
+cycles, and so is an import of a location the caller excludes. The imports of one level are read and parsed
+concurrently in a thread pool.
+
+Import IRIs are resolved through OASIS XML catalogs, as written by Protégé, so shape bundles that import by
+web address or by absolute path on another machine can be used offline::
+
+    <catalog xmlns="urn:oasis:names:tc:entity:xmlns:xml:catalog">
+        <uri name="http://example.com/shapes/Profile.ttl" uri="RDFS/Profile.ttl"/>
+        <rewriteURI uriStartString="C://ServerDrive//Shapes//" rewritePrefix="./"/>
+    </catalog>
+
+Catalogs can be given explicitly, and a ``catalog-v001.xml`` next to a loaded file is used automatically.
+IRIs without catalog entry are read from the web (http and https) or as paths relative to the importing file
+or the working directory. Relative IRIs in a file resolve against its location. Parsed sources are cached by
+content hash, in memory and below ``cache_dir('imports')``.
+"""
+
+import hashlib
+import os
+import pathlib
+import pickle
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import pyoxigraph
+from rdflib import OWL, BNode, Literal, URIRef
+
+from application.cache import atomic_write, cache_dir, evict
+from application.shapecache import decode_triples, encode_triples, max_cache_bytes
+
+# bump when the cached format changes
+CACHE_VERSION = 2
+CATALOG_FILE = 'catalog-v001.xml'
+CATALOG_NS = '{urn:oasis:names:tc:entity:xmlns:xml:catalog}'
+# vocabularies pySHACL knows itself; importing them is a declaration, not a file to read
+BUILT_IN_IMPORTS = {'http://www.w3.org/ns/shacl#', 'http://www.w3.org/ns/shacl'}
+OWL_IMPORTS = str(OWL.imports)
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+REQUEST_TIMEOUT = 60
+
+
+def read_catalog(path):
+    """Exact IRI mappings and (prefix, replacement) rewrites of an XML catalog, resolved against its directory."""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    uris = {}
+    rewrites = []
+    for element in ElementTree.parse(path).getroot().iter():
+        tag = element.tag.replace(CATALOG_NS, '')
+        if tag == 'uri' and element.get('name') and element.get('uri'):
+            uris[element.get('name')] = catalog_target(base_dir, element.get('uri'))
+        elif tag == 'rewriteURI' and element.get('uriStartString') and element.get('rewritePrefix'):
+            rewrites.append((element.get('uriStartString'), catalog_target(base_dir, element.get('rewritePrefix'))))
+    return uris, rewrites
+
+
+def catalog_target(base_dir, target):
+    if urlparse(target).scheme in ('http', 'https'):
+        return target
+    if target.startswith('file:'):
+        target = url2pathname(urlparse(target).path)
+    joined = os.path.join(base_dir, target)
+    # keep a trailing separator, rewrite prefixes are concatenated with the rest of the IRI
+    return os.path.normpath(joined) + (os.sep if target.endswith(('/', os.sep)) else '')
+
+
+class ParsedSource:
+    """The triples of one shape file, in the form ``ModelValidator`` always loaded them, and the IRIs it imports."""
+
+    def __init__(self, triples, imports):
+        self.triples = triples
+        self.imports = imports
+
+    @classmethod
+    def parse(cls, content, base_iri):
+        nodes = {}
+
+        def node(term):
+            # blank nodes stay blank nodes, or pySHACL reads the lists of sequence paths as predicates. Plain strings
+            # keep their xsd:string datatype, which the parsers give string attributes of the model too (sh:in)
+            result = nodes.get(term)
+            if result is None:
+                if isinstance(term, pyoxigraph.Literal):
+                    if term.language:
+                        result = Literal(term.value, lang=term.language)
+                    else:
+                        result = Literal(term.value, datatype=URIRef(term.datatype.value))
+                elif isinstance(term, pyoxigraph.BlankNode):
+                    result = BNode(term.value)
+                else:
+                    result = URIRef(term.value)
+                nodes[term] = result
+            return result
+
+        triples = []
+        imports = []
+        for s, p, o in pyoxigraph.parse(input=content, mime_type="text/turtle", base_iri=base_iri):
+            if p.value == OWL_IMPORTS and o.value not in BUILT_IN_IMPORTS:
+                imports.append(o.value)
+            else:
+                triples.append((node(s), node(p), node(o)))
+        return cls(triples, imports)
+
+    def dumps(self):
+        return pickle.dumps((encode_triples(self.triples), self.imports), protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def loads(cls, data):
+        encoded, imports = pickle.loads(data)
+        triples, _ = decode_triples(encoded)
+        return cls(triples, imports)
+
+
+class ImportResolver:
+    """
+    Loads shape files together with their owl:imports.
+
+    The resolver keeps the parsed sources of earlier loads, so one instance can serve every ``load_shacl`` of a
+    validator; catalogs are parsed again when their modification time or size changes. ``sources`` lists the
+    local files of the last load, catalogs included, for cache invalidation.
+    """
+
+    def __init__(self, catalogs=(), workers=DEFAULT_WORKERS, use_cache=True):
+        self.catalogs = {}
+        self.catalog_stamps = {}
+        self.workers = max(1, workers)
+        self.use_cache = use_cache
+        self.parsed = {}
+        self.sources = []
+        for catalog in catalogs:
+            self.add_catalog(catalog)
+
+    def add_catalog(self, path):
+        # read again when the file changed since it was parsed
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if self.catalog_stamps.get(path) != stamp:
+            self.catalogs[path] = read_catalog(path)
+            self.catalog_stamps[path] = stamp
+
+    def refresh_catalogs(self):
+        """Read the known catalogs again if they changed, and forget those that were removed."""
+        for path in list(self.catalogs):
+            try:
+                self.add_catalog(path)
+            except FileNotFoundError:
+                del self.catalogs[path]
+                del self.catalog_stamps[path]
+
+    def consulted_catalogs(self, files):
+        """The catalogs a load of files starts with: those added so far and the ones next to the files."""
+        self.refresh_catalogs()
+        catalogs = set(self.catalogs)
+        for path in files:
+            catalog = os.path.join(os.path.dirname(os.path.abspath(path)), CATALOG_FILE)
+            if os.path.isfile(catalog):
+                catalogs.add(catalog)
+        return sorted(catalogs)
+
+    def resolve(self, iri, importer=None):
+        """Local path or web address to read an imported IRI from."""
+        location = self.catalog_location(iri)
+        if location is not None:
+            if urlparse(location).scheme not in ('http', 'https') and not os.path.isfile(location):
+                raise FileNotFoundError(f"owl:imports <{iri}> is mapped to {location}, which does not exist")
+            return location
+
+        scheme = urlparse(iri).scheme
+        if scheme in ('http', 'https'):
+            return iri
+        path = url2pathname(urlparse(iri).path) if scheme == 'file' else iri
+        candidates = [path]
+        if importer is not None and not os.path.isabs(path):
+            candidates.insert(0, os.path.join(os.path.dirname(importer), path))
+        for candidate in candidates:
+            if os.path.isfile(candidate):
+                return os.path.abspath(candidate)
+        raise FileNotFoundError(f"Cannot resolve owl:imports <{iri}>"
+                                f"{f' of {importer}' if importer else ''}; map it in an import catalog")
+
+    def catalog_location(self, iri):
+        for uris, _ in self.catalogs.values():
+            if iri in uris:
+                return uris[iri]
+        rewrites = [rewrite for _, catalog_rewrites in self.catalogs.values() for rewrite in catalog_rewrites]
+        for prefix, replacement in sorted(rewrites, key=lambda rewrite: -len(rewrite[0])):
+            if iri.startswith(prefix):
+                rest = iri[len(prefix):].lstrip('/')
+                if urlparse(replacement).scheme in ('http', 'https'):
+                    return replacement + rest
+                return os.path.normpath(os.path.join(replacement, *[part for part in rest.split('/') if part]))
+        return None
+
+    def read(self, location):
+        if urlparse(location).scheme in ('http', 'https'):
+            import requests
+
+            response = requests.get(location, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            return response.content
+        with open(location, 'rb') as file:
+            return file.read()
+
+    def parse(self, content, base_iri):
+        digest = hashlib.sha256(base_iri.encode() + b'\n' + content).hexdigest()
+        parsed = self.parsed.get(digest)
+        if parsed is not None:
+            return parsed
+
+        cache_file = os.path.join(cache_dir('imports'), f"{digest}-{CACHE_VERSION}.pickle") if self.use_cache else None
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as file:
+                    parsed = ParsedSource.loads(file.read())
+            except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+                parsed = None  # corrupt entry, parse again
+        if parsed is None:
+            parsed = ParsedSource.parse(content, base_iri)
+            if cache_file:
+                atomic_write(cache_file, parsed.dumps())
+                evict(os.path.dirname(cache_file), max_cache_bytes(), keep=(cache_file,))
+        self.parsed[digest] = parsed
+        return parsed
+
+    def load_source(self, location):
+        base_iri = location if urlparse(location).scheme in ('http', 'https') else pathlib.Path(location).as_uri()
+        return self.parse(self.read(location), base_iri)
+
+    def walk(self, files, skip=()):
+        """(location, ParsedSource) of files and of all their imports, level by level; ``skip`` is not followed."""
+        self.refresh_catalogs()
+        visited = set(os.path.abspath(path) for path in skip)
+        level = [(os.path.abspath(path), None) for path in files]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while level:
+                pending = []
+                for location, importer in level:
+                    if location not in visited:
+                        visited.add(location)
+                        pending.append(location)
+                        if urlparse(location).scheme not in ('http', 'https'):
+                            catalog = os.path.join(os.path.dirname(location), CATALOG_FILE)
+                            if os.path.isfile(catalog):
+                                self.add_catalog(catalog)
+
+                level = []
+                # results come back in order, so the graph is filled the same way on every run
+                for location, parsed in zip(pending, executor.map(self.load_source, pending)):
+                    yield location, parsed
+                    level.extend((self.resolve(iri, location), location) for iri in parsed.imports)
+
+    def closure(self, files):
+        """The locations of files and of everything they import."""
+        return [location for location, _ in self.walk(files)]
+
+    def load(self, files, graph, skip=()):
+        """Add the triples of files and of all their imports but ``skip`` to graph; returns the local files read."""
+        sources = []
+        for location, parsed in self.walk(files, skip):
+            if urlparse(location).scheme not in ('http', 'https'):
+                sources.append(location)
+            graph.addN((s, p, o, graph) for s, p, o in parsed.triples)
+        self.sources = list(self.catalogs) + sources
+        return self.sources
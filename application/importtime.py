@@ -0,0 +1,122 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Import-time budget of the entry points.
+
+Every entry point is imported in a fresh interpreter with ``python -X importtime``. Its cost is the cumulative
+time of the modules imported after interpreter startup, the best of several runs. The check fails when an
+entry point exceeds its budget, or when it loads a module it must not load at import time:
+
+- the GUI loads rdflib, pySHACL and polars with the first validation, not before its window shows
+- the CLI, the library and the parsing core never load Qt
+- the library loads polars and requests only when a report is written or an import is fetched
+
+Run it before a release of the frozen build, where the cold start is paid on every launch::
+
+    python -m application.importtime --runs 5
+
+The budgets are in milliseconds on a developer machine. ``--scale`` multiplies them on slower hardware.
+Entry points with an optional dependency that is not installed (PyQt5 on a headless machine) are skipped; any
+other import error fails the check.
+"""
+
+import argparse
+import subprocess
+import sys
+
+# name: (module, budget in milliseconds, modules that must not be loaded)
+ENTRY_POINTS = {
+    'gui': ('application.ModShape', 300, ('rdflib', 'pyshacl', 'polars', 'openpyxl', 'requests')),
+    'cli': ('application.cli', 400, ('PyQt5', 'polars', 'openpyxl', 'requests')),
+    'library': ('application.validator', 400, ('PyQt5', 'polars', 'openpyxl', 'requests')),
+    'parser': ('application.CimGraph', 250, ('PyQt5', 'polars', 'openpyxl', 'requests', 'pyshacl')),
+}
+DEFAULT_RUNS = 3
+# dependencies an entry point may lack on this machine; it is skipped then, any other import error fails the check
+OPTIONAL_DEPENDENCIES = ('PyQt5',)
+
+
+def parse_importtime(output):
+    """(name, depth, cumulative microseconds) of every import in ``-X importtime`` output."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(cumulative)))
+    return imports
+
+
+def run_importtime(statement):
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], capture_output=True, text=True)
+    return process.returncode, process.stderr
+
+
+def measure(module, startup_modules, runs=DEFAULT_RUNS):
+    """Best import time of a module in milliseconds and the modules it loads, or None if it cannot be imported."""
+    best = None
+    loaded = set()
+    for _ in range(runs):
+        returncode, output = run_importtime(f'import {module}')
+        if returncode != 0:
+            return None, output.strip().splitlines()[-1]
+        imports = parse_importtime(output)
+        loaded = {name for name, _, _ in imports} - startup_modules
+        # top level imports after startup; everything else is counted in their cumulative time
+        total = sum(cumulative for name, depth, cumulative in imports if depth == 0 and name not in startup_modules)
+        best = total if best is None else min(best, total)
+    return best / 1000, loaded
+
+
+def missing_optional_dependency(error):
+    # the last line of the traceback of a failed import
+    return any(error.startswith(f"ModuleNotFoundError: No module named '{module}")
+               for module in OPTIONAL_DEPENDENCIES)
+
+
+def forbidden_modules(loaded, forbidden):
+    return sorted({name.split('.')[0] for name in loaded
+                   if any(name == module or name.startswith(module + '.') for module in forbidden)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="importtime", description="Check the import-time budget of ModShape.")
+    parser.add_argument("entry_points", nargs="*", metavar="entry_point",
+                        help=f"entry points to check: {', '.join(ENTRY_POINTS)} (default: all)")
+    parser.add_argument("-r", "--runs", type=int, default=DEFAULT_RUNS,
+                        help=f"imports per entry point, the fastest counts (default: {DEFAULT_RUNS})")
+    parser.add_argument("--scale", type=float, default=1.0, help="factor applied to every budget (default: 1)")
+    args = parser.parse_args(argv)
+    for name in args.entry_points:
+        if name not in ENTRY_POINTS:
+            parser.error(f"unknown entry point '{name}', expected one of {', '.join(ENTRY_POINTS)}")
+
+    _, output = run_importtime('pass')
+    startup_modules = {name for name, _, _ in parse_importtime(output)}
+    within_budget = True
+    for name in args.entry_points or ENTRY_POINTS:
+        module, budget, forbidden = ENTRY_POINTS[name]
+        budget *= args.scale
+        milliseconds, loaded = measure(module, startup_modules, args.runs)
+        if milliseconds is None:
+            if missing_optional_dependency(loaded):
+                print(f"{name}: {module} skipped, {loaded}")
+            else:
+                within_budget = False
+                print(f"{name}: {module} FAILED to import, {loaded}")
+            continue
+        unexpected = forbidden_modules(loaded, forbidden)
+        ok = milliseconds <= budget and not unexpected
+        within_budget = within_budget and ok
+        print(f"{name}: {module} {milliseconds:.0f} ms (budget {budget:.0f} ms)"
+              f"{', loads ' + ', '.join(unexpected) if unexpected else ''}{'' if ok else ' FAILED'}")
+
+    return 0 if within_budget else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,471 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Incremental validation of CGMES difference models.
+
+SSH and SV updates are exchanged as difference models (IEC 61970-552): a ``dm:DifferenceModel`` whose
+``dm:reverseDifferences`` are removed from, and whose ``dm:forwardDifferences`` are added to, a base model that
+was exchanged before. ``IncrementalValidator`` validates the base model once and keeps the results per shape and
+focus node. A difference model is then applied to the model in place, and only the focus nodes it can have
+changed are validated again; their old results are replaced by the new ones.
+
+The subjects and objects of the changed statements are the seeds. A focus node is affected when a seed can be
+reached from it along the property paths the shape reads, which ``shape_dependencies`` lists as (predicate,
+inverse) steps together with how many steps deep they go (sh:path, nested shapes, sh:equals & co. and the triple
+patterns of sh:sparql queries). The steps are walked back from the seeds. rdf:type is only read at the end of a
+path, so it is never walked back from a class to all of its instances. Shapes that read the model in ways that
+cannot be bounded like this (variable predicates, query patterns not connected to ``$this``, ...) are validated
+again for all of their focus nodes.
+"""
+
+import io
+import os
+import xml.etree.ElementTree as ElementTree
+import zipfile
+from collections import defaultdict
+
+import pyoxigraph
+from pyshacl import Validator
+from pyshacl.monkey import apply_patches
+from rdflib import Literal, RDF, RDFS, SH, URIRef, Variable
+from rdflib.paths import AlternativePath, InvPath, MulPath, SequencePath
+from rdflib.plugins.sparql.algebra import translateQuery, triples as pattern_triples
+from rdflib.plugins.sparql.parser import parseQuery
+from rdflib.plugins.sparql.parserutils import CompValue
+
+from application.CimGraph import CimGraph
+from application.cimparser import create_input_source
+from application.oxigraphstore import OxigraphStore, to_oxigraph
+from application.pruning import shape_targets
+from application.sparqlconstraints import PATH_VARIABLE, constraint_prefixes, oxigraph_dataset, path_text, \
+    result_focus
+from application.validator import PARSER_FORMATS, count_results
+
+DM_NS = 'http://iec.ch/TC57/61970-552/DifferenceModel/1#'
+RDF_NS = str(RDF)
+# statement blocks of a difference model, and the DifferenceModel attribute they are read into
+STATEMENT_BLOCKS = {
+    f'{{{DM_NS}}}reverseDifferences': 'reverse',
+    f'{{{DM_NS}}}forwardDifferences': 'forward',
+    f'{{{DM_NS}}}preconditions': 'preconditions',
+}
+NESTED_SHAPE_PREDICATES = (SH.node, SH.property, SH['not'], SH.qualifiedValueShape)
+SHAPE_LIST_PREDICATES = (SH['and'], SH['or'], SH.xone)
+# constraints that compare the value nodes with the values of another predicate of the focus node
+PAIR_PREDICATES = (SH.equals, SH.disjoint, SH.lessThan, SH.lessThanOrEquals)
+MAX_PATH_NESTING = 10
+
+
+class DifferenceModel:
+    """The statements a difference model removes from and adds to its base model, and those it requires there."""
+
+    def __init__(self, reverse=(), forward=(), preconditions=()):
+        self.reverse = list(reverse)
+        self.forward = list(forward)
+        self.preconditions = list(preconditions)
+
+    @classmethod
+    def read(cls, stream, parse):
+        """Read a difference model document; ``parse(document)`` returns the triples of an RDF/XML document."""
+        model = cls()
+        for _, element in ElementTree.iterparse(stream):
+            block = STATEMENT_BLOCKS.get(element.tag)
+            if block is not None:
+                getattr(model, block).extend(parse(statements_document(element)))
+                element.clear()
+        return model
+
+    def extend(self, other):
+        self.reverse.extend(other.reverse)
+        self.forward.extend(other.forward)
+        self.preconditions.extend(other.preconditions)
+
+    def seeds(self):
+        """The nodes whose statements change: subjects and objects of the reverse and forward differences."""
+        nodes = set()
+        for s, p, o in self.reverse + self.forward:
+            nodes.add(s)
+            if not isinstance(o, Literal):
+                nodes.add(o)
+        return nodes
+
+
+def statements_document(element):
+    # the content of a rdf:parseType="Statements" block, as an RDF/XML document of its own
+    root = ElementTree.Element(f'{{{RDF_NS}}}RDF')
+    root.extend(list(element))
+    return ElementTree.tostring(root)
+
+
+def add_lengths(*lengths):
+    return None if any(length is None for length in lengths) else sum(lengths)
+
+
+def longest(lengths, default=0):
+    lengths = list(lengths)
+    return None if any(length is None for length in lengths) else max(lengths, default=default)
+
+
+def path_steps(shapes_graph, path, inverse=False, depth=0):
+    """The (predicate, inverse) steps of a SHACL property path and its length, None if unbounded."""
+    if isinstance(path, URIRef):
+        return {(path, inverse)}, 1
+    if depth > MAX_PATH_NESTING or isinstance(path, Literal):
+        raise ValueError(f"Unsupported property path {path!r}")
+    sequence = list(shapes_graph.items(path))
+    if sequence:
+        parts = [path_steps(shapes_graph, step, inverse, depth + 1) for step in sequence]
+        return set().union(*(steps for steps, _ in parts)), add_lengths(*(length for _, length in parts))
+    inner = shapes_graph.value(path, SH.inversePath)
+    if inner is not None:
+        return path_steps(shapes_graph, inner, not inverse, depth + 1)
+    for predicate in (SH.zeroOrMorePath, SH.oneOrMorePath):
+        inner = shapes_graph.value(path, predicate)
+        if inner is not None:
+            return path_steps(shapes_graph, inner, inverse, depth + 1)[0], None
+    inner = shapes_graph.value(path, SH.zeroOrOnePath)
+    if inner is not None:
+        return path_steps(shapes_graph, inner, inverse, depth + 1)
+    alternatives = shapes_graph.value(path, SH.alternativePath)
+    if alternatives is not None:
+        parts = [path_steps(shapes_graph, step, inverse, depth + 1) for step in shapes_graph.items(alternatives)]
+        return set().union(*(steps for steps, _ in parts)), longest(length for _, length in parts)
+    raise ValueError(f"Unsupported property path {path!r}")
+
+
+def sparql_path_steps(path, inverse=False):
+    """``path_steps`` of a predicate or property path of a SPARQL triple pattern."""
+    if isinstance(path, URIRef):
+        return {(path, inverse)}, 1
+    if isinstance(path, InvPath):
+        return sparql_path_steps(path.arg, not inverse)
+    if isinstance(path, (SequencePath, AlternativePath)):
+        parts = [sparql_path_steps(step, inverse) for step in path.args]
+        lengths = [length for _, length in parts]
+        length = add_lengths(*lengths) if isinstance(path, SequencePath) else longest(lengths)
+        return set().union(*(steps for steps, _ in parts)), length
+    if isinstance(path, MulPath):
+        steps, length = sparql_path_steps(path.path, inverse)
+        return steps, (length if path.mod == '?' else None)
+    # variable predicates and negated property sets can read any predicate
+    raise ValueError(f"Unsupported predicate {path!r}")
+
+
+def query_patterns(node, patterns):
+    # the triple patterns of a translated query, those of subqueries and (NOT) EXISTS filters included
+    if isinstance(node, CompValue):
+        if node.name == 'BGP':
+            patterns.extend(node.triples)
+        elif node.name == 'TriplesBlock':
+            patterns.extend(pattern_triples(node.triples))
+        for key, value in node.items():
+            if key != '_vars':
+                query_patterns(value, patterns)
+    elif isinstance(node, (list, tuple)):
+        for value in node:
+            query_patterns(value, patterns)
+    return patterns
+
+
+def sparql_dependencies(shapes_graph, shape, constraint):
+    """Steps and depth an sh:sparql constraint reads from ``$this``; raises ValueError if they are unbounded."""
+    select = shapes_graph.value(constraint, SH.select)
+    if select is None:
+        raise ValueError(f"No sh:select in {constraint}")
+    select = str(select)
+    path = shapes_graph.value(shape, SH.path)
+    if path is not None:
+        select = PATH_VARIABLE.sub(lambda m: m.group(1) + path_text(shapes_graph, path), select)
+    prefixes = "".join(f"PREFIX {prefix}: <{namespace}>\n"
+                       for prefix, namespace in constraint_prefixes(shapes_graph, constraint).items())
+    try:
+        algebra = translateQuery(parseQuery(prefixes + select)).algebra
+    except Exception as e:  # rdflib reports syntax errors and unknown prefixes with various exception types
+        raise ValueError(f"Cannot analyse the query of {constraint}: {e}")
+
+    steps = set()
+    length = 0
+    neighbours = defaultdict(set)
+    patterns = query_patterns(algebra, [])
+    for index, (s, p, o) in enumerate(patterns):
+        pattern_steps, pattern_length = sparql_path_steps(p)
+        steps |= pattern_steps
+        length = add_lengths(length, pattern_length)
+        # literals do not join patterns, each one is a node of its own
+        s, o = [(index, term) if isinstance(term, Literal) else term for term in (s, o)]
+        neighbours[s].add(o)
+        neighbours[o].add(s)
+
+    # every pattern has to be joined to $this, no path is longer than all patterns in a row
+    reached = {Variable('this')}
+    frontier = [Variable('this')]
+    while frontier:
+        node = frontier.pop()
+        for neighbour in neighbours[node] - reached:
+            reached.add(neighbour)
+            frontier.append(neighbour)
+    if any(s not in reached for s, _, _ in patterns if not isinstance(s, Literal)):
+        raise ValueError(f"The query of {constraint} reads nodes that are not connected to $this")
+    return steps, length
+
+
+def shape_dependencies(shapes_graph, shape, visiting=frozenset()):
+    """
+    The (predicate, inverse) steps a shape reads the data graph through from its focus nodes, and how many steps
+    deep (None if unbounded). Raises ValueError if the shape can read anything in the data graph.
+    """
+    if shape in visiting:
+        return set(), None  # recursive shapes follow their paths as far as they lead
+    visiting = visiting | {shape}
+    steps = set()
+    path_length = 0
+    path = shapes_graph.value(shape, SH.path)
+    if path is not None:
+        steps, path_length = path_steps(shapes_graph, path)
+
+    nested_depth = 0
+    depth = path_length
+    for predicate, value in shapes_graph.predicate_objects(shape):
+        nested = []
+        if predicate in NESTED_SHAPE_PREDICATES:
+            nested = [value]
+        elif predicate in SHAPE_LIST_PREDICATES:
+            nested = list(shapes_graph.items(value))
+        elif predicate in PAIR_PREDICATES:
+            steps.add((value, False))
+            depth = longest([depth, 1])
+        elif predicate == SH.sparql:
+            sparql_steps, sparql_depth = sparql_dependencies(shapes_graph, shape, value)
+            steps |= sparql_steps
+            depth = longest([depth, sparql_depth])
+        for nested_shape in nested:
+            # nested shapes validate the value nodes, at the end of the path
+            nested_steps, nested_shape_depth = shape_dependencies(shapes_graph, nested_shape, visiting)
+            steps |= nested_steps
+            nested_depth = longest([nested_depth, nested_shape_depth])
+    return steps, longest([depth, add_lengths(path_length, nested_depth)])
+
+
+def affected_nodes(graph, seeds, steps, depth):
+    """The nodes from which a seed can be reached in ``depth`` steps (None: any number) along the given steps."""
+    # rdf:type is read at the end of a path: instances are seeds themselves, classes carry no data to walk on
+    steps = [(predicate, inverse) for predicate, inverse in steps if inverse or predicate != RDF.type]
+    reached = set(seeds)
+    frontier = reached
+    distance = 0
+    while frontier and (depth is None or distance < depth):
+        found = set()
+        for node in frontier:
+            for predicate, inverse in steps:
+                candidates = graph.objects(node, predicate) if inverse else graph.subjects(predicate, node)
+                found.update(candidate for candidate in candidates
+                             if not isinstance(candidate, Literal) and candidate not in reached)
+        reached |= found
+        frontier = found
+        distance += 1
+    return reached
+
+
+def group_by_focus(results):
+    grouped = defaultdict(list)
+    for result in results:
+        grouped[result_focus(result)].append(result)
+    return grouped
+
+
+class IncrementalValidator:
+    """
+    Validates a model once, then every difference model applied to it, re-validating only what a difference
+    can have changed.
+
+    >>> incremental = IncrementalValidator(validator)  # a ModelValidator with shapes and the base model loaded
+    >>> conforms, report_graph, report_text = incremental.validate()
+    >>> conforms, report_graph, report_text = incremental.apply_files(["SSH_diff.xml"])
+
+    Shapes run in this process and are not pruned: a difference can add instances of any class.
+    """
+
+    def __init__(self, validator):
+        self.validator = validator
+        # shape node, or ('sparql', index) of a native SPARQL constraint, to {focus node: results}
+        self.results = {}
+        self.dependencies = {}
+        self.dataset = None
+        self.differences = 0
+        apply_patches()
+
+    @property
+    def graph(self):
+        return self.validator.merged_instance_graph
+
+    def validate(self):
+        """Validate the whole model and keep its results."""
+        metrics = self.validator.metrics
+        with metrics.span('validate', incremental=True) as span:
+            self.results = {}
+            shapes_graph = self.validator.compiled_shapes.shapes_graph
+            with metrics.span('shacl', shapes=len(shapes_graph.shapes)):
+                for shape in shapes_graph.shapes:
+                    _, results = shape.validate(self.graph)
+                    self.results[shape.node] = group_by_focus(results)
+                    if any(shape_targets(shape)):
+                        # analysed here, so that applying a difference model only has to walk the model
+                        self.dependency(shapes_graph.graph, shape.node)
+            sparql_constraints = self.validator.sparql_constraints
+            if sparql_constraints is not None:
+                with metrics.span('sparql', constraints=len(sparql_constraints.constraints)):
+                    self.dataset = oxigraph_dataset(self.graph)
+                    for index, constraint in enumerate(sparql_constraints.constraints):
+                        results = sparql_constraints.evaluate_constraint(constraint, self.graph, self.dataset)
+                        self.results[('sparql', index)] = group_by_focus(results)
+                        self.dependency(sparql_constraints.core_shapes_graph, ('sparql', index), constraint)
+            self.validator.pruned_shapes = []
+            report = self.report()
+            span['results'] = count_results(report[1])
+        metrics.count('shapes', len(shapes_graph.shapes))
+        metrics.count('results', span['results'])
+        return report
+
+    def apply_files(self, file_paths):
+        """Apply the difference models in the files (or archives of them) to the model, see ``apply``."""
+        with self.validator.metrics.span('parse', files=len(file_paths), difference=True):
+            difference = self.read_difference_models(file_paths)
+        return self.apply(difference)
+
+    def apply(self, difference):
+        """Apply a ``DifferenceModel`` to the model and validate what it changed."""
+        metrics = self.validator.metrics
+        self.differences += 1
+        with metrics.span('apply', difference=self.differences):
+            self.apply_difference(difference, f"urn:modshape:difference:{self.differences}")
+        with metrics.span('validate', incremental=True, difference=self.differences) as span:
+            seeds = difference.seeds()
+            affected = {}
+            shapes_graph = self.validator.compiled_shapes.shapes_graph
+            for shape in shapes_graph.shapes:
+                targets = shape_targets(shape)
+                if not any(targets):
+                    continue  # only validated through the shapes that reference it
+                nodes = self.affected(shapes_graph.graph, shape.node, seeds, affected)
+                results = self.results.setdefault(shape.node, {})
+                if nodes is None:
+                    _, new_results = shape.validate(self.graph)
+                    results.clear()
+                else:
+                    for node in nodes:
+                        results.pop(node, None)
+                    focus = self.focus_nodes(shape, targets, nodes)
+                    new_results = shape.validate(self.graph, focus=list(focus))[1] if focus else []
+                for node, focus_results in group_by_focus(new_results).items():
+                    results[node] = focus_results
+
+            sparql_constraints = self.validator.sparql_constraints
+            if sparql_constraints is not None:
+                for index, constraint in enumerate(sparql_constraints.constraints):
+                    nodes = self.affected(sparql_constraints.core_shapes_graph, ('sparql', index), seeds, affected,
+                                          constraint)
+                    results = self.results.setdefault(('sparql', index), {})
+                    if nodes is None:
+                        results.clear()
+                    else:
+                        for node in nodes:
+                            results.pop(node, None)
+                    # the rewritten query joins the affected nodes with the targets of the shape
+                    new_results = sparql_constraints.evaluate_constraint(constraint, self.graph, self.dataset, nodes)
+                    for node, focus_results in group_by_focus(new_results).items():
+                        results[node] = focus_results
+
+            report = self.report()
+            span['results'] = count_results(report[1])
+        metrics.count('results', span['results'])
+        return report
+
+    def dependency(self, shapes_graph, key, constraint=None):
+        # (steps, depth) of a shape or native SPARQL constraint, None if it can read anything
+        if key not in self.dependencies:
+            try:
+                if constraint is None:
+                    steps, depth = shape_dependencies(shapes_graph, key)
+                else:
+                    steps, depth = sparql_dependencies(shapes_graph, constraint.shape, constraint.node)
+                self.dependencies[key] = frozenset(steps), depth
+            except ValueError:
+                self.dependencies[key] = None
+        return self.dependencies[key]
+
+    def affected(self, shapes_graph, key, seeds, cache, constraint=None):
+        # affected focus nodes of a shape or native constraint, None if all of its focus nodes are
+        dependencies = self.dependency(shapes_graph, key, constraint)
+        if dependencies is None:
+            return None
+        if dependencies not in cache:
+            cache[dependencies] = affected_nodes(self.graph, seeds, *dependencies)
+        return cache[dependencies]
+
+    def focus_nodes(self, shape, targets, nodes):
+        """The nodes that are focus nodes of the shape."""
+        graph = self.graph
+        target_nodes, target_classes, target_subjects_of, target_objects_of = targets
+        if target_classes and (None, RDFS.subClassOf, None) in graph:
+            return shape.focus_nodes(graph) & nodes
+        target_nodes = set(target_nodes)
+        return {node for node in nodes
+                if node in target_nodes
+                or any((node, RDF.type, target_class) in graph for target_class in target_classes)
+                or any((node, predicate, None) in graph for predicate in target_subjects_of)
+                or any((None, predicate, node) in graph for predicate in target_objects_of)}
+
+    def apply_difference(self, difference, graph_name):
+        graph = self.graph
+        missing = [triple for triple in difference.preconditions + difference.reverse if triple not in graph]
+        if missing:
+            raise ValueError(f"The difference model does not apply to the model: {len(missing)} precondition or "
+                             f"reverse difference statements are not in it, e.g. {missing[0]}")
+        # removed from every named graph, added to a graph of their own (the merged graph without named graphs)
+        for triple in difference.reverse:
+            self.validator.instance_store.remove(triple, None)
+        target = self.validator.instance_graph(graph_name)
+        target.addN((s, p, o, target) for s, p, o in difference.forward)
+
+        if self.dataset is not None and not isinstance(graph.store, OxigraphStore):
+            # the Oxigraph copy native SPARQL constraints run on
+            store, _ = self.dataset
+            default_graph = pyoxigraph.DefaultGraph()
+            for s, p, o in difference.reverse:
+                store.remove(pyoxigraph.Quad(to_oxigraph(s), to_oxigraph(p), to_oxigraph(o), default_graph))
+            store.extend(pyoxigraph.Quad(to_oxigraph(s), to_oxigraph(p), to_oxigraph(o), default_graph)
+                         for s, p, o in difference.forward)
+
+    def read_difference_models(self, file_paths):
+        difference = DifferenceModel()
+        for file_path in file_paths:
+            _, ext = os.path.splitext(file_path)
+            if self.validator.is_supported_archive(ext):
+                with zipfile.ZipFile(file_path, 'r') as zip_ref:
+                    for member in zip_ref.infolist():
+                        if self.validator.get_format_from_extension(os.path.splitext(member.filename)[1].lower()):
+                            with zip_ref.open(member) as stream:
+                                difference.extend(DifferenceModel.read(stream, self.parse_statements))
+            else:
+                with open(file_path, 'rb') as stream:
+                    difference.extend(DifferenceModel.read(stream, self.parse_statements))
+        return difference
+
+    def parse_statements(self, document):
+        # parsed like the model itself, so that literals get the same datatypes and compare equal
+        graph = CimGraph()
+        source = create_input_source(file=io.BytesIO(document))
+        source.setPublicId("")
+        source.setSystemId(None)
+        graph.parse(source=source, format=PARSER_FORMATS[self.validator.parser],
+                    datatype_mapping=self.validator.datatypes_mapping)
+        return list(graph)
+
+    def report(self):
+        """The ``(conforms, graph, text)`` report of the current results, as pySHACL returns it."""
+        results = [result for by_focus in self.results.values() for focus_results in by_focus.values()
+                   for result in focus_results]
+        report_graph, report_text = Validator.create_validation_report(
+            self.validator.compiled_shapes.shapes_graph, not results, results)
+        return not results, report_graph, report_text
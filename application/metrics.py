@@ -0,0 +1,198 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Timing spans and counters of a validation run, written as JSON lines.
+
+A ``Metrics`` is handed to ``ModelValidator`` (see ``ModelValidator.metrics``) like the ``Progress``. The pipeline
+opens a span for every stage it runs: ``load_datatypes``, ``load_shapes``, ``parse`` with a ``file`` span for every
+input file and an ``entry`` span for every archive member, ``validate`` with ``prune``, ``shacl`` and ``sparql``,
+and ``export``. Spans nest; each records its wall time and the peak resident memory during it, and when configured
+the peak of the Python allocations in it (tracemalloc) and a cProfile of it. The resident peak is Linux's VmHWM,
+which is reset when a span starts; where that is not possible the records have the peak of the process so far as
+``process_peak_rss_mb`` instead. Counters
+(``triples``, ``retyped_literals``, ``shapes``, ``pruned_shapes``, ``results``) add up over the run.
+
+``finish`` ends a run: with an output file the spans, then a ``run`` record with the counters, are appended to it,
+one JSON object per line, in a single write so that processes can share the file. The configuration comes from
+the arguments or, for the GUI, from the environment::
+
+    MODSHAPE_METRICS=metrics.jsonl MODSHAPE_METRICS_PROFILE=validate,parse MODSHAPE_METRICS_TRACEMALLOC=1
+
+Profiles are written next to the output file as ``<run>-<record>-<span>.prof``, to be read with ``pstats`` or snakeviz.
+"""
+
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MEGABYTE = 1024 * 1024
+PROC_STATUS = '/proc/self/status'
+PROC_CLEAR_REFS = '/proc/self/clear_refs'
+# the peak of the process in kilobytes before the last reset of its high-water mark, which resets ru_maxrss too
+_peak_before_reset = 0
+
+
+def peak_rss_mb():
+    # of the process so far; ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return round(peak / MEGABYTE, 1)
+    return round(max(peak, _peak_before_reset) / 1024, 1)
+
+
+def rss_high_water_kb():
+    """Peak resident memory since the last reset (VmHWM), None where there is no /proc."""
+    try:
+        with open(PROC_STATUS) as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def reset_rss_high_water():
+    """Start a new high-water mark of the resident memory; False where that is not possible."""
+    global _peak_before_reset
+    high_water = rss_high_water_kb()
+    if high_water is None:
+        return False
+    try:
+        with open(PROC_CLEAR_REFS, 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return False
+    _peak_before_reset = max(_peak_before_reset, high_water)
+    return True
+
+
+class Metrics:
+    """Spans and counters of the current run, see the module documentation."""
+
+    def __init__(self, output=None, profile=(), trace_memory=False):
+        self.output = output
+        # names of the spans to profile, 'all' profiles every span that is not inside a profiled one
+        self.profile = set(profile)
+        self.trace_memory = trace_memory
+        self._profiler = None
+        self._started_tracing = False
+        self.start_run()
+
+    @classmethod
+    def from_environment(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        profile = [name.strip() for name in environ.get('MODSHAPE_METRICS_PROFILE', '').split(',') if name.strip()]
+        return cls(environ.get('MODSHAPE_METRICS') or None, profile,
+                   environ.get('MODSHAPE_METRICS_TRACEMALLOC', '') not in ('', '0'))
+
+    def start_run(self):
+        self.run = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.records = []
+        self.counters = Counter()
+        self._stack = []
+        # the resident peak of the run so far, in kilobytes, if the high-water mark can be reset
+        self._run_state = {'rss': 0} if reset_rss_high_water() else None
+
+    def rss_record(self, state):
+        """The resident peak of the span with this state (of the run without), folded into the enclosing one."""
+        if self._run_state is None:
+            return {'process_peak_rss_mb': peak_rss_mb()}
+        if state is None:
+            state = self._run_state
+        peak = max(state['rss'], rss_high_water_kb() or 0)
+        if state is not self._run_state:
+            parent = self._stack[-1][1] if self._stack else self._run_state
+            parent['rss'] = max(parent['rss'], peak)
+        return {'peak_rss_mb': round(peak / 1024, 1)}
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    @contextmanager
+    def span(self, name, /, **attributes):
+        """Time the block as a span; the yielded record takes further attributes."""
+        record = {'type': 'span', 'run': self.run, 'name': name,
+                  'path': '/'.join([*(parent['name'] for parent, _ in self._stack), name]),
+                  'depth': len(self._stack), **attributes}
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            if self._stack:
+                # the peak so far belongs to the enclosing span, the peak of this one starts here
+                parent = self._stack[-1]
+                parent[1]['peak'] = max(parent[1]['peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        if self._run_state is not None:
+            # as with tracemalloc, the high-water mark so far belongs to the enclosing span or the run
+            parent = self._stack[-1][1] if self._stack else self._run_state
+            parent['rss'] = max(parent['rss'], rss_high_water_kb() or 0)
+            reset_rss_high_water()
+        state = {'peak': 0, 'rss': 0}
+        profiler = None
+        if self._profiler is None and (name in self.profile or 'all' in self.profile):
+            import cProfile
+
+            profiler = self._profiler = cProfile.Profile()
+            profiler.enable()
+        self._stack.append((record, state))
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = type(e).__name__
+            raise
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            self._stack.pop()
+            if profiler is not None:
+                profiler.disable()
+                self._profiler = None
+                record['profile'] = self.write_profile(profiler, name)
+            record.update(self.rss_record(state))
+            if self.trace_memory and tracemalloc.is_tracing():
+                peak = max(state['peak'], tracemalloc.get_traced_memory()[1])
+                record['python_peak_mb'] = round(peak / MEGABYTE, 1)
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent[1]['peak'] = max(parent[1]['peak'], peak)
+                tracemalloc.reset_peak()
+            self.records.append(record)
+
+    def write_profile(self, profiler, name):
+        directory = os.path.dirname(os.path.abspath(self.output)) if self.output else os.getcwd()
+        path = os.path.join(directory, f"{self.run}-{len(self.records)}-{name}.prof")
+        profiler.dump_stats(path)
+        return path
+
+    def finish(self, **attributes):
+        """End the run, write its records to the output file and return them; the next span starts a new run."""
+        records = self.records + [{'type': 'run', 'run': self.run,
+                                   'started': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.started)),
+                                   'seconds': round(time.time() - self.started, 6), **self.rss_record(None),
+                                   'python': platform.python_version(), 'platform': platform.platform(),
+                                   'pid': os.getpid(), **attributes, 'counters': dict(self.counters)}]
+        if self.output:
+            with open(self.output, 'a') as file:
+                file.write(''.join(json.dumps(record, default=str) + '\n' for record in records))
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.start_run()
+        return records
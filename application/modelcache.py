@@ -0,0 +1,138 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Parsed instance files, cached on disk.
+
+Boundary sets and EQ files are validated again and again unchanged. With ``ModelValidator(cache_models=True)``
+every instance file (or archive) is looked up below ``cache_dir('models')`` by its content hash, the parser
+backend and the digest of the datatype mapping the parsers type literals with. A hit adds the cached triples to
+the instance graph instead of parsing the file. A miss parses it as usual while ``ModelRecorder`` encodes the
+triples on their way into the store, standing in for the graph's histogram (see ``CimGraph.histogram``), and
+writes the entry afterwards. The triples of every archive member are kept under its graph name, so named graphs
+come out the same either way.
+
+An entry is the dictionary encoding of ``application.shapecache`` behind a header with the SHA-256 of the
+payload; an entry that fails the check is deleted and the file parsed again. Entries are written atomically and
+the least recently used are evicted once the cache holds more than ``$MODSHAPE_MODELS_CACHE_MB`` megabytes (2048
+by default), so any number of processes can share the cache.
+"""
+
+import hashlib
+import os
+import pickle
+from array import array
+
+from application.cache import atomic_write, cache_dir, evict, files_digest, touch
+from application.shapecache import TermTable, decode_terms
+
+# bump when the cached format changes
+CACHE_VERSION = 1
+DEFAULT_CACHE_MB = 2048
+MAGIC = b'MODSHAPE-MODEL\n'
+HEADER_SIZE = len(MAGIC) + hashlib.sha256().digest_size
+
+
+def max_cache_bytes():
+    return int(float(os.environ.get('MODSHAPE_MODELS_CACHE_MB', DEFAULT_CACHE_MB)) * 1024 * 1024)
+
+
+def datatypes_digest(datatypes_mapping):
+    # a map loaded from files knows their digest, one built in code is hashed by its pairs
+    if datatypes_mapping.digest is not None:
+        return datatypes_mapping.digest
+    return hashlib.sha256(repr(sorted(datatypes_mapping.pairs())).encode()).hexdigest()
+
+
+def entry_path(file_path, parser, datatypes_mapping):
+    digest = files_digest([file_path], CACHE_VERSION, parser, datatypes_digest(datatypes_mapping))
+    return os.path.join(cache_dir('models'), f"{digest}.model")
+
+
+def read_entry(path):
+    """Term table and {graph name suffix: triple IDs} of an entry; None if there is none or it is corrupt."""
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except OSError:
+        return None  # not cached, or evicted by another process meanwhile
+    payload = memoryview(data)[HEADER_SIZE:]
+    try:
+        if data[:len(MAGIC)] != MAGIC or hashlib.sha256(payload).digest() != data[len(MAGIC):HEADER_SIZE]:
+            raise ValueError(f"Damaged model cache entry {path}")
+        entry = pickle.loads(payload)
+    except (ValueError, EOFError, pickle.UnpicklingError):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    touch(path)
+    return entry
+
+
+def load_entry(entry, graph):
+    """Add the triples of an entry, ``graph(suffix)`` being the graph of the file or member they were parsed into."""
+    terms, graphs = entry
+    nodes = decode_terms(terms)
+    for suffix, ids_bytes in graphs.items():
+        ids = array('l')
+        ids.frombytes(ids_bytes)
+        target = graph(suffix)
+        target.addN((nodes[ids[i]], nodes[ids[i + 1]], nodes[ids[i + 2]], target) for i in range(0, len(ids), 3))
+
+
+class ModelRecorder:
+    """Encodes the triples parsed from one file, those of archive members under the graph name of the member."""
+
+    def __init__(self, graph_name):
+        self.graph_name = graph_name
+        self.terms = TermTable()
+        self.graphs = {}
+
+    def member(self, graph_name, histogram):
+        """The stand-in for the histogram of the graph ``graph_name`` is parsed into."""
+        ids = self.graphs.setdefault(graph_name[len(self.graph_name):], array('l'))
+        return RecordingHistogram(histogram, self.terms.id, ids)
+
+    def write(self, path):
+        payload = pickle.dumps((self.terms.terms, {suffix: ids.tobytes() for suffix, ids in self.graphs.items()}),
+                               protocol=pickle.HIGHEST_PROTOCOL)
+        max_bytes = max_cache_bytes()
+        if len(payload) > max_bytes:
+            return  # would evict everything else and itself
+        atomic_write(path, MAGIC + hashlib.sha256(payload).digest() + payload)
+        evict(os.path.dirname(path), max_bytes, keep=(path,))
+
+
+class RecordingHistogram:
+    """Counts what a graph adds in its histogram, like ``ModelHistogram``, and records the term IDs."""
+
+    def __init__(self, histogram, term_id, ids):
+        self.histogram = histogram
+        self.term_id = term_id
+        self.ids = ids
+
+    def add(self, triple):
+        if self.histogram is not None:
+            self.histogram.add(triple)
+        term_id = self.term_id
+        self.ids.extend((term_id(triple[0]), term_id(triple[1]), term_id(triple[2])))
+
+    def snapshot(self):
+        return self.histogram.snapshot() if self.histogram is not None else None, len(self.ids)
+
+    def restore(self, snapshot):
+        histogram, length = snapshot
+        if self.histogram is not None:
+            self.histogram.restore(histogram)
+        del self.ids[length:]
+
+    def count_quads(self, quads):
+        if self.histogram is not None:
+            quads = self.histogram.count_quads(quads)
+        term_id = self.term_id
+        ids = self.ids
+        for quad in quads:
+            ids.extend((term_id(quad[0]), term_id(quad[1]), term_id(quad[2])))
+            yield quad
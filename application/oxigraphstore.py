@@ -0,0 +1,282 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+An rdflib Store backed by a pyoxigraph Store.
+
+Triples live in Oxigraph's native, fully indexed store (in memory, or on disk
+when opened with a directory path) instead of rdflib's nested dicts of Python
+terms. rdflib terms are only created for the triples a lookup returns, and
+SPARQL queries are passed through to Oxigraph's query engine, so rdflib and
+pySHACL work against it through the normal Store API:
+
+>>> from application.CimGraph import CimGraph
+>>> g = CimGraph(store="Oxigraph")
+
+Oxigraph only accepts absolute IRIs, while CGMES instance data parsed without
+a document base has relative subjects ("#_mRID"). Relative IRIs are stored
+under ``PLACEHOLDER_BASE`` and stripped again on the way out.
+"""
+from __future__ import annotations
+
+import re
+import shutil
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, Mapping, Optional, Tuple
+
+import pyoxigraph
+from rdflib.graph import DATASET_DEFAULT_GRAPH_ID, Graph
+from rdflib.query import Result
+from rdflib.store import VALID_STORE, Store
+from rdflib.term import BNode, Identifier, Literal, Node, URIRef, Variable
+
+from application.cimoxigraph import PLACEHOLDER_BASE
+
+if TYPE_CHECKING:
+    from rdflib.graph import _ContextType, _QuadType, _TriplePatternType, _TripleType
+
+__all__ = ["OxigraphStore", "to_oxigraph", "from_oxigraph"]
+
+PREFIX_DECLARATION = re.compile(r"PREFIX\s+([\w\-.]*):", re.IGNORECASE)
+
+
+def to_oxigraph(term: Node):
+    if isinstance(term, URIRef):
+        try:
+            return pyoxigraph.NamedNode(term)
+        except ValueError:
+            # relative IRI, see the module docstring
+            return pyoxigraph.NamedNode(PLACEHOLDER_BASE + term)
+    elif isinstance(term, BNode):
+        return pyoxigraph.BlankNode(term)
+    elif isinstance(term, Literal):
+        if term.language is not None:
+            return pyoxigraph.Literal(term, language=term.language)
+        if term.datatype is not None:
+            return pyoxigraph.Literal(term, datatype=pyoxigraph.NamedNode(term.datatype))
+        return pyoxigraph.Literal(term)
+    raise ValueError("Unsupported term for the Oxigraph store: %r" % (term,))
+
+
+def from_oxigraph(term) -> Node:
+    if isinstance(term, pyoxigraph.NamedNode):
+        value = term.value
+        if value.startswith(PLACEHOLDER_BASE):
+            value = value[len(PLACEHOLDER_BASE):]
+        return URIRef(value)
+    elif isinstance(term, pyoxigraph.BlankNode):
+        return BNode(term.value)
+    elif isinstance(term, pyoxigraph.Literal):
+        if term.language is not None:
+            return Literal(term.value, lang=term.language)
+        return Literal(term.value, datatype=URIRef(term.datatype.value))
+    raise ValueError("Unsupported Oxigraph term: %r" % (term,))
+
+
+def graph_name(context: Optional[_ContextType]):
+    # None means "all graphs" in lookups
+    if context is None:
+        return None
+    identifier = context.identifier if isinstance(context, Graph) else context
+    if identifier == DATASET_DEFAULT_GRAPH_ID:
+        return pyoxigraph.DefaultGraph()
+    return to_oxigraph(identifier)
+
+
+class OxigraphStore(Store):
+    """
+    rdflib Store on top of ``pyoxigraph.Store``.
+
+    ``configuration`` is the directory of an on-disk store; without it the store is in memory. ``addN``
+    goes through Oxigraph's bulk loader, which is much faster than adding triple by triple but not
+    transactional.
+    """
+
+    context_aware = True
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = True
+
+    def __init__(self, configuration: Optional[str] = None, identifier: Optional[Identifier] = None):
+        self._inner: Optional[pyoxigraph.Store] = None
+        self._namespaces: Dict[str, URIRef] = {}
+        self._prefixes: Dict[URIRef, str] = {}
+        self.identifier = identifier
+        super().__init__(configuration, identifier)
+
+    @property
+    def inner(self) -> pyoxigraph.Store:
+        if self._inner is None:
+            self._inner = pyoxigraph.Store()
+        return self._inner
+
+    def open(self, configuration: str, create: bool = False) -> Optional[int]:
+        self._inner = pyoxigraph.Store(configuration)
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction: bool = False) -> None:
+        if self._inner is not None:
+            self._inner.flush()
+        self._inner = None
+
+    def destroy(self, configuration: str) -> None:
+        self._inner = None
+        shutil.rmtree(configuration, ignore_errors=True)
+
+    # RDF APIs
+
+    def add(self, triple: _TripleType, context: _ContextType, quoted: bool = False) -> None:
+        if quoted:
+            raise ValueError("The Oxigraph store is not formula-aware")
+        s, p, o = triple
+        self.inner.add(
+            pyoxigraph.Quad(to_oxigraph(s), to_oxigraph(p), to_oxigraph(o), graph_name(context))
+        )
+        super().add(triple, context, quoted)
+
+    def addN(self, quads: Iterable[_QuadType]) -> None:  # noqa: N802
+        self.inner.bulk_extend(
+            pyoxigraph.Quad(to_oxigraph(s), to_oxigraph(p), to_oxigraph(o), graph_name(c))
+            for s, p, o, c in quads
+        )
+
+    def remove(self, triple: _TriplePatternType, context: Optional[_ContextType] = None) -> None:
+        for quad in list(self._quads(triple, context)):
+            self.inner.remove(quad)
+
+    def _quads(self, triple: _TriplePatternType, context: Optional[_ContextType]):
+        s, p, o = triple
+        if isinstance(s, Literal) or isinstance(p, (Literal, BNode)):
+            # rdflib (e.g. SPARQL property paths) may ask for patterns no RDF triple can match
+            return iter(())
+        return self.inner.quads_for_pattern(
+            to_oxigraph(s) if s is not None else None,
+            to_oxigraph(p) if p is not None else None,
+            to_oxigraph(o) if o is not None else None,
+            graph_name(context),
+        )
+
+    def _context(self, name) -> Graph:
+        if isinstance(name, pyoxigraph.DefaultGraph):
+            return Graph(store=self, identifier=DATASET_DEFAULT_GRAPH_ID)
+        return Graph(store=self, identifier=from_oxigraph(name))
+
+    def triples(
+        self, triple_pattern: _TriplePatternType, context: Optional[_ContextType] = None
+    ) -> Iterator[Tuple[_TripleType, Iterator[Optional[_ContextType]]]]:
+        for quad in self._quads(triple_pattern, context):
+            triple = from_oxigraph(quad.subject), from_oxigraph(quad.predicate), from_oxigraph(quad.object)
+            quad_context = context if context is not None else self._context(quad.graph_name)
+            yield triple, iter((quad_context,))  # type: ignore[misc]
+
+    def __len__(self, context: Optional[_ContextType] = None) -> int:
+        if context is None:
+            return len(self.inner)
+        return sum(1 for _ in self._quads((None, None, None), context))
+
+    def contexts(self, triple: Optional[_TripleType] = None) -> Iterator[_ContextType]:
+        if triple is None:
+            for name in self.inner.named_graphs():
+                yield self._context(name)
+        else:
+            names = {quad.graph_name for quad in self._quads(triple, None)}
+            for name in names:
+                yield self._context(name)
+
+    def add_graph(self, graph: Graph) -> None:
+        name = graph_name(graph)
+        if not isinstance(name, pyoxigraph.DefaultGraph):
+            self.inner.add_graph(name)
+
+    def remove_graph(self, graph: Graph) -> None:
+        name = graph_name(graph)
+        if isinstance(name, pyoxigraph.DefaultGraph):
+            self.inner.clear_graph(name)
+        else:
+            self.inner.remove_graph(name)
+
+    # SPARQL passthrough
+
+    @staticmethod
+    def _prepare(query: Any, initNs: Mapping[str, Any], initBindings: Mapping[str, Identifier]) -> str:  # noqa: N803
+        if not isinstance(query, str) or initBindings:
+            # prepared queries are evaluated by rdflib itself, and so are initial bindings: rdflib pre-binds
+            # them everywhere in the query (also inside FILTER NOT EXISTS), which no textual rewrite to a
+            # VALUES block reproduces in general
+            raise NotImplementedError
+        declared = set(PREFIX_DECLARATION.findall(query))
+        prefixes = "".join(
+            "PREFIX %s: <%s>\n" % (prefix, namespace)
+            for prefix, namespace in (initNs or {}).items()
+            if prefix not in declared
+        )
+        return prefixes + query
+
+    def query(
+        self,
+        query: Any,
+        initNs: Mapping[str, Any],  # noqa: N803
+        initBindings: Mapping[str, Identifier],  # noqa: N803
+        queryGraph: Any,  # noqa: N803
+        **kwargs: Any,
+    ) -> Result:
+        text = self._prepare(query, initNs, initBindings)
+        if queryGraph == "__UNION__":
+            answer = self.inner.query(text, use_default_graph_as_union=True)
+        elif queryGraph is None:
+            answer = self.inner.query(text)
+        else:
+            answer = self.inner.query(text, default_graph=graph_name(queryGraph))
+
+        if isinstance(answer, bool):
+            result = Result("ASK")
+            result.askAnswer = answer
+        elif isinstance(answer, pyoxigraph.QuerySolutions):
+            result = Result("SELECT")
+            result.vars = [Variable(variable.value) for variable in answer.variables]
+            names = [(variable, str(variable)) for variable in result.vars]
+            result.bindings = [
+                {variable: from_oxigraph(solution[name]) for variable, name in names if solution[name] is not None}
+                for solution in answer
+            ]
+        else:
+            result = Result("CONSTRUCT")
+            graph = Graph()
+            graph.addN(
+                (from_oxigraph(t.subject), from_oxigraph(t.predicate), from_oxigraph(t.object), graph)
+                for t in answer
+            )
+            result.graph = graph
+        return result
+
+    def update(
+        self,
+        update: Any,
+        initNs: Mapping[str, Any],  # noqa: N803
+        initBindings: Mapping[str, Identifier],  # noqa: N803
+        queryGraph: Any,  # noqa: N803
+        **kwargs: Any,
+    ) -> None:
+        # Oxigraph always updates its own default graph
+        if queryGraph not in (None, DATASET_DEFAULT_GRAPH_ID):
+            raise NotImplementedError
+        self.inner.update(self._prepare(update, initNs, initBindings))
+
+    # Namespaces
+
+    def bind(self, prefix: str, namespace: URIRef, override: bool = True) -> None:
+        bound = self._namespaces.get(prefix)
+        if bound is not None and not override:
+            return
+        if bound is not None:
+            self._prefixes.pop(bound, None)
+        self._namespaces[prefix] = namespace
+        self._prefixes[namespace] = prefix
+
+    def prefix(self, namespace: URIRef) -> Optional[str]:
+        return self._prefixes.get(namespace)
+
+    def namespace(self, prefix: str) -> Optional[URIRef]:
+        return self._namespaces.get(prefix)
+
+    def namespaces(self) -> Iterator[Tuple[str, URIRef]]:
+        yield from self._namespaces.items()
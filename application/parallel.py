@@ -0,0 +1,209 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+SHACL validation split by shape over worker processes.
+
+pySHACL validates every shape on its own against the whole data graph, so the shapes can be partitioned and
+each partition validated in another process. Only shapes with focus nodes in the data graph are scheduled.
+Their cost is estimated as focus nodes times constraints, with sh:sparql constraints, which pySHACL runs as one
+rdflib query per focus node, weighted ``SPARQL_WEIGHT``. Shapes are packed into ``PARTITIONS_PER_WORKER``
+partitions per worker, most expensive first (longest processing time first), and handed out in that order, so
+an expensive shape starts early instead of becoming the tail. The partition reports are merged into one report
+with a combined ``conforms``.
+
+Workers are forked where the platform allows it and share the data and shapes graphs of the parent copy on
+write; elsewhere they receive a serialized snapshot of both.
+"""
+
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+from pyshacl import ShapesGraph, Validator
+from pyshacl.errors import ValidationFailure
+from pyshacl.monkey import apply_patches
+from pyshacl.validate import assign_baked_in
+from rdflib import BNode, Graph, Literal, RDF, SH
+
+from application.CimGraph import CimGraph
+from application.progress import ProgressShapes
+from application.shapecache import decode_graph, decode_triples, encode_graph, encode_triples
+
+# validation without inference, as ModelValidator always ran it
+VALIDATION_OPTIONS = {
+    'inference': 'none',
+    'abort_on_first': False,
+    'allow_infos': False,
+    'allow_warnings': False,
+    'advanced': False,
+    'use_js': False,
+    'debug': False,
+}
+SPARQL_WEIGHT = 50
+PARTITIONS_PER_WORKER = 4
+NESTED_SHAPE_PREDICATES = (SH.property, SH.node, SH['not'], SH.qualifiedValueShape)
+SHAPE_LIST_PREDICATES = (SH['and'], SH['or'], SH.xone)
+
+# data graph and shapes of a worker process, see init_worker
+_data_graph = None
+_shapes_graph = None
+
+
+class ShapesPartition:
+    """A ``ShapesGraph`` that gives pySHACL only some of its shapes to validate."""
+
+    def __init__(self, shapes_graph, nodes):
+        self.shapes_graph = shapes_graph
+        shapes_graph.shapes  # harvests the shapes, if that did not happen yet
+        self.shapes = [shapes_graph.lookup_shape_from_node(node) for node in nodes]
+
+    def __getattr__(self, name):
+        return getattr(self.shapes_graph, name)
+
+
+def run_pyshacl(data_graph, shapes_graph):
+    """Validate with an already harvested ``ShapesGraph`` (or a partition of one), as ``pyshacl.validate()`` does."""
+    apply_patches()
+    assign_baked_in()
+    try:
+        validator = Validator(data_graph, shacl_graph=shapes_graph.graph, ont_graph=None,
+                              options=dict(VALIDATION_OPTIONS))
+        validator.shacl_graph = shapes_graph
+        return validator.run()
+    except ValidationFailure as e:
+        return False, e, "Validation Failure - {}".format(e.message)
+
+
+def shape_weight(graph, node, seen=None):
+    seen = set() if seen is None else seen
+    if node in seen:
+        return 0
+    seen.add(node)
+    weight = 1
+    for predicate, value in graph.predicate_objects(node):
+        if predicate == SH.sparql:
+            weight += SPARQL_WEIGHT
+        elif predicate in NESTED_SHAPE_PREDICATES:
+            weight += shape_weight(graph, value, seen)
+        elif predicate in SHAPE_LIST_PREDICATES:
+            weight += sum(shape_weight(graph, item, seen) for item in graph.items(value))
+        else:
+            weight += 1
+    return weight
+
+
+def shape_costs(shapes_graph, data_graph):
+    """Estimated cost of every shape with focus nodes in the data graph."""
+    costs = {}
+    for shape in shapes_graph.shapes:
+        if shape.deactivated:
+            continue
+        focus_nodes = len(shape.focus_nodes(data_graph))
+        if focus_nodes:
+            costs[shape.node] = focus_nodes * shape_weight(shapes_graph.graph, shape.node)
+    return costs
+
+
+def partition_shapes(costs, partitions):
+    """Pack shapes into at most ``partitions`` lists of similar total cost, most expensive partition first."""
+    bins = [[0, []] for _ in range(max(1, min(partitions, len(costs))))]
+    for node, cost in sorted(costs.items(), key=lambda item: -item[1]):
+        cheapest = min(bins, key=lambda b: b[0])
+        cheapest[0] += cost
+        cheapest[1].append(node)
+    return [nodes for _, nodes in sorted(bins, key=lambda b: -b[0]) if nodes]
+
+
+def snapshot(graph):
+    return pickle.dumps(encode_triples(graph), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def restore(data):
+    triples, _ = decode_triples(pickle.loads(data))
+    graph = CimGraph()
+    graph.addN((s, p, o, graph) for s, p, o in triples)
+    return graph
+
+
+def init_worker(data_graph, shapes_graph):
+    global _data_graph, _shapes_graph
+    if isinstance(data_graph, bytes):
+        data_graph = restore(data_graph)
+        shapes_graph = ShapesGraph(decode_graph(pickle.loads(shapes_graph)))
+    _data_graph, _shapes_graph = data_graph, shapes_graph
+
+
+def validate_partition(nodes):
+    conforms, report_graph, report_text = run_pyshacl(_data_graph, ShapesPartition(_shapes_graph, nodes))
+    if not isinstance(report_graph, Graph):
+        raise report_graph  # ValidationFailure
+    return conforms, pickle.dumps(encode_graph(report_graph), protocol=pickle.HIGHEST_PROTOCOL), report_text
+
+
+def merge_reports(reports):
+    """One ``(conforms, graph, text)`` report from the reports of several partitions."""
+    merged = Graph(bind_namespaces='core')
+    report = BNode()
+    merged.add((report, RDF.type, SH.ValidationReport))
+    conforms = True
+    bodies = []
+    for partition_conforms, encoded, text in reports:
+        conforms = conforms and partition_conforms
+        triples, namespaces = decode_triples(pickle.loads(encoded))
+        for prefix, namespace in namespaces:
+            merged.bind(prefix, namespace)
+        partition_reports = {s for s, p, o in triples if p == RDF.type and o == SH.ValidationReport}
+        for s, p, o in triples:
+            if s in partition_reports:
+                if p == SH.result:
+                    merged.add((report, p, o))
+            else:
+                merged.add((s, p, o))
+        if "\nResults (" in text:
+            bodies.append(text.split("\n", 3)[3])
+    merged.add((report, SH.conforms, Literal(conforms)))
+
+    text = "Validation Report\nConforms: {}\n".format(conforms)
+    count = len(set(merged.objects(report, SH.result)))
+    if count:
+        text += "Results ({}):\n{}".format(count, "".join(bodies))
+    return conforms, merged, text
+
+
+def validate_parallel(data_graph, shapes_graph, workers, progress=None):
+    """
+    Validate the data graph against a harvested ``ShapesGraph`` with ``workers`` processes. A ``Progress`` is
+    updated as partitions complete, and cancelling it stops handing out partitions.
+    """
+    costs = shape_costs(shapes_graph, data_graph)
+    partitions = partition_shapes(costs, workers * PARTITIONS_PER_WORKER)
+    if len(partitions) <= 1 or workers <= 1:
+        partition = ShapesPartition(shapes_graph, [node for nodes in partitions for node in nodes])
+        if progress is not None:
+            partition.shapes = ProgressShapes(partition.shapes, progress)
+        return run_pyshacl(data_graph, partition)
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # forked workers inherit both graphs, nothing is copied up front
+        context = multiprocessing.get_context('fork')
+        initargs = (data_graph, shapes_graph)
+    else:
+        context = multiprocessing.get_context('spawn')
+        initargs = (snapshot(data_graph), pickle.dumps(encode_graph(shapes_graph.graph)))
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(partitions)), mp_context=context,
+                                 initializer=init_worker, initargs=initargs) as executor:
+            futures = [executor.submit(validate_partition, nodes) for nodes in partitions]
+            reports = []
+            try:
+                for nodes, future in zip(partitions, futures):
+                    reports.append(future.result())
+                    if progress is not None:
+                        progress.update(shapes=progress.shapes + len(nodes))
+            except BaseException:
+                executor.shutdown(cancel_futures=True)
+                raise
+    except ValidationFailure as e:
+        return False, e, "Validation Failure - {}".format(e.message)
+    return merge_reports(reports)
@@ -0,0 +1,135 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Progress reporting and cancellation of a validation run, without any Qt dependency.
+
+A ``Progress`` is handed to ``ModelValidator`` (see ``ModelValidator.progress``) and counts files and bytes
+parsed, triples loaded, shapes validated and results found. Every update goes to an optional callback (the GUI
+emits a Qt signal from it) and checks whether the run was cancelled from another thread; if so
+``ValidationCancelled`` is raised. The checks happen at the boundaries the pipeline already has: before every
+file, at every buffer the parsers read (``ProgressReader``) and after every shape (``ProgressShapes``).
+"""
+
+import io
+import threading
+import time
+
+# callbacks for byte counts are rate limited, every other update is always reported
+REPORT_INTERVAL = 0.1
+
+
+class ValidationCancelled(Exception):
+    """The validation run was cancelled."""
+
+
+class Progress:
+    """Counters of one validation run, reported to ``callback(progress)``."""
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._cancelled = threading.Event()
+        self._last_report = 0.0
+        self.phase = ''
+        self.files = 0
+        self.total_files = 0
+        self.bytes = 0
+        self.total_bytes = 0
+        self.triples = 0
+        self.shapes = 0
+        self.total_shapes = 0
+        self.results = 0
+
+    def cancel(self):
+        # may be called from any thread
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise ValidationCancelled()
+
+    def update(self, throttle=False, **counters):
+        """Set counters, raise ``ValidationCancelled`` if the run was cancelled and report the progress."""
+        for name, value in counters.items():
+            setattr(self, name, value)
+        self.check()
+        if self.callback is not None:
+            now = time.monotonic()
+            if throttle and now - self._last_report < REPORT_INTERVAL:
+                return
+            self._last_report = now
+            self.callback(self)
+
+
+class ProgressReader(io.RawIOBase):
+    """A binary file that adds the bytes read to a ``Progress``, checking for cancellation at every read."""
+
+    def __init__(self, file, progress, histogram=None):
+        super().__init__()
+        self.file = file
+        self.progress = progress
+        # the triples loaded so far are reported with the bytes
+        self.histogram = histogram
+        self.start = progress.bytes
+        self.furthest = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self.file.seekable()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def readinto(self, buffer):
+        count = self.file.readinto(buffer)
+        position = self.file.tell()
+        # archives seek back and forth, count every byte once
+        if position > self.furthest:
+            self.furthest = position
+            triples = self.histogram.total if self.histogram is not None else self.progress.triples
+            self.progress.update(throttle=True, bytes=self.start + self.furthest, triples=triples)
+        else:
+            self.progress.check()
+        return count
+
+
+class ProgressShapes:
+    """
+    The shapes pySHACL iterates over in ``Validator.run``, each wrapped so that completing it updates the
+    progress, counts its results and checks for cancellation.
+    """
+
+    def __init__(self, shapes, progress):
+        self.shapes = shapes
+        self.progress = progress
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def __iter__(self):
+        for shape in self.shapes:
+            yield ProgressShape(shape, self.progress)
+
+
+class ProgressShape:
+    def __init__(self, shape, progress):
+        self.shape = shape
+        self.progress = progress
+
+    def validate(self, *args, **kwargs):
+        self.progress.check()
+        conforms, reports = self.shape.validate(*args, **kwargs)
+        self.progress.update(shapes=self.progress.shapes + 1, results=self.progress.results + len(reports))
+        return conforms, reports
+
+    def __getattr__(self, name):
+        return getattr(self.shape, name)
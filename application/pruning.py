@@ -0,0 +1,112 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Pruning of shapes that cannot match the loaded model.
+
+The default bundle carries shapes for every CGMES profile, while a model usually holds instances of a fraction
+of the classes. ``ModelHistogram`` counts the rdf:type classes and the predicates of the instance data while it
+is parsed (see ``CimGraph.histogram``). ``prune_shapes`` then keeps only the shapes whose sh:targetClass, implicit
+class target, sh:targetSubjectsOf or sh:targetObjectsOf can select a focus node. pySHACL never sees the others,
+which would find no focus nodes and report nothing. Shapes stay available to the shapes that reference them
+(sh:node, sh:property, ...), only their own targets are skipped.
+"""
+
+from collections import Counter
+
+from rdflib import RDF, RDFS, SH
+
+
+class ModelHistogram:
+    """Number of instances per rdf:type class and of triples per predicate."""
+
+    def __init__(self):
+        self.classes = Counter()
+        self.predicates = Counter()
+        self.total = 0
+
+    def add(self, triple):
+        predicate = triple[1]
+        self.predicates[predicate] += 1
+        self.total += 1
+        if predicate == RDF.type:
+            self.classes[triple[2]] += 1
+
+    def count_quads(self, quads):
+        # passes the quads through, counting them on the way
+        predicates = self.predicates
+        classes = self.classes
+        for quad in quads:
+            predicate = quad[1]
+            predicates[predicate] += 1
+            if predicate == RDF.type:
+                classes[quad[2]] += 1
+            self.total += 1
+            yield quad
+
+    def update(self, predicates, classes):
+        # counts of triples that were added past the graph, see CIMOxigraphParser
+        self.predicates.update(predicates)
+        self.classes.update(classes)
+        self.total += sum(predicates.values())
+
+    def snapshot(self):
+        return self.classes.copy(), self.predicates.copy(), self.total
+
+    def restore(self, snapshot):
+        # forget what was counted since the snapshot
+        classes, predicates, self.total = snapshot
+        self.classes, self.predicates = classes.copy(), predicates.copy()
+
+    @classmethod
+    def from_graph(cls, graph):
+        histogram = cls()
+        for triple in graph:
+            histogram.add(triple)
+        return histogram
+
+    @classmethod
+    def combined(cls, histograms):
+        # of the union of several graphs; a triple in more than one of them is counted more than once
+        histogram = cls()
+        for other in histograms:
+            histogram.classes.update(other.classes)
+            histogram.predicates.update(other.predicates)
+            histogram.total += other.total
+        return histogram
+
+
+def shape_targets(shape):
+    """The target declarations of a pySHACL shape: nodes, classes, subjects-of and objects-of predicates."""
+    target_nodes, target_classes, implicit_classes, target_objects_of, target_subjects_of = shape.target()
+    return (list(target_nodes), list(target_classes) + list(implicit_classes), list(target_subjects_of),
+            list(target_objects_of))
+
+
+def can_match(targets, histogram):
+    """Whether shape targets can select any focus node in a model with this histogram."""
+    target_nodes, target_classes, target_subjects_of, target_objects_of = targets
+    if target_nodes:
+        return True
+    # pySHACL follows rdfs:subClassOf of the data graph, so any class may have instances then
+    if target_classes and RDFS.subClassOf in histogram.predicates:
+        return True
+    if any(target_class in histogram.classes for target_class in target_classes):
+        return True
+    return any(predicate in histogram.predicates for predicate in target_subjects_of + target_objects_of)
+
+
+def prune_shapes(shapes_graph, histogram):
+    """The nodes of the shapes to validate, and of the shapes with targets that were pruned."""
+    kept = []
+    pruned = []
+    for shape in shapes_graph.shapes:
+        if (shape.node, SH.target, None) in shapes_graph.graph:
+            kept.append(shape.node)  # SHACL-AF targets, selected by a query
+            continue
+        targets = shape_targets(shape)
+        if can_match(targets, histogram):
+            kept.append(shape.node)
+        elif any(targets):
+            pruned.append(shape.node)
+    return kept, pruned
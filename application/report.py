@@ -0,0 +1,206 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Excel validation reports, written in constant memory.
+
+``ExcelReportWriter`` streams rows straight into the SpreadsheetML parts of an .xlsx file. No sheet is ever held
+as cell objects: openpyxl's write-only mode would keep memory flat too, but without lxml it spends far longer
+serializing the cells than the validation took. Rows are written as inline strings and column widths are tracked
+while they stream in. A sheet lists its column widths before its rows, so the rows of a sheet are spooled (in
+memory while small, in a temporary file otherwise) and copied behind the column definitions once the sheet is
+complete. Column styles come from the ``Column`` definitions and are written with the cells, not set in extra
+passes over the sheet. A sheet that would exceed Excel's row limit continues on "<title> (2)", "<title> (3)", ...
+"""
+
+import re
+import shutil
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+# rows per sheet, the header row included
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_CELL_LENGTH = 32767
+EXCEL_MAX_TITLE_LENGTH = 31
+# Excel's limit; wrapped columns are kept narrower so that long messages wrap
+MAX_COLUMN_WIDTH = 255
+WRAPPED_COLUMN_WIDTH = 100
+COLUMN_PADDING = 2
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
+# control characters XML 1.0 does not allow
+ILLEGAL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+CONTENT_TYPES_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+SHEET_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+WORKBOOK_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml'
+# cell format 0 is the default, 1 wraps text
+STYLES = (XML_DECLARATION +
+          f'<styleSheet xmlns="{MAIN_NS}">'
+          '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+          '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+          '<fill><patternFill patternType="gray125"/></fill></fills>'
+          '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+          '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+          '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+          '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0" applyAlignment="1">'
+          '<alignment wrapText="1"/></xf></cellXfs>'
+          '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+          '</styleSheet>')
+WRAP_STYLE = 1
+
+
+class Column:
+    """Header and formatting of one report column."""
+
+    def __init__(self, header, wrap=False):
+        self.header = header
+        self.wrap = wrap
+        self.max_width = WRAPPED_COLUMN_WIDTH if wrap else MAX_COLUMN_WIDTH
+
+
+def column_letter(index):
+    # 1 -> A, 27 -> AA
+    letters = ''
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def quote_sheetname(title):
+    return "'{}'".format(title.replace("'", "''"))
+
+
+def cell_text(value):
+    return ILLEGAL_CHARACTERS.sub('', str(value))[:EXCEL_MAX_CELL_LENGTH]
+
+
+class ExcelReportWriter:
+    """
+    Writes sheets of rows to an .xlsx file.
+
+    >>> with ExcelReportWriter('report.xlsx') as writer:
+    ...     writer.write_sheet('Sheet', [Column('Focus node'), Column('Message', wrap=True)], rows)
+    """
+
+    def __init__(self, file_name, max_rows=EXCEL_MAX_ROWS):
+        self.archive = zipfile.ZipFile(file_name, 'w', zipfile.ZIP_DEFLATED)
+        self.max_rows = max_rows
+        # (title, last row, last column) of every sheet written
+        self.sheets = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_sheet(self, title, columns, rows):
+        """Write rows (sequences of cell values, None for an empty cell) under a header row; returns the row count."""
+        rows = iter(rows)
+        total = 0
+        part = 1
+        while True:
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+                count, widths = self.spool_rows(rows, columns, spool)
+                if count == 0 and part > 1:
+                    break
+                spool.seek(0)
+                suffix = f" ({part})" if part > 1 else ""
+                self.copy_sheet(title[:EXCEL_MAX_TITLE_LENGTH - len(suffix)] + suffix, columns, spool, count, widths)
+            total += count
+            if count < self.max_rows - 1:
+                break
+            part += 1
+        return total
+
+    def spool_rows(self, rows, columns, spool):
+        # up to one sheet of rows as <row> elements, tracking the width of every column
+        letters = [column_letter(index) for index in range(1, len(columns) + 1)]
+        styles = [f' s="{WRAP_STYLE}"' if column.wrap else '' for column in columns]
+        widths = [len(column.header) for column in columns]
+        limit = self.max_rows - 1
+        count = 0
+        for row in rows:
+            count += 1
+            r = count + 1
+            cells = []
+            for index, value in enumerate(row):
+                if value is None:
+                    continue
+                text = cell_text(value)
+                if len(text) > widths[index]:
+                    widths[index] = len(text)
+                space = ' xml:space="preserve"' if text[:1].isspace() or text[-1:].isspace() else ''
+                cells.append(f'<c r="{letters[index]}{r}"{styles[index]} t="inlineStr">'
+                             f'<is><t{space}>{escape(text)}</t></is></c>')
+            spool.write(f'<row r="{r}">{"".join(cells)}</row>'.encode())
+            if count == limit:
+                break
+        return count, widths
+
+    def copy_sheet(self, title, columns, spool, count, widths):
+        last_column = column_letter(len(columns))
+        self.sheets.append((title, count + 1, last_column))
+        cols = "".join(f'<col min="{index}" max="{index}" width="{min(width + COLUMN_PADDING, column.max_width)}" '
+                       f'customWidth="1"/>'
+                       for index, (column, width) in enumerate(zip(columns, widths), start=1))
+        header = "".join(f'<c r="{column_letter(index)}1" t="inlineStr"><is><t>{escape(column.header)}</t></is></c>'
+                         for index, column in enumerate(columns, start=1))
+        with self.archive.open(f'xl/worksheets/sheet{len(self.sheets)}.xml', 'w', force_zip64=True) as part:
+            part.write((XML_DECLARATION +
+                        f'<worksheet xmlns="{MAIN_NS}" xmlns:r="{RELATIONSHIPS_NS}">'
+                        f'<dimension ref="A1:{last_column}{count + 1}"/>'
+                        '<sheetViews><sheetView workbookViewId="0">'
+                        '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+                        '<selection pane="bottomLeft" activeCell="A2" sqref="A2"/>'
+                        '</sheetView></sheetViews>'
+                        '<sheetFormatPr defaultRowHeight="15"/>'
+                        f'<cols>{cols}</cols>'
+                        f'<sheetData><row r="1">{header}</row>').encode())
+            shutil.copyfileobj(spool, part)
+            part.write(('</sheetData>'
+                        f'<autoFilter ref="A1:{last_column}{count + 1}"/>'
+                        '<pageMargins left="0.75" right="0.75" top="1" bottom="1" header="0.5" footer="0.5"/>'
+                        '</worksheet>').encode())
+
+    def close(self):
+        """Write the workbook parts that list the sheets and close the file."""
+        sheets = "".join(f'<sheet name={quoteattr(title)} sheetId="{index}" r:id="rId{index}"/>'
+                         for index, (title, _, _) in enumerate(self.sheets, start=1))
+        # the auto filter ranges, as Excel itself records them
+        filters = "".join(f'<definedName name="_xlnm._FilterDatabase" localSheetId="{index}" hidden="1">'
+                          f'{escape(quote_sheetname(title))}!$A$1:${last_column}${last_row}</definedName>'
+                          for index, (title, last_row, last_column) in enumerate(self.sheets))
+        self.archive.writestr('xl/workbook.xml', XML_DECLARATION +
+                              f'<workbook xmlns="{MAIN_NS}" xmlns:r="{RELATIONSHIPS_NS}">'
+                              f'<sheets>{sheets}</sheets><definedNames>{filters}</definedNames></workbook>')
+        relationships = "".join(f'<Relationship Id="rId{index}" Type="{RELATIONSHIPS_NS}/worksheet" '
+                                f'Target="worksheets/sheet{index}.xml"/>'
+                                for index in range(1, len(self.sheets) + 1))
+        self.archive.writestr('xl/_rels/workbook.xml.rels', XML_DECLARATION +
+                              f'<Relationships xmlns="{PACKAGE_RELATIONSHIPS_NS}">{relationships}'
+                              f'<Relationship Id="rId{len(self.sheets) + 1}" Type="{RELATIONSHIPS_NS}/styles" '
+                              'Target="styles.xml"/></Relationships>')
+        self.archive.writestr('xl/styles.xml', STYLES)
+        self.archive.writestr('_rels/.rels', XML_DECLARATION +
+                              f'<Relationships xmlns="{PACKAGE_RELATIONSHIPS_NS}">'
+                              f'<Relationship Id="rId1" Type="{RELATIONSHIPS_NS}/officeDocument" '
+                              'Target="xl/workbook.xml"/></Relationships>')
+        overrides = "".join(f'<Override PartName="/xl/worksheets/sheet{index}.xml" ContentType="{SHEET_CONTENT_TYPE}"/>'
+                            for index in range(1, len(self.sheets) + 1))
+        self.archive.writestr('[Content_Types].xml', XML_DECLARATION +
+                              f'<Types xmlns="{CONTENT_TYPES_NS}">'
+                              '<Default Extension="rels" '
+                              'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                              '<Default Extension="xml" ContentType="application/xml"/>'
+                              f'<Override PartName="/xl/workbook.xml" ContentType="{WORKBOOK_CONTENT_TYPE}"/>'
+                              '<Override PartName="/xl/styles.xml" '
+                              'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                              f'{overrides}</Types>')
+        self.archive.close()
@@ -0,0 +1,50 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Validation results as a polars DataFrame.
+
+``results_frame`` reads a SHACL validation report graph with one pass over the predicate index per column and
+returns one row per sh:ValidationResult, one column per reported predicate (the first value where a result has
+several). The reports are written from the frame, and ``summarize`` counts the results per severity, shape or any
+other column.
+"""
+
+import polars as pl
+from rdflib import RDF, SH
+
+# frame column of each result predicate
+RESULT_COLUMNS = {
+    'severity': SH.resultSeverity,
+    'focus_node': SH.focusNode,
+    'path': SH.resultPath,
+    'value': SH.value,
+    'message': SH.resultMessage,
+    'source_shape': SH.sourceShape,
+    'source_constraint_component': SH.sourceConstraintComponent,
+}
+
+
+def results_frame(results_graph):
+    """One row per validation result of the graph, the values as strings and null where a result has none."""
+    results = list(results_graph.subjects(RDF.type, SH.ValidationResult))
+    data = {}
+    for name, predicate in RESULT_COLUMNS.items():
+        # one lookup in the predicate index per column instead of one per result and predicate
+        values = {}
+        for s, o in results_graph.subject_objects(predicate):
+            if s not in values:
+                values[s] = o
+        column = []
+        for result in results:
+            value = values.get(result)
+            column.append(None if value is None else str(value))
+        data[name] = column
+    return pl.DataFrame(data, schema={name: pl.String for name in RESULT_COLUMNS})
+
+
+def summarize(frame, *by):
+    """Number of results per value (combination) of the given columns, the most frequent first."""
+    by = list(by) or ['severity']
+    counts = frame.group_by(by).agg(pl.len().alias('results'))
+    return counts.sort(['results', *by], descending=[True] + [False] * len(by), nulls_last=True)
@@ -0,0 +1,390 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Validation job queue and scheduler.
+
+Around gate closure small SSH/SV updates, full EQ re-submissions and CGM assemblies arrive together. Every model
+submitted to the queue becomes a job in one of the priority lanes ``urgent``, ``normal`` and ``bulk``; the
+scheduler validates each job in a fresh process of its own, with the parse/validate pipeline of the CLI (see
+``application.cli``), as many at a time as it has workers and the memory estimates allow:
+
+- a job is admitted when a worker is free and its estimated peak memory fits in what the running jobs leave of
+  the memory budget; jobs are taken by lane, first submitted first within a lane, and a job that does not fit
+  holds back the jobs behind it, so that a large model is not starved by smaller ones
+- one worker and a share of the memory are reserved for the urgent lane, so a small urgent job never waits for a
+  multi-GB validation to finish
+- the estimate is the size of the instance data (archives uncompressed) times the peak resident bytes per byte
+  of the store the job loads into (``MEMORY_FACTORS``), learnt from the peak memory of every finished job
+- a job whose process grows beyond the RSS cap is killed and fails; one whose process dies otherwise (killed by
+  the system, a crash of a native library) is run again up to ``retries`` times
+
+Submitted jobs are written to the ``incoming`` directory of the queue, the state of all jobs to ``state.json``
+after every change, so the queue survives restarts of the scheduler: jobs that were running are queued again. The
+queue is ``~/.modshape/queue`` or ``$MODSHAPE_QUEUE_DIR``::
+
+    python -m application.scheduler submit job.json --lane urgent
+    python -m application.scheduler run --workers 4 --memory-mb 16000 --rss-cap-mb 8000
+    python -m application.scheduler status
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import uuid
+import zipfile
+
+from application.cache import atomic_write
+from application.metrics import peak_rss_mb
+
+LANES = ('urgent', 'normal', 'bulk')
+DEFAULT_LANE = 'normal'
+# resident memory of a validation process besides the model: Python, rdflib, pySHACL, the shapes and the report
+BASE_MB = 150
+# peak resident bytes per byte of uncompressed instance data, by store, until jobs have been measured; parsing
+# alone takes about 12, 8 and 1.5 of them on the synthetic models of ``benchmarks``, validation adds to that
+MEMORY_FACTORS = {'Memory': 18.0, 'Oxigraph': 12.0, 'Compact': 6.0}
+# weight of the last finished job in the learnt factors
+FACTOR_WEIGHT = 0.3
+DEFAULT_RETRIES = 2
+# memory budget where the physical memory is not known
+DEFAULT_MEMORY_MB = 8192
+# share of the memory budget kept for the urgent lane
+URGENT_MEMORY_SHARE = 0.25
+POLL_SECONDS = 0.5
+# finished jobs kept in the state
+FINISHED_KEPT = 1000
+MEGABYTE = 1024 * 1024
+
+
+def queue_dir():
+    path = os.environ.get('MODSHAPE_QUEUE_DIR') or os.path.join(os.path.expanduser('~'), '.modshape', 'queue')
+    os.makedirs(os.path.join(path, 'incoming'), exist_ok=True)
+    return path
+
+
+def default_memory_mb():
+    # 80% of the physical memory
+    try:
+        return int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') * 0.8 // MEGABYTE)
+    except (AttributeError, ValueError, OSError):
+        return DEFAULT_MEMORY_MB  # Windows
+
+
+def process_rss_mb(pid):
+    # current resident memory of a process; None where /proc is not available
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def instance_bytes(file_paths):
+    """Size of the instance data, archive members uncompressed."""
+    total = 0
+    for path in file_paths:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                total += sum(member.file_size for member in archive.infolist())
+        else:
+            total += os.path.getsize(path)
+    return total
+
+
+def submit(job_file, lane=DEFAULT_LANE, directory=None):
+    """Queue every model of a job file in a lane; the IDs of the new jobs."""
+    from application.cli import load_job
+
+    if lane not in LANES:
+        raise ValueError(f"Unknown lane {lane!r}, one of {LANES}")
+    job = load_job(job_file)
+    settings = {key: value for key, value in job.items() if key != 'models'}
+    incoming = os.path.join(directory or queue_dir(), 'incoming')
+    ids = []
+    for model in job['models']:
+        # IDs sort in the order of submission
+        job_id = f"{time.time_ns():x}-{uuid.uuid4().hex[:6]}"
+        record = {'id': job_id, 'lane': lane, 'state': 'queued', 'name': model['name'], 'model': model,
+                  'job': settings, 'bytes': instance_bytes(model['instance_data'] + model['difference_models']),
+                  'attempts': 0, 'submitted': time.time()}
+        atomic_write(os.path.join(incoming, f"{job_id}.json"), json.dumps(record).encode())
+        ids.append(job_id)
+    return ids
+
+
+def run_in_process(job, model, connection):
+    # the CLI pipeline in a fresh process: load the datatype mapping and the shapes, validate, write the report
+    from application import cli
+
+    try:
+        cli.init_validator(job['datatype_mapping'], job['shacl'], *cli.validator_options(job))
+        result = cli.validate_model(model)
+        result['peak_rss_mb'] = peak_rss_mb()
+        connection.send(('done', result))
+    except Exception as e:
+        connection.send(('error', f"{type(e).__name__}: {e}"))
+    finally:
+        connection.close()
+
+
+class RunningJob:
+    """The process of a job, its end of the result pipe and the largest resident memory seen."""
+
+    def __init__(self, record, process, connection, admitted_mb):
+        self.record = record
+        self.process = process
+        self.connection = connection
+        # memory the job was admitted with: its estimate, or the budget of its lane if that is less
+        self.admitted_mb = admitted_mb
+        self.rss_mb = 0
+        self.message = None
+
+    def receive(self):
+        # the answer of the process, if it has sent it; a process that died closes the pipe without one
+        if self.message is None and self.connection.poll():
+            try:
+                self.message = self.connection.recv()
+            except EOFError:
+                pass
+
+
+class Scheduler:
+    """Admits, runs and supervises the jobs of a queue directory, see the module documentation."""
+
+    def __init__(self, directory=None, workers=1, memory_mb=None, rss_cap_mb=None, retries=DEFAULT_RETRIES):
+        self.directory = directory or queue_dir()
+        self.workers = workers
+        self.memory_mb = memory_mb or default_memory_mb()
+        self.rss_cap_mb = rss_cap_mb
+        self.retries = retries
+        # the urgent lane keeps one worker and a share of the memory where there is more than one worker
+        self.reserved_workers = 1 if workers > 1 else 0
+        self.reserved_mb = int(self.memory_mb * URGENT_MEMORY_SHARE) if workers > 1 else 0
+        self.context = multiprocessing.get_context('spawn')
+        self.running = {}
+        self.jobs = {}
+        # jobs failed since the start
+        self.failed = 0
+        self.factors = dict(MEMORY_FACTORS)
+        self.load()
+
+    @property
+    def state_path(self):
+        return os.path.join(self.directory, 'state.json')
+
+    def load(self):
+        try:
+            with open(self.state_path) as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return
+        self.factors.update(state.get('factors', {}))
+        for record in state.get('jobs', []):
+            if record['state'] == 'running':
+                record['state'] = 'queued'  # the scheduler stopped, not the job
+            self.jobs[record['id']] = record
+
+    def save(self):
+        finished = [record for record in self.jobs.values() if record['state'] in ('done', 'failed')]
+        for record in finished[:-FINISHED_KEPT]:
+            del self.jobs[record['id']]
+        state = {'factors': self.factors, 'jobs': list(self.jobs.values())}
+        atomic_write(self.state_path, json.dumps(state, indent=1).encode())
+
+    def incoming(self):
+        # (path, job) of the jobs submitted since the last look
+        incoming = os.path.join(self.directory, 'incoming')
+        for name in sorted(os.listdir(incoming)):
+            if name.endswith('.json'):
+                path = os.path.join(incoming, name)
+                with open(path) as file:
+                    yield path, json.load(file)
+
+    def collect(self):
+        # the files of submitted jobs go once the state that holds them is saved
+        paths = []
+        for path, record in self.incoming():
+            self.jobs.setdefault(record['id'], record)
+            paths.append(path)
+        if paths:
+            self.save()
+            for path in paths:
+                os.remove(path)
+
+    def estimate_mb(self, record):
+        store = record['job'].get('store', 'Memory')
+        factor = self.factors.get(store, MEMORY_FACTORS['Memory'])
+        return BASE_MB + record['bytes'] * factor / MEGABYTE
+
+    def queued(self):
+        jobs = [record for record in self.jobs.values() if record['state'] == 'queued']
+        return sorted(jobs, key=lambda record: (LANES.index(record['lane']), record['id']))
+
+    def used_mb(self):
+        # a running job counts with what it was admitted with, or with what it already uses if that is more
+        return sum(max(job.admitted_mb, job.rss_mb) for job in self.running.values())
+
+    def admit(self):
+        used_mb = self.used_mb()
+        for record in self.queued():
+            if record['lane'] == LANES[0]:
+                workers, memory_mb = self.workers, self.memory_mb
+            else:
+                workers, memory_mb = self.workers - self.reserved_workers, self.memory_mb - self.reserved_mb
+            if len(self.running) >= workers:
+                break  # the urgent jobs come first, what follows needs a worker of the lanes below
+            # a job estimated beyond the whole budget runs alone
+            needed_mb = min(self.estimate_mb(record), memory_mb)
+            if self.running and used_mb + needed_mb > memory_mb:
+                break  # the jobs behind it wait with it
+            self.start(record, needed_mb)
+            used_mb += needed_mb
+
+    def start(self, record, admitted_mb):
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(target=run_in_process, args=(record['job'], record['model'], sender),
+                                       name=f"modshape-{record['id']}", daemon=True)
+        process.start()
+        sender.close()
+        record.update(state='running', started=time.time(), attempts=record['attempts'] + 1)
+        self.running[record['id']] = RunningJob(record, process, receiver, admitted_mb)
+        self.save()
+        print(f"{record['name']} ({record['lane']}, {self.estimate_mb(record):.0f} MB estimated): started", flush=True)
+
+    def poll(self):
+        for job_id, job in list(self.running.items()):
+            job.receive()
+            rss_mb = process_rss_mb(job.process.pid)
+            if rss_mb is not None:
+                job.rss_mb = max(job.rss_mb, rss_mb)
+                if self.rss_cap_mb and rss_mb > self.rss_cap_mb and job.process.is_alive():
+                    job.process.kill()
+                    job.message = ('error', f"Killed at {rss_mb:.0f} MB resident, above the cap of "
+                                            f"{self.rss_cap_mb} MB")
+            if job.process.is_alive():
+                continue
+            job.process.join()
+            job.receive()
+            job.connection.close()
+            del self.running[job_id]
+            self.finish(job)
+
+    def finish(self, job):
+        record = job.record
+        record['finished'] = time.time()
+        record['rss_mb'] = round(job.rss_mb, 1)
+        if job.message is None:
+            # the process died without an answer
+            error = f"The validation process exited with code {job.process.exitcode}"
+            if record['attempts'] <= self.retries:
+                record.update(state='queued', error=error)
+                print(f"{record['name']}: {error}, queued again", flush=True)
+                self.save()
+                return
+            record.update(state='failed', error=error)
+            self.failed += 1
+        elif job.message[0] == 'error':
+            record.update(state='failed', error=job.message[1])
+            self.failed += 1
+        else:
+            result = job.message[1]
+            record.update(state='done', error=None, result=result)
+            self.learn(record, result.get('peak_rss_mb') or job.rss_mb)
+        print(f"{record['name']}: {record['state']} {record.get('error') or ''}".rstrip(), flush=True)
+        self.save()
+
+    def learn(self, record, peak_mb):
+        # small models say little about the memory per byte
+        if not peak_mb or record['bytes'] < 16 * MEGABYTE:
+            return
+        store = record['job'].get('store', 'Memory')
+        factor = max(peak_mb - BASE_MB, 0) * MEGABYTE / record['bytes']
+        old = self.factors.get(store, MEMORY_FACTORS['Memory'])
+        self.factors[store] = round((1 - FACTOR_WEIGHT) * old + FACTOR_WEIGHT * factor, 2)
+
+    def run(self, keep_running=False):
+        """Run the queue until it is empty, or until interrupted with ``keep_running``."""
+        try:
+            while True:
+                self.collect()
+                self.poll()
+                self.admit()
+                if not keep_running and not self.running and not self.queued():
+                    return
+                time.sleep(POLL_SECONDS)
+        finally:
+            self.stop()
+
+    def stop(self):
+        # jobs cut short are run again by the next scheduler
+        for job in self.running.values():
+            job.process.kill()
+            job.process.join()
+            job.record.update(state='queued', attempts=job.record['attempts'] - 1)
+        self.running = {}
+        self.save()
+
+
+def print_status(directory=None):
+    directory = directory or queue_dir()
+    scheduler = Scheduler(directory)
+    jobs = list(scheduler.jobs.values()) + [record for _, record in scheduler.incoming()]
+    for record in jobs:
+        detail = record.get('error') or ''
+        if record['state'] == 'done':
+            detail = f"conforms={record['result']['conforms']} report={record['result']['report']}"
+        print(f"{record['id']} {record['lane']:6} {record['state']:7} {record['name']} "
+              f"~{scheduler.estimate_mb(record):.0f} MB attempts={record['attempts']} {detail}".rstrip())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="modshape-scheduler", description="Queue and run validation jobs.")
+    parser.add_argument("--queue-dir", help="directory of the queue (default: $MODSHAPE_QUEUE_DIR or "
+                                            "~/.modshape/queue)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    submit_parser = commands.add_parser("submit", help="queue the models of job files")
+    submit_parser.add_argument("jobs", nargs="+", help="JSON job descriptions, see application.cli")
+    submit_parser.add_argument("--lane", choices=LANES, default=DEFAULT_LANE, help="priority lane (default: normal)")
+    run_parser = commands.add_parser("run", help="run the queued jobs")
+    run_parser.add_argument("-w", "--workers", type=int, default=1, help="jobs run at the same time (default: 1)")
+    run_parser.add_argument("--memory-mb", type=int,
+                            help="memory budget of the running jobs (default: 80%% of the physical memory)")
+    run_parser.add_argument("--rss-cap-mb", type=int, help="kill a job whose process grows beyond this")
+    run_parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                            help=f"runs again of a job whose process died (default: {DEFAULT_RETRIES})")
+    run_parser.add_argument("--keep-running", action="store_true",
+                            help="wait for new jobs when the queue is empty, until interrupted")
+    commands.add_parser("status", help="list the jobs of the queue")
+    args = parser.parse_args(argv)
+
+    directory = args.queue_dir
+    if directory:
+        os.makedirs(os.path.join(directory, 'incoming'), exist_ok=True)
+    if args.command == "submit":
+        for job_file in args.jobs:
+            for job_id in submit(job_file, args.lane, directory):
+                print(job_id)
+    elif args.command == "run":
+        scheduler = Scheduler(directory, args.workers, args.memory_mb, args.rss_cap_mb, args.retries)
+        # stopped like interrupted: the running jobs are queued again
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+        try:
+            scheduler.run(args.keep_running)
+        except KeyboardInterrupt:
+            pass
+        return 1 if scheduler.failed else 0
+    else:
+        print_status(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,408 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Long-running validation service.
+
+Every validation started from the GUI or the CLI first loads the datatype mapping and the shapes. The service
+loads them once: it is started with one or more job files (see ``application.cli``) as named shape bundles, and
+every process of its worker pool loads the datatype mapping and compiles the shapes of each bundle when it starts,
+and parses the ``boundary`` files of a bundle once to keep them resident (see ``application.assembly``). Requests
+are served by an asyncio HTTP server on a TCP port or a Unix socket; the validations run in the worker pool, so
+the event loop only ever reads requests and writes results::
+
+    python -m application.service qocdc=job.json --workers 4 --port 8765
+    python -m application.service job.json --socket /run/modshape.sock
+
+``GET /status`` describes the bundles and the jobs running. ``POST /validate`` validates models, either a JSON
+job of instance files on the host of the service::
+
+    {"bundle": "qocdc", "models": [{"name": "IGM_A", "instance_data": ["A.zip"], "report": "A.xlsx"}]}
+
+or an uploaded archive or file, the request body, described by the query: ``/validate?bundle=qocdc&name=IGM_A
+&filename=A.zip``. ``bundle`` may be left out when the service has only one, ``report`` writes an Excel report on
+the host, and ``results=false`` leaves out the results. Clients only reach the host's files below the directories
+the service is started with: instance files are read below ``--data-dir`` and reports written below
+``--output-dir``, paths being relative to them. A path that leaves its directory is refused, and so are host
+files and reports if the service has no such directory. The response is streamed as JSON lines while the models
+are validated, concurrently when the pool has several workers: each validation result of a model (``"type":
+"result"``), then its summary (``"model"``, or ``"error"`` if it failed), and a ``"done"`` line at the end::
+
+    curl --data-binary @A.zip 'http://localhost:8765/validate?bundle=qocdc&filename=A.zip'
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from application.cli import create_validator, load_job, severity_counts, validator_options
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+# uploads are read from the socket in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20
+FALSE_VALUES = ('0', 'false', 'no')
+
+# shape bundles of the current worker process: name: (validator, assembly with the boundary set or None)
+_bundles = {}
+
+
+def init_worker(bundles):
+    from application.assembly import ModelAssembly
+
+    for name, job in bundles.items():
+        validator = create_validator(job['datatype_mapping'], job['shacl'], *validator_options(job))
+        assembly = None
+        if job.get('boundary'):
+            assembly = ModelAssembly(validator)
+            assembly.load_boundary(job['boundary'])
+        _bundles[name] = validator, assembly
+
+
+def worker_ready():
+    return os.getpid()
+
+
+def validate_model(bundle, model, with_results=True):
+    """Summary of the validation of a model in a worker process, with its results as dicts if asked for."""
+    from application.results import results_frame
+
+    validator, assembly = _bundles[bundle]
+    start_time = time.time()
+    if assembly is None:
+        validator.reset_instance_data()
+        try:
+            validator.load_instance_data(model['instance_data'])
+            conforms, results_graph, _ = validator.validate()
+        finally:
+            validator.reset_instance_data()
+    else:
+        # the model together with the resident boundary set
+        assembly.load_member(model['name'], model['instance_data'])
+        try:
+            view = assembly.union([model['name']])
+            conforms, results_graph, _ = validator.validate(view, validator.compiled_shapes, view.histogram)
+        finally:
+            assembly.remove_member(model['name'])
+    results = results_frame(results_graph)
+    if model.get('report'):
+        os.makedirs(os.path.dirname(model['report']) or '.', exist_ok=True)
+        validator.write_excel_report(results, model['report'])
+    validator.metrics.finish(model=model['name'], conforms=conforms, report=model.get('report'))
+    return {'type': 'model', 'name': model['name'], 'conforms': conforms, 'report': model.get('report'),
+            'severities': severity_counts(results), 'pruned_shapes': len(validator.pruned_shapes),
+            'time': time.time() - start_time, 'results': results.to_dicts() if with_results else []}
+
+
+class RequestError(Exception):
+    """A request the service cannot serve, answered with its HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def confined_path(directory, path, option):
+    """``path`` relative to ``directory``, which it may not leave; ``option`` configures the directory."""
+    if directory is None:
+        raise RequestError(HTTPStatus.FORBIDDEN, f"The service was started without {option}")
+    if not isinstance(path, str) or not path:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Invalid path {path!r}")
+    # symbolic links are resolved, so that none leads out either
+    resolved = os.path.realpath(os.path.join(directory, path))
+    if os.path.commonpath([resolved, directory]) != directory:
+        raise RequestError(HTTPStatus.FORBIDDEN, f"{path} is outside the {option} of the service")
+    return resolved
+
+
+def read_models(models, data_dir, output_dir):
+    # the models of a JSON job: paths on the host of the service, relative to its data directory
+    if not isinstance(models, list) or not models:
+        raise RequestError(HTTPStatus.BAD_REQUEST, "A job needs a non-empty list of 'models'")
+    result = []
+    for model in models:
+        if isinstance(model, str):
+            model = {'instance_data': [model]}
+        if not isinstance(model, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "A model is a file name or an object")
+        instance_data = [confined_path(data_dir, path, '--data-dir') for path in model.get('instance_data', [])]
+        if not instance_data:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "A model needs 'instance_data'")
+        for path in instance_data:
+            if not os.path.isfile(path):
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"No such file: {path}")
+        name = model.get('name') or os.path.splitext(os.path.basename(instance_data[0]))[0]
+        report = model.get('report')
+        result.append({'name': name, 'instance_data': instance_data,
+                       'report': confined_path(output_dir, report, '--output-dir') if report else None})
+    return result
+
+
+class ValidationService:
+    """The bundles, the worker pool and the request handler, see the module documentation."""
+
+    def __init__(self, bundles, workers=1, data_dir=None, output_dir=None):
+        # name: job description of the bundle, as read by load_job
+        self.bundles = bundles
+        self.workers = workers
+        # the directories below which clients name instance files and reports, None allows none
+        self.data_dir = os.path.realpath(data_dir) if data_dir else None
+        self.output_dir = os.path.realpath(output_dir) if output_dir else None
+        self.executor = None
+        self.upload_dir = None
+        # models waiting for or being validated, and validated since the start
+        self.pending = 0
+        self.completed = 0
+
+    def create_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(self.bundles,))
+
+    async def start(self):
+        self.upload_dir = tempfile.mkdtemp(prefix='modshape-uploads-')
+        self.executor = self.create_executor()
+        # the workers load the bundles before the first request is accepted
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, worker_ready) for _ in range(self.workers)))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+        if self.upload_dir is not None:
+            shutil.rmtree(self.upload_dir, ignore_errors=True)
+
+    def status(self):
+        return {'workers': self.workers, 'pending': self.pending, 'completed': self.completed,
+                'bundles': {name: {'shacl': job['shacl'], 'datatype_mapping': job['datatype_mapping'],
+                                   'boundary': job.get('boundary', []), 'store': job.get('store', 'Memory'),
+                                   'parser': job.get('parser', 'sax')} for name, job in self.bundles.items()}}
+
+    def bundle_name(self, name):
+        if name is None and len(self.bundles) == 1:
+            return next(iter(self.bundles))
+        if name not in self.bundles:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"Unknown bundle {name!r}, one of {sorted(self.bundles)}")
+        return name
+
+    async def handle(self, reader, writer):
+        # one request per connection
+        upload = None
+        try:
+            try:
+                method, target, headers = await read_request_head(reader)
+                url = urlsplit(target)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                if url.path == '/status' and method == 'GET':
+                    await write_response(writer, HTTPStatus.OK, self.status())
+                    return
+                if url.path != '/validate':
+                    raise RequestError(HTTPStatus.NOT_FOUND, f"No such resource: {url.path}")
+                if method != 'POST':
+                    raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, "Validation jobs are POSTed")
+                if headers.get('content-type', '').split(';')[0].strip() == 'application/json':
+                    try:
+                        job = json.loads(await read_body(reader, headers))
+                    except ValueError as e:
+                        raise RequestError(HTTPStatus.BAD_REQUEST, f"Invalid JSON job: {e}")
+                    if not isinstance(job, dict):
+                        raise RequestError(HTTPStatus.BAD_REQUEST, "A JSON job is an object")
+                    bundle = self.bundle_name(job.get('bundle'))
+                    models = read_models(job.get('models'), self.data_dir, self.output_dir)
+                    with_results = job.get('results', True)
+                else:
+                    bundle = self.bundle_name(query.get('bundle'))
+                    filename = os.path.basename(query.get('filename', 'model.zip'))
+                    if filename in ('', '.', '..'):
+                        raise RequestError(HTTPStatus.BAD_REQUEST, f"Invalid file name {query['filename']!r}")
+                    report = query.get('report')
+                    report = confined_path(self.output_dir, report, '--output-dir') if report else None
+                    upload = tempfile.mkdtemp(dir=self.upload_dir)
+                    await save_body(reader, headers, os.path.join(upload, filename))
+                    models = [{'name': query.get('name') or os.path.splitext(filename)[0],
+                               'instance_data': [os.path.join(upload, filename)], 'report': report}]
+                    with_results = query.get('results', 'true').lower() not in FALSE_VALUES
+            except RequestError as e:
+                await write_response(writer, e.status, {'type': 'error', 'error': str(e)})
+                return
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as e:
+                logger.exception("Failed to read the request")
+                await write_response(writer, HTTPStatus.INTERNAL_SERVER_ERROR,
+                                     {'type': 'error', 'error': f"{type(e).__name__}: {e}"})
+                return
+            await self.stream_job(writer, bundle, models, with_results)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # the client went away
+        except Exception:
+            # the response has started, the client sees it end early
+            logger.exception("Failed to stream the results")
+        finally:
+            if upload is not None:
+                shutil.rmtree(upload, ignore_errors=True)
+            writer.close()
+
+    async def run_model(self, bundle, model, with_results):
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        self.pending += 1
+        try:
+            return await loop.run_in_executor(executor, validate_model, bundle, model, with_results)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool) and executor is self.executor:
+                # a worker died, out of memory most likely; the next jobs go to a new pool
+                self.executor = self.create_executor()
+                executor.shutdown(wait=False)
+            return {'type': 'error', 'name': model['name'], 'error': f"{type(e).__name__}: {e}"}
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    async def stream_job(self, writer, bundle, models, with_results):
+        # the models are queued at once and reported in the order they finish
+        tasks = [asyncio.ensure_future(self.run_model(bundle, model, with_results)) for model in models]
+        try:
+            await write_stream_head(writer)
+            await write_chunk(writer, {'type': 'accepted', 'bundle': bundle, 'models': [m['name'] for m in models]})
+            conforms = True
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                conforms = conforms and result.get('conforms', False)
+                for row in result.pop('results', []):
+                    await write_chunk(writer, {'type': 'result', 'model': result['name'], **row})
+                await write_chunk(writer, result)
+            await write_chunk(writer, {'type': 'done', 'conforms': conforms})
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        finally:
+            # uploads are removed only once no worker reads them any more
+            await asyncio.gather(*tasks)
+
+
+async def read_request_head(reader):
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    try:
+        method, target, _ = request_line.split(' ', 2)
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Malformed request line {request_line!r}")
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1')
+        if not line.strip():
+            break
+        key, _, value = line.partition(':')
+        headers[key.strip().lower()] = value.strip()
+    return method.upper(), target, headers
+
+
+def content_length(headers):
+    try:
+        return int(headers['content-length'])
+    except (KeyError, ValueError):
+        raise RequestError(HTTPStatus.LENGTH_REQUIRED, "The request needs a Content-Length")
+
+
+async def read_body(reader, headers):
+    return await reader.readexactly(content_length(headers))
+
+
+async def save_body(reader, headers, path):
+    remaining = content_length(headers)
+    with open(path, 'wb') as file:
+        while remaining:
+            chunk = await reader.readexactly(min(remaining, UPLOAD_CHUNK_SIZE))
+            file.write(chunk)
+            remaining -= len(chunk)
+
+
+async def write_response(writer, status, body):
+    data = json.dumps(body, default=str).encode() + b'\n'
+    writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+    await writer.drain()
+
+
+async def write_stream_head(writer):
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n"
+                 b"Connection: close\r\n\r\n")
+    await writer.drain()
+
+
+async def write_chunk(writer, record):
+    # one JSON line per chunk, so clients see every record as soon as it is written
+    data = json.dumps(record, default=str).encode() + b'\n'
+    writer.write(b'%X\r\n%s\r\n' % (len(data), data))
+    await writer.drain()
+
+
+async def serve(service, host='127.0.0.1', port=DEFAULT_PORT, socket_path=None):
+    await service.start()
+    try:
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)  # left behind by a service that was killed
+            server = await asyncio.start_unix_server(service.handle, path=socket_path)
+            address = socket_path
+        else:
+            server = await asyncio.start_server(service.handle, host, port)
+            address = f"http://{host}:{port}"
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C interrupts the loop instead
+        print(f"Validating with {', '.join(service.bundles)} on {address}, {service.workers} worker(s)", flush=True)
+        async with server:
+            await stop.wait()
+    finally:
+        service.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def parse_bundle(argument):
+    # NAME=JOB_FILE, or a job file named after its file name
+    name, separator, job_file = argument.partition('=')
+    if not separator:
+        name, job_file = os.path.splitext(os.path.basename(argument))[0], argument
+    return name, load_job(job_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="modshape-service",
+                                     description="Serve validations with shapes and datatype mappings kept loaded.")
+    parser.add_argument("bundles", nargs="+", metavar="[NAME=]JOB",
+                        help="job files with the datatype mapping, shapes, boundary set and options of a bundle")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="models validated in parallel (default: 1)")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--socket", metavar="PATH", help="listen on this Unix socket instead of a TCP port")
+    parser.add_argument("--data-dir", metavar="DIR",
+                        help="directory of the instance files JSON jobs name (default: none can be named)")
+    parser.add_argument("--output-dir", metavar="DIR", help="directory reports are written to (default: no reports)")
+    args = parser.parse_args(argv)
+
+    service = ValidationService(dict(parse_bundle(argument) for argument in args.bundles), args.workers,
+                                args.data_dir, args.output_dir)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Compiled SHACL shapes, cached on disk.
+
+Loading the QoCDC shapes means parsing some 80 thousand Turtle triples, following their owl:imports and, with
+native SPARQL, compiling the sh:sparql constraints. ``load_compiled_shapes`` does this once per set of shape
+files and stores the result below ``cache_dir('shapes')``, keyed by the content hash of the shape files and of
+the import catalogs they are loaded with; the imported files, and catalogs found next to them, are recorded with
+their own hashes and checked on every hit. The graph is stored dictionary encoded (a term table plus integer
+triples), which loads several times faster than a pickled rdflib graph.
+The cache is bounded to ``$MODSHAPE_SHAPES_CACHE_MB`` megabytes (256 by default); least recently used entries
+are evicted first.
+
+pySHACL's harvested ``ShapesGraph`` is not stored: rebuilding its Shape objects from the graph is cheaper than
+unpickling them. ``CompiledShapes.shapes_graph`` harvests them once per process and reuses them for every
+validation.
+"""
+
+import os
+import pickle
+from array import array
+
+from pyshacl import ShapesGraph
+from rdflib import BNode, Graph, Literal, URIRef
+
+from application.cache import atomic_write, cache_dir, evict, file_digest, files_digest, touch
+from application.sparqlconstraints import SPARQLConstraintSet
+
+# bump when the cached format changes
+CACHE_VERSION = 4
+DEFAULT_CACHE_MB = 256
+
+URI, BLANK, LITERAL = 0, 1, 2
+
+
+class TermTable:
+    """Index of the distinct terms of triples, in the form ``decode_terms`` turns back into terms."""
+
+    def __init__(self):
+        self.index = {}
+        self.terms = []
+
+    def id(self, term):
+        i = self.index.get(term)
+        if i is None:
+            i = self.index[term] = len(self.terms)
+            if isinstance(term, Literal):
+                datatype = str(term.datatype) if term.datatype is not None else None
+                self.terms.append((LITERAL, str(term), datatype, term.language))
+            elif isinstance(term, BNode):
+                self.terms.append((BLANK, str(term)))
+            else:
+                self.terms.append((URI, str(term)))
+        return i
+
+
+def decode_terms(terms):
+    nodes = []
+    for term in terms:
+        kind = term[0]
+        if kind == LITERAL:
+            datatype = URIRef(term[2]) if term[2] is not None else None
+            nodes.append(Literal(term[1], lang=term[3], datatype=datatype))
+        elif kind == BLANK:
+            nodes.append(BNode(term[1]))
+        else:
+            nodes.append(URIRef(term[1]))
+    return nodes
+
+
+def encode_triples(triples, namespaces=()):
+    """Term table and flat array of term indices of triples, the compact form the caches store."""
+    table = TermTable()
+    term_id = table.id
+    ids = array('l')
+    for s, p, o in triples:
+        ids.extend((term_id(s), term_id(p), term_id(o)))
+    return table.terms, ids.tobytes(), [(prefix, str(namespace)) for prefix, namespace in namespaces]
+
+
+def decode_triples(encoded):
+    """Triples and namespaces of ``encode_triples`` output; every distinct term is built once."""
+    terms, ids_bytes, namespaces = encoded
+    nodes = decode_terms(terms)
+    ids = array('l')
+    ids.frombytes(ids_bytes)
+    triples = [(nodes[ids[i]], nodes[ids[i + 1]], nodes[ids[i + 2]]) for i in range(0, len(ids), 3)]
+    return triples, namespaces
+
+
+def encode_graph(graph):
+    return encode_triples(graph, graph.namespaces())
+
+
+def decode_graph(encoded):
+    triples, namespaces = decode_triples(encoded)
+    graph = Graph()
+    for prefix, namespace in namespaces:
+        graph.bind(prefix, namespace, override=True, replace=True)
+    graph.addN((s, p, o, graph) for s, p, o in triples)
+    return graph
+
+
+class CompiledShapes:
+    """
+    The shapes graph pySHACL validates against, with everything derived from it.
+
+    With native SPARQL, ``graph`` is the core shapes graph without the constraints ``sparql_constraints`` runs
+    on Oxigraph. ``imports`` lists the (path, digest) of every file pulled in through owl:imports.
+    """
+
+    def __init__(self, graph, imports=(), sparql_constraints=None):
+        self.graph = graph
+        self.imports = list(imports)
+        self.sparql_constraints = sparql_constraints
+        self._shapes_graph = None
+
+    @property
+    def shapes_graph(self):
+        # harvested by pySHACL on first use, then shared by all validations of this process
+        if self._shapes_graph is None:
+            self._shapes_graph = ShapesGraph(self.graph)
+        return self._shapes_graph
+
+    def imports_current(self):
+        for path, digest in self.imports:
+            try:
+                if file_digest(path) != digest:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def dumps(self):
+        constraints = self.sparql_constraints.constraints if self.sparql_constraints is not None else None
+        return pickle.dumps((encode_graph(self.graph), self.imports, constraints),
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def loads(cls, data):
+        encoded, imports, constraints = pickle.loads(data)
+        graph = decode_graph(encoded)
+        sparql_constraints = SPARQLConstraintSet(graph, constraints) if constraints is not None else None
+        return cls(graph, imports, sparql_constraints)
+
+
+def max_cache_bytes():
+    return int(float(os.environ.get('MODSHAPE_SHAPES_CACHE_MB', DEFAULT_CACHE_MB)) * 1024 * 1024)
+
+
+def load_compiled_shapes(files, read, native_sparql=False, use_cache=True, key=(), catalogs=()):
+    """
+    Compiled shapes of the given files.
+
+    ``read(files)`` parses the files and returns the merged shapes graph and the local files it was read from,
+    imports included; it is only called when there is no valid cache entry. ``key`` is extra cache key material,
+    and the content of the import ``catalogs`` is hashed into the key with the files.
+    """
+    cache_file = None
+    if use_cache:
+        digest = files_digest(list(files) + list(catalogs), CACHE_VERSION, native_sparql, *key)
+        cache_file = os.path.join(cache_dir('shapes'), f"{digest}.pickle")
+
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as file:
+                compiled = CompiledShapes.loads(file.read())
+            if compiled.imports_current():
+                touch(cache_file)
+                return compiled
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            pass  # corrupt entry, rebuild it below
+
+    graph, import_paths = read(files)
+    imports = [(path, file_digest(path)) for path in dict.fromkeys(import_paths)]
+    if native_sparql:
+        sparql_constraints = SPARQLConstraintSet.from_shapes(graph)
+        compiled = CompiledShapes(sparql_constraints.core_shapes_graph, imports, sparql_constraints)
+    else:
+        compiled = CompiledShapes(graph, imports)
+
+    if cache_file:
+        atomic_write(cache_file, compiled.dumps())
+        evict(os.path.dirname(cache_file), max_cache_bytes(), keep=(cache_file,))
+    return compiled
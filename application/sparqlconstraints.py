@@ -0,0 +1,564 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+SHACL-SPARQL constraints evaluated on Oxigraph's native SPARQL engine.
+
+pySHACL runs every ``sh:sparql`` constraint through rdflib's SPARQL engine once per focus node, with ``$this``
+pre-bound. ``SPARQLConstraintSet`` takes the constraints of targeted shapes out of the shapes graph, and rewrites
+each of them into a single query that joins the shape's targets in as ``$this``, so one native query covers all
+focus nodes. The results are turned into the same ``sh:ValidationResult`` entries pySHACL would produce and merged
+into its report with ``merge_results``.
+
+The rewrite is only applied where joining the focus nodes in is equivalent to pre-binding ``$this``; anything else
+(``$this`` in a filter of a group that does not bind it, top level LIMIT, aggregation that is not grouped by
+``$this``, SPARQL-based targets, shapes used through sh:node/sh:and/... , ``$shapesGraph``, ...) stays in the
+shapes graph and is validated by pySHACL as before.
+"""
+
+import re
+
+import pyoxigraph
+from pyshacl.rdfutil import clone_blank_node, stringify_node
+from rdflib import BNode, Graph, Literal, RDF, RDFS, URIRef
+from rdflib.namespace import OWL, SH
+
+from application.oxigraphstore import OxigraphStore, from_oxigraph, graph_name, to_oxigraph
+
+# prefixes pySHACL declares for every SPARQL constraint
+DEFAULT_PREFIXES = {'rdf': str(RDF), 'rdfs': str(RDFS), 'owl': str(OWL)}
+# a shape that is the object of one of these is also validated inside other constraints
+NESTED_SHAPE_PREDICATES = (SH.node, SH['not'], SH.qualifiedValueShape, RDF.first)
+SEVERITY_LABELS = {SH.Violation: "Constraint Violation"}
+
+PATH_VARIABLE = re.compile(r"([\s{}()])[$?]PATH")
+MESSAGE_VARIABLE = "{{[?$]{}}}"
+# the subquery that joins the focus nodes of the shape into a rewritten constraint
+TARGETS_SELECT = "{ SELECT DISTINCT ?this WHERE { "
+TOKENS = re.compile(r'''
+      (?P<comment>\#[^\n]*)
+    | (?P<string>"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\'
+                 |"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+    | (?P<iri><[^<>"{}|^`\\\s]*>)
+    | (?P<this>[?$]this\b)
+    | (?P<variable>[?$]\w+)
+    | (?P<word>[A-Za-z_][\w\-]*(?::[\w\-.]*)?|:[\w\-.]*)
+    | (?P<punct>[{}()*])
+''', re.VERBOSE)
+AGGREGATES = {'COUNT', 'SUM', 'MIN', 'MAX', 'AVG', 'SAMPLE', 'GROUP_CONCAT'}
+# pySHACL refuses constraints using these, or does not support them
+UNSUPPORTED_VARIABLES = re.compile(r"[?$](shapesGraph|currentShape)\b")
+UNSUPPORTED_KEYWORDS = {'VALUES', 'MINUS', 'SERVICE', 'LIMIT', 'OFFSET'}
+# tokens of the expressions in a query, for chains_operators; comments and ^^ are skipped
+EXPRESSION_TOKENS = re.compile(r'''
+      (?P<skip>\#[^\n]*|\^\^)
+    | (?P<string>(?:"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\'
+                 |"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')(?:@[\w\-]+)?)
+    | (?P<iri><[^<>"{}|^`\\\s]*>)
+    | (?P<variable>[?$]\w+)
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<word>[A-Za-z_][\w\-]*(?::[\w\-.]*)?|:[\w\-.]*)
+    | (?P<operator>&&|\|\||!=|<=|>=|\S)
+''', re.VERBOSE)
+# words that end an arithmetic expression like a comparison does
+EXPRESSION_KEYWORDS = {'AS', 'IN', 'NOT'}
+
+
+class _Group:
+    def __init__(self, kind, parent, projects_this=False):
+        self.kind = kind
+        self.parent = parent
+        self.projects_this = projects_this
+        self.binds_this = False
+
+    def this_bound(self):
+        # is $this bound when a filter of this group is evaluated, once the focus nodes are joined into the
+        # top level group?
+        if self.kind == 'where' or self.binds_this:
+            return True
+        if self.kind in ('exists', 'optional'):
+            return self.parent.this_bound()
+        return False
+
+
+def rewrite_points(select):
+    """
+    Where the focus nodes can be joined into a SELECT query.
+
+    Returns ``(where, projection)``: the offset just inside the top level WHERE group, and the offset after
+    ``SELECT [DISTINCT|REDUCED]`` where ``?this`` has to be added to the projection, or None if it is projected
+    already. Returns None if joining the focus nodes in is not equivalent to pre-binding ``$this``.
+    """
+    stack = []  # open groups and parentheses
+    expression_uses = []  # groups of filters and expressions referring to $this
+    where = projection = None
+    projected = aggregated = grouped = group_by_this = False
+    next_kind = None
+    select_projects_this = False
+    in_select_clause = False
+    top_closed = False
+
+    for match in TOKENS.finditer(select):
+        kind = match.lastgroup
+        token = match.group()
+        if kind in ('comment', 'string', 'iri', 'variable'):
+            continue
+
+        group = next((frame for frame in reversed(stack) if frame != '('), None)
+        if kind == 'this':
+            if group is None:
+                if in_select_clause and not stack:
+                    projected = True
+                elif top_closed and grouped:
+                    group_by_this = True
+                continue
+            if in_select_clause:
+                select_projects_this = True
+                continue
+            chain = group
+            while chain is not None:
+                if chain.kind == 'select' and not chain.projects_this:
+                    # $this inside a sub-select that does not return it
+                    return None
+                chain = chain.parent
+            if stack[-1] == '(':
+                expression_uses.append(group)
+            else:
+                group.binds_this = True
+            continue
+
+        keyword = token.upper()
+        if kind == 'word':
+            if keyword in UNSUPPORTED_KEYWORDS:
+                return None
+            if keyword == 'SELECT':
+                in_select_clause = True
+                select_projects_this = False
+                if group is None:
+                    projection = match.end()
+                else:
+                    next_kind = 'select'
+            elif keyword in ('DISTINCT', 'REDUCED') and group is None and where is None:
+                projection = match.end()
+            elif keyword in ('EXISTS', 'OPTIONAL'):
+                next_kind = 'exists' if keyword == 'EXISTS' else 'optional'
+            elif keyword in AGGREGATES and group is None and not top_closed:
+                aggregated = True
+            elif keyword in ('GROUP', 'HAVING') and group is None and top_closed:
+                grouped = True
+        elif token == '*':
+            if in_select_clause and not stack and group is None:
+                projected = True
+        elif token == '(':
+            stack.append('(')
+        elif token == ')':
+            if stack and stack[-1] == '(':
+                stack.pop()
+        elif token == '{':
+            if group is None and where is None and not top_closed:
+                group = _Group('where', None)
+                where = match.end()
+            elif group is None:
+                return None
+            else:
+                group = _Group(next_kind or 'other', group, select_projects_this and next_kind == 'select')
+            stack.append(group)
+            next_kind = None
+            in_select_clause = False
+        elif token == '}':
+            while stack and stack[-1] == '(':
+                stack.pop()
+            if not stack:
+                return None
+            closed = stack.pop()
+            if closed.kind == 'where':
+                top_closed = True
+
+    if where is None or not top_closed:
+        return None
+    if (aggregated or grouped) and not group_by_this:
+        return None
+    if any(not group.this_bound() for group in expression_uses):
+        return None
+    return where, (None if projected else projection)
+
+
+def node_text(node):
+    return str(to_oxigraph(node))
+
+
+def path_text(shapes_graph, path, depth=0):
+    # SHACL property path to a SPARQL property path, see https://www.w3.org/TR/shacl/#property-paths
+    if isinstance(path, URIRef):
+        return node_text(path)
+    if depth > 10 or isinstance(path, Literal):
+        raise ValueError(f"Unsupported property path {path!r}")
+    sequence = list(shapes_graph.items(path))
+    if sequence:
+        return "(%s)" % "/".join(path_text(shapes_graph, step, depth + 1) for step in sequence)
+    for predicate, template in ((SH.inversePath, "^%s"), (SH.zeroOrMorePath, "(%s)*"),
+                                (SH.oneOrMorePath, "(%s)+"), (SH.zeroOrOnePath, "(%s)?")):
+        inner = shapes_graph.value(path, predicate)
+        if inner is not None:
+            return template % path_text(shapes_graph, inner, depth + 1)
+    alternatives = shapes_graph.value(path, SH.alternativePath)
+    if alternatives is not None:
+        return "(%s)" % "|".join(path_text(shapes_graph, step, depth + 1)
+                                 for step in shapes_graph.items(alternatives))
+    raise ValueError(f"Unsupported property path {path!r}")
+
+
+def is_deactivated(shapes_graph, node):
+    return any(value.toPython() is True for value in shapes_graph.objects(node, SH.deactivated)
+               if isinstance(value, Literal))
+
+
+class SPARQLConstraint:
+    """One ``sh:sparql`` constraint of one shape, rewritten to run for all focus nodes of the shape at once."""
+
+    def __init__(self, shape, node, query, path, severity, messages, shape_messages):
+        self.shape = shape
+        self.node = node
+        self.query = query
+        self.path = path
+        self.severity = severity
+        self.messages = messages
+        self.shape_messages = shape_messages
+
+
+def shape_targets(shapes_graph, shape):
+    """SPARQL patterns for the focus nodes of a shape, or None if they cannot be expressed as such."""
+    graph = shapes_graph
+    if is_deactivated(graph, shape) or (shape, SH.target, None) in graph:
+        return None
+    if any((None, predicate, shape) in graph for predicate in NESTED_SHAPE_PREDICATES):
+        return None
+
+    patterns = []
+    classes = set(graph.objects(shape, SH.targetClass))
+    if (shape, RDF.type, RDFS.Class) in graph or (shape, RDF.type, OWL.Class) in graph:
+        classes.add(shape)
+    for target_class in classes:
+        patterns.append("?this %s/%s* %s" % (node_text(RDF.type), node_text(RDFS.subClassOf),
+                                             node_text(target_class)))
+    nodes = list(graph.objects(shape, SH.targetNode))
+    if nodes:
+        patterns.append("VALUES ?this { %s }" % " ".join(node_text(node) for node in nodes))
+    for predicate in graph.objects(shape, SH.targetSubjectsOf):
+        patterns.append("?this %s ?target_object" % node_text(predicate))
+    for predicate in graph.objects(shape, SH.targetObjectsOf):
+        patterns.append("?target_subject %s ?this" % node_text(predicate))
+
+    for parent in graph.subjects(SH.property, shape):
+        if is_deactivated(graph, parent):
+            continue
+        parent_targets = shape_targets(graph, parent)
+        if parent_targets is None:
+            return None
+        patterns.extend(parent_targets)
+    return patterns
+
+
+def constraint_prefixes(shapes_graph, node):
+    # sh:prefixes, resolved as pySHACL does: the declarations of the referenced ontology, or of all of them
+    graph = shapes_graph
+    prefixes = dict(DEFAULT_PREFIXES)
+    ontologies = set(graph.subjects(RDF.type, OWL.Ontology))
+    for prefixes_node in graph.objects(node, SH.prefixes):
+        declarations = set(graph.objects(prefixes_node, SH.declare))
+        if not declarations or prefixes_node not in ontologies:
+            for ontology in ontologies:
+                declarations.update(graph.objects(ontology, SH.declare))
+        for declaration in declarations:
+            prefix = graph.value(declaration, SH.prefix)
+            namespace = graph.value(declaration, SH.namespace)
+            if prefix is not None and namespace is not None:
+                prefixes[str(prefix)] = str(namespace)
+    return prefixes
+
+
+def chains_operators(select):
+    """
+    Does an expression of the query chain - or / with another operator of the same precedence?
+
+    Oxigraph 0.3 groups such chains from the right: ?a - ?b + ?c as ?a - (?b + ?c) and ?a / ?b * ?c as
+    ?a / (?b * ?c). Chains of + and * are not affected. Expressions are the parentheses after a keyword or function
+    name (FILTER, BIND, IF, ...) and in the projection, and the parentheses inside them; a / elsewhere is a property
+    path.
+    """
+    # per open bracket: [is an expression, pending - or + of its sum, pending / or * of its product]
+    frames = []
+    in_projection = False
+    previous = None
+    for match in EXPRESSION_TOKENS.finditer(select):
+        kind, text = match.lastgroup, match.group()
+        if kind == 'skip':
+            continue
+        upper = text.upper()
+        if kind == 'word' and upper == 'SELECT':
+            in_projection = True
+        elif upper in ('WHERE', '{'):
+            in_projection = False
+        frame = frames[-1] if frames else None
+        if text in ('(', '{'):
+            expression = text == '(' and (in_projection or (frame is not None and frame[0])
+                                          or (previous is not None and previous[0] == 'word'))
+            frames.append([expression, None, None])
+        elif text in (')', '}'):
+            if frames:
+                frames.pop()
+        elif frame is not None and frame[0]:
+            operand_before = previous is not None and (
+                previous[0] in ('variable', 'number', 'string', 'iri') or previous[1] == ')'
+                or (previous[0] == 'word' and previous[1].upper() not in EXPRESSION_KEYWORDS))
+            if text in ('+', '-') and operand_before:
+                if frame[1] == '-':
+                    return True
+                frame[1], frame[2] = text, None
+            elif text in ('*', '/'):
+                if frame[2] == '/':
+                    return True
+                frame[2] = text
+            elif kind == 'operator' and text not in ('+', '-', '!') or upper in EXPRESSION_KEYWORDS:
+                # a comparison, a connective or a comma starts another expression
+                frame[1] = frame[2] = None
+        previous = kind, text
+    return False
+
+
+def compile_constraint(shapes_graph, shape, node, syntax_check):
+    """The ``SPARQLConstraint`` for one sh:sparql value of a shape, or None if pySHACL has to evaluate it."""
+    graph = shapes_graph
+    selects = list(graph.objects(node, SH.select))
+    if len(selects) != 1 or not isinstance(selects[0], Literal) or is_deactivated(graph, node):
+        return None
+    select = str(selects[0])
+    if UNSUPPORTED_VARIABLES.search(select) or chains_operators(select):
+        return None
+
+    path = graph.value(shape, SH.path)
+    if path is not None:
+        try:
+            select = PATH_VARIABLE.sub(lambda m: m.group(1) + path_text(graph, path), select)
+        except ValueError:
+            return None
+    elif PATH_VARIABLE.search(select):
+        return None
+
+    patterns = shape_targets(graph, shape)
+    points = rewrite_points(select)
+    if not patterns or points is None:
+        return None
+    where, projection = points
+    targets = TARGETS_SELECT + "%s } }" % " UNION ".join("{ %s }" % p for p in patterns)
+    query = select[:where] + "\n" + targets + "\n" + select[where:]
+    if projection is not None:
+        query = query[:projection] + " ?this" + query[projection:]
+    prefix_lines = "".join(f"PREFIX {prefix}: <{namespace}>\n"
+                           for prefix, namespace in constraint_prefixes(graph, node).items())
+    try:
+        # parse check against an empty store; pySHACL reports queries Oxigraph cannot parse
+        syntax_check.query(prefix_lines + query)
+    except SyntaxError:
+        return None
+
+    return SPARQLConstraint(
+        shape, node, prefix_lines + query, path,
+        graph.value(shape, SH.severity) or SH.Violation,
+        list(graph.objects(node, SH.message)),
+        list(graph.objects(shape, SH.message)),
+    )
+
+
+class SPARQLConstraintSet:
+    """
+    The SPARQL constraints of a shapes graph that run natively, and the shapes graph pySHACL validates the rest of.
+
+    >>> constraints = SPARQLConstraintSet.from_shapes(shacl_graph)
+    >>> conforms, report_graph, report_text = validate(data_graph, shacl_graph=constraints.core_shapes_graph)
+    >>> results = constraints.evaluate(data_graph)
+    >>> conforms, report_graph, report_text = merge_results((conforms, report_graph, report_text), results)
+    """
+
+    def __init__(self, core_shapes_graph, constraints):
+        self.core_shapes_graph = core_shapes_graph
+        self.constraints = constraints
+
+    @classmethod
+    def from_shapes(cls, shapes_graph):
+        constraints = []
+        syntax_check = pyoxigraph.Store()
+        extracted = set()
+        for shape, node in set(shapes_graph.subject_objects(SH.sparql)):
+            constraint = compile_constraint(shapes_graph, shape, node, syntax_check)
+            if constraint is not None:
+                constraints.append(constraint)
+                extracted.add((shape, SH.sparql, node))
+
+        core_shapes_graph = Graph()
+        for prefix, namespace in shapes_graph.namespaces():
+            core_shapes_graph.bind(prefix, namespace)
+        core_shapes_graph.addN((s, p, o, core_shapes_graph) for s, p, o in shapes_graph
+                               if (s, p, o) not in extracted)
+        return cls(core_shapes_graph, constraints)
+
+    def evaluate(self, data_graph, dataset=None):
+        """Validate the data graph against all native constraints, as pySHACL (report description, node, triples)."""
+        dataset = dataset or oxigraph_dataset(data_graph)
+        results = []
+        for constraint in self.constraints:
+            results.extend(self.evaluate_constraint(constraint, data_graph, dataset))
+        return results
+
+    def evaluate_constraint(self, constraint, data_graph, dataset, focus_nodes=None):
+        """The results of one constraint, for all its focus nodes or for those of ``focus_nodes``."""
+        store, options = dataset
+        query = constraint.query
+        if focus_nodes is not None:
+            focus_nodes = set(focus_nodes)
+            if not focus_nodes:
+                return []
+            if not any(isinstance(node, BNode) for node in focus_nodes):
+                # only the given focus nodes are joined in; blank nodes cannot be written into a query
+                values = "VALUES ?this { %s } " % " ".join(node_text(node) for node in focus_nodes)
+                query = query.replace(TARGETS_SELECT, TARGETS_SELECT + values, 1)
+        results = self.results(constraint, store.query(query, **options), data_graph)
+        if focus_nodes is not None:
+            return [result for result in results if result_focus(result) in focus_nodes]
+        return list(results)
+
+    def results(self, constraint, solutions, data_graph):
+        variables = [variable.value for variable in solutions.variables]
+        seen = set()
+        for solution in solutions:
+            bound = {name: from_oxigraph(solution[name]) for name in variables if solution[name] is not None}
+            focus = bound.pop('this', None)
+            if focus is None:
+                continue
+            failure = bound.pop('failure', None)
+            if failure is not None:
+                key = (focus, True)
+                path = value = None
+                message_bindings = dict(bound)
+            else:
+                path = bound.pop('path', None)
+                value = bound.pop('value', None)
+                key = (focus, path, value, frozenset(bound.items()))
+                if value is None and constraint.path is None:
+                    value = focus
+                message_bindings = dict(bound, this=focus)
+                if path is not None:
+                    message_bindings['path'] = path
+                if value is not None:
+                    message_bindings['value'] = value
+            if key in seen:
+                continue
+            seen.add(key)
+            if failure is not None and constraint.path is None:
+                value = focus
+            yield self.make_result(constraint, data_graph, focus, value, path or constraint.path, message_bindings)
+
+    def make_result(self, constraint, data_graph, focus, value, path, bindings):
+        graph = self.core_shapes_graph
+        node = BNode()
+        triples = [
+            (node, RDF.type, SH.ValidationResult),
+            (node, SH.sourceConstraintComponent, SH.SPARQLConstraintComponent),
+            (node, SH.sourceShape, (graph, constraint.shape)),
+            (node, SH.resultSeverity, constraint.severity),
+            (node, SH.focusNode, (data_graph, focus)),
+        ]
+        if value is not None:
+            triples.append((node, SH.value, (data_graph, value)))
+        if path is not None:
+            triples.append((node, SH.resultPath, (graph, path)))
+        triples.append((node, SH.sourceConstraint, (graph, constraint.node)))
+
+        messages = [m for m in constraint.messages if m not in constraint.shape_messages]
+        messages += constraint.shape_messages
+        messages = [Literal(format_message(str(m), bindings)) if isinstance(m, Literal) else m for m in messages]
+        triples.extend((node, SH.resultMessage, message) for message in messages)
+
+        description = "{} in SPARQLConstraintComponent ({}):\n\tSeverity: {}\n\tSource Shape: {}\n" \
+                      "\tFocus Node: {}\n".format(SEVERITY_LABELS.get(constraint.severity, "Validation Result"),
+                                                  SH.SPARQLConstraintComponent,
+                                                  stringify_node(graph, constraint.severity),
+                                                  stringify_node(graph, constraint.shape),
+                                                  stringify_node(data_graph, focus))
+        if value is not None:
+            description += "\tValue Node: {}\n".format(stringify_node(data_graph, value))
+        if path is not None:
+            description += "\tResult Path: {}\n".format(stringify_node(graph, path))
+        description += "\tSource Constraint: {}\n".format(stringify_node(graph, constraint.node))
+        for message in messages:
+            description += "\tMessage: {}\n".format(message)
+        return description, node, triples
+
+
+def result_focus(result):
+    """The focus node of a ``(description, node, triples)`` result, as pySHACL and ``make_result`` produce them."""
+    _, node, triples = result
+    for s, p, o in triples:
+        if s == node and p == SH.focusNode:
+            return o[1] if isinstance(o, tuple) else o
+    return None
+
+
+def format_message(message, bindings):
+    for variable, value in bindings.items():
+        message = re.sub(MESSAGE_VARIABLE.format(variable), str(value), message)
+    return message
+
+
+def oxigraph_dataset(data_graph):
+    """The pyoxigraph store holding the data graph and the query options that select it."""
+    if getattr(data_graph, 'dataset', None) is not None:
+        return data_graph.dataset
+    if isinstance(data_graph.store, OxigraphStore):
+        if data_graph.default_union:
+            return data_graph.store.inner, {'use_default_graph_as_union': True}
+        return data_graph.store.inner, {'default_graph': graph_name(data_graph)}
+    # any other store is copied once into a temporary in-memory Oxigraph store
+    store = pyoxigraph.Store()
+    default_graph = pyoxigraph.DefaultGraph()
+    store.bulk_extend(pyoxigraph.Quad(to_oxigraph(s), to_oxigraph(p), to_oxigraph(o), default_graph)
+                      for s, p, o in data_graph)
+    return store, {}
+
+
+def merge_results(validation, results, allow_infos=False, allow_warnings=False):
+    """Add results of ``SPARQLConstraintSet.evaluate`` to the ``(conforms, graph, text)`` returned by pySHACL."""
+    conforms, report_graph, report_text = validation
+    results = list(results)
+    if not results:
+        return validation
+
+    allowed = set()
+    if allow_infos or allow_warnings:
+        allowed.add(SH.Info)
+    if allow_warnings:
+        allowed.add(SH.Warning)
+
+    report = report_graph.value(predicate=RDF.type, object=SH.ValidationReport)
+    cloned = {}
+    for description, node, triples in results:
+        report_graph.add((report, SH.result, node))
+        for s, p, o in triples:
+            if p == SH.resultSeverity and o not in allowed:
+                conforms = False
+            if isinstance(o, tuple):
+                source, o = o
+                if isinstance(o, BNode):
+                    key = (id(source), str(o))
+                    if key not in cloned:
+                        cloned[key] = clone_blank_node(source, o, report_graph, keepid=True)
+                    o = cloned[key]
+            report_graph.add((s, p, o))
+    report_graph.set((report, SH.conforms, Literal(conforms)))
+
+    # rebuild the pySHACL text report header with the new totals
+    body = report_text.split("\n", 3)[3] if "\nResults (" in report_text else ""
+    count = len(set(report_graph.objects(report, SH.result)))
+    report_text = "Validation Report\nConforms: {}\nResults ({}):\n{}{}".format(
+        conforms, count, body, "".join(description for description, _, _ in results))
+    return conforms, report_graph, report_text
@@ -0,0 +1,334 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+import io
+import os
+import pathlib
+import shutil
+import tempfile
+import zipfile
+
+from rdflib import Graph, RDF, SH, URIRef
+from rdflib.store import Store
+
+from application import cimplugin, modelcache
+from application.CimGraph import CimGraph, CimUnionGraph
+from application.cimparser import create_input_source
+from application.datatypes import DatatypeMap
+from application.imports import ImportResolver
+from application.metrics import Metrics
+from application.parallel import ShapesPartition, run_pyshacl, validate_parallel
+from application.progress import Progress, ProgressReader, ProgressShapes
+from application.pruning import ModelHistogram, prune_shapes
+from application.report import Column, ExcelReportWriter
+from application.shapecache import CompiledShapes, load_compiled_shapes
+from application.sparqlconstraints import merge_results
+
+DEFAULT_DATATYPE_MAPPING = 'CGMES_v2_4_constraints/DatatypeMapping/rdfs_info_CGMES2415simple.json'
+# parser backends for the instance data; 'sax' is the reference implementation
+PARSER_FORMATS = {
+    'sax': 'cimxml',
+    'oxigraph': 'cimxml-oxigraph',
+    'fast': 'cimxml-fast',
+}
+# nested archives up to this size are buffered in memory, larger ones in a temporary file
+SPOOL_MAX_SIZE = 64 * 1024 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+REPORT_HEADERS = ['Severity', 'Focus node', 'Path', 'Value', 'Message', 'Source shape']
+# column of the results frame under each header, see application.results
+REPORT_FRAME_COLUMNS = ['severity', 'focus_node', 'path', 'value', 'message', 'source_shape']
+REPORT_COLUMNS = [Column(header, wrap=header == 'Message') for header in REPORT_HEADERS]
+REPORT_SHEET = 'Sheet'
+SKIPPED_SHAPES_SHEET = 'Skipped shapes'
+SKIPPED_SHAPES_HEADERS = ['Source shape', 'Targets without a match in the model']
+SKIPPED_SHAPES_COLUMNS = [Column(header) for header in SKIPPED_SHAPES_HEADERS]
+
+
+class ModelValidator:
+    """
+    The parsing and validation pipeline behind the Validate button, without any Qt dependency.
+
+    The datatype mapping and the SHACL shapes are loaded once and kept on the instance, so the same
+    validator can be used to validate several models one after the other (see ``reset_instance_data``).
+    """
+
+    def __init__(self, parser='sax', named_graphs=False, store='Memory', native_sparql=False, shape_workers=1,
+                 prune_shapes=True, cache_models=False):
+        if parser not in PARSER_FORMATS:
+            raise ValueError(f"Unknown parser backend '{parser}', expected one of {', '.join(PARSER_FORMATS)}")
+        self.parser = parser
+        self.named_graphs = named_graphs
+        self.store = store
+        # run sh:sparql constraints on Oxigraph instead of pySHACL's per focus node rdflib queries
+        self.native_sparql = native_sparql
+        # worker processes the shapes are split over in validate(), 1 validates in this process
+        self.shape_workers = shape_workers
+        # leave out shapes whose targets match no class or predicate of the model; pruned_shapes lists them
+        self.prune_shapes = prune_shapes
+        self.pruned_shapes = []
+        # load unchanged instance files from the parsed model cache (see application.modelcache)
+        self.cache_models = cache_models
+        self.model_recorder = None
+        # counters of the current run; setting a Progress with a callback reports them, cancelling it stops the run
+        self.progress = Progress()
+        # timing spans and counters of the current run, written as JSON lines if MODSHAPE_METRICS names a file
+        self.metrics = Metrics.from_environment()
+        self.sparql_constraints = None
+        self.datatypes_mapping = DatatypeMap()
+        self.import_resolver = ImportResolver()
+        self.compiled_shapes = CompiledShapes(Graph())
+        self.merged_shacl_graph = self.compiled_shapes.graph
+        self.reset_instance_data()
+
+    def load_datatype_mapping(self, datatype_mapping):
+        # the map can be .json, .rdf or .xlsx; it is compiled once and cached by content hash
+        if not datatype_mapping:
+            datatype_mapping = [DEFAULT_DATATYPE_MAPPING]
+        with self.metrics.span('load_datatypes', files=len(datatype_mapping)):
+            self.datatypes_mapping = DatatypeMap.load(datatype_mapping)
+
+    def load_shacl(self, shacl_files, use_cache=True, catalogs=()):
+        self.compiled_shapes = self.compile_shacl(shacl_files, use_cache, catalogs)
+        self.merged_shacl_graph = self.compiled_shapes.graph
+        self.sparql_constraints = self.compiled_shapes.sparql_constraints
+
+    def compile_shacl(self, shacl_files, use_cache=True, catalogs=(), skip=()):
+        # parsed and compiled once, then loaded from the shapes cache while the files and their imports are unchanged;
+        # catalogs map owl:imports IRIs to local files, and imported files in skip are left out
+        self.progress.update(phase='Loading shapes')
+        for catalog in catalogs:
+            self.import_resolver.add_catalog(catalog)
+        skip = sorted(os.path.abspath(path) for path in skip)
+        # the catalogs found next to imported files are only known once read, the cache entry records their digests
+        catalogs = self.import_resolver.consulted_catalogs(shacl_files)
+        with self.metrics.span('load_shapes', files=len(shacl_files)):
+            return load_compiled_shapes(shacl_files, lambda files: self.read_shacl(files, skip), self.native_sparql,
+                                        use_cache, key=catalogs + skip, catalogs=catalogs)
+
+    def read_shacl(self, shacl_files, skip=()):
+        shacl_graph = Graph()
+        sources = self.import_resolver.load(shacl_files, shacl_graph, skip)
+        return shacl_graph, sources
+
+    def reset_instance_data(self, graph=None):
+        # every file is parsed straight into this one store, never copied into it afterwards; or into graph, a
+        # CimGraph in a store shared with other models (see application.assembly)
+        self.model_histogram = ModelHistogram()
+        if graph is not None:
+            graph.histogram = self.model_histogram
+            self.merged_instance_graph = graph
+            self.instance_store = graph.store
+        elif self.named_graphs:
+            self.instance_store = cimplugin.get(self.store, Store)()
+            self.merged_instance_graph = CimUnionGraph(store=self.instance_store)
+        else:
+            self.merged_instance_graph = CimGraph(store=self.store)
+            self.merged_instance_graph.histogram = self.model_histogram
+            self.instance_store = self.merged_instance_graph.store
+
+    def instance_graph(self, graph_name):
+        # the graph a file is parsed into: its own named graph, or the merged graph itself
+        if self.named_graphs:
+            graph = CimGraph(store=self.instance_store, identifier=URIRef(graph_name))
+            graph.histogram = self.model_histogram
+            return graph
+        return self.merged_instance_graph
+
+    @staticmethod
+    def get_format_from_extension(extension):
+        # Map file extensions to RDF serialization formats
+        extension_format_mapping = {
+            '.xml': 'xml',
+            '.rdf': 'xml',
+            '.ttl': 'turtle',
+            # Add more mappings as needed
+        }
+        return extension_format_mapping.get(extension, None)
+
+    @staticmethod
+    def is_supported_archive(extension):
+        # Check if the file extension corresponds to a supported archive format
+        supported_archive_extensions = ['.zip', '.cimx']  # Add more extensions as needed
+        return extension.lower() in supported_archive_extensions
+
+    def process_entry_content(self, entry_name, stream, graph_name):
+        # Process the content and add triples to the merged graph. The content is a binary stream that is
+        # read incrementally by the parser, so neither files nor archive members are ever held in memory whole.
+        # Determine the format based on the file extension
+        _, ext = os.path.splitext(entry_name)
+        ext = ext.lower()  # Convert to lowercase for case-insensitive comparison
+        if self.is_supported_archive(ext):
+            # If it's a supported archive format, treat it as a zip file
+            with zipfile.ZipFile(stream, 'r') as zip_ref:
+                for member in zip_ref.infolist():
+                    if member.is_dir():
+                        continue
+                    member_graph_name = f"{graph_name}/{member.filename}"
+                    with self.metrics.span('entry', member=member.filename, bytes=member.file_size,
+                                           compressed_bytes=member.compress_size), \
+                            zip_ref.open(member) as inner_entry_file:
+                        _, inner_ext = os.path.splitext(member.filename)
+                        if self.is_supported_archive(inner_ext):
+                            # a nested archive needs a seekable stream; small ones stay in memory, large ones
+                            # spill to a temporary file
+                            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as buffer:
+                                shutil.copyfileobj(inner_entry_file, buffer, STREAM_CHUNK_SIZE)
+                                buffer.seek(0)
+                                self.process_entry_content(member.filename, buffer, member_graph_name)
+                        else:
+                            self.process_entry_content(member.filename, inner_entry_file, member_graph_name)
+        else:
+            # If it's not a supported archive format, treat it as a regular file
+            file_format = self.get_format_from_extension(ext)
+            if file_format:
+                source = create_input_source(file=stream)
+                # no document base, as for in-memory data: "#_mRID" references must resolve to the same IRI
+                # in every profile file of a model
+                source.setPublicId("")
+                source.setSystemId(None)
+                graph = self.instance_graph(graph_name)
+                histogram = graph.histogram
+                if self.model_recorder is not None:
+                    graph.histogram = self.model_recorder.member(graph_name, histogram)
+                try:
+                    graph.parse(source=source, format=PARSER_FORMATS[self.parser],
+                                datatype_mapping=self.datatypes_mapping)
+                finally:
+                    graph.histogram = histogram
+
+    def process_file(self, file_path):
+        # parsed, or loaded from the model cache when it holds the file; True if it did
+        graph_name = pathlib.Path(file_path).absolute().as_uri()
+        entry_path = None
+        if self.cache_models:
+            entry_path = modelcache.entry_path(file_path, self.parser, self.datatypes_mapping)
+            entry = modelcache.read_entry(entry_path)
+            if entry is not None:
+                self.progress.check()
+                modelcache.load_entry(entry, lambda suffix: self.instance_graph(graph_name + suffix))
+                return True
+            self.model_recorder = modelcache.ModelRecorder(graph_name)
+        try:
+            # the bytes read from disk are counted, and cancelling stops the parser at its next read
+            with io.BufferedReader(ProgressReader(open(file_path, 'rb', buffering=0), self.progress,
+                                                  self.model_histogram), STREAM_CHUNK_SIZE) as file:
+                try:
+                    self.process_entry_content(file_path, file, graph_name)
+                except Exception:
+                    self.progress.check()  # a parser may wrap the ValidationCancelled raised by its stream
+                    raise
+            if self.model_recorder is not None:
+                self.model_recorder.write(entry_path)
+        finally:
+            self.model_recorder = None
+        return False
+
+    def process_instance_data_contents(self, file_paths):
+        progress = self.progress
+        metrics = self.metrics
+        progress.update(phase='Parsing', files=0, total_files=len(file_paths), bytes=0,
+                        total_bytes=sum(os.path.getsize(file_path) for file_path in file_paths),
+                        triples=self.model_histogram.total)
+        for index, file_path in enumerate(file_paths):
+            parsed_bytes = progress.bytes
+            triples = self.model_histogram.total
+            with metrics.span('file', file=file_path, bytes=os.path.getsize(file_path)) as span:
+                try:
+                    span['cached'] = self.process_file(file_path)
+                finally:
+                    span['triples'] = self.model_histogram.total - triples
+            metrics.count('cached_files', span['cached'])
+            progress.update(files=index + 1, bytes=parsed_bytes + os.path.getsize(file_path),
+                            triples=self.model_histogram.total)
+
+    def load_instance_data(self, file_paths):
+        histogram = self.model_histogram
+        triples, retyped = histogram.total, self.retyped_literals()
+        with self.metrics.span('parse', files=len(file_paths), parser=self.parser) as span:
+            self.process_instance_data_contents(file_paths)
+        span['triples'] = histogram.total - triples
+        self.metrics.count('triples', span['triples'])
+        self.metrics.count('retyped_literals', self.retyped_literals() - retyped)
+
+    def retyped_literals(self):
+        # the parsers give every literal of a predicate in the datatype map its datatype; counted from the
+        # histogram, so that parsing does not pay for it
+        predicates = self.model_histogram.predicates
+        return sum(predicates[predicate] for predicate in self.datatypes_mapping if predicate in predicates)
+
+    def validate(self, data_graph=None, compiled_shapes=None, histogram=None):
+        # the loaded model against the loaded shapes, unless another graph (with the ModelHistogram of its
+        # triples) or other CompiledShapes are given, see application.assembly
+        data_graph = self.merged_instance_graph if data_graph is None else data_graph
+        compiled_shapes = self.compiled_shapes if compiled_shapes is None else compiled_shapes
+        sparql_constraints = compiled_shapes.sparql_constraints
+        metrics = self.metrics
+        with metrics.span('validate', shape_workers=self.shape_workers) as span:
+            # this is validation without inference; the shapes are harvested once and shared by every validation
+            # instead of once per model. With native SPARQL the graph does not contain the constraints run
+            # natively below.
+            shapes_graph = compiled_shapes.shapes_graph
+            self.pruned_shapes = []
+            if self.prune_shapes:
+                with metrics.span('prune'):
+                    if histogram is None:
+                        histogram = self.model_histogram
+                        if data_graph is not self.merged_instance_graph or histogram.total < len(data_graph):
+                            # triples were added past the parsers (or it is another graph), count them all
+                            histogram = ModelHistogram.from_graph(data_graph)
+                    kept, self.pruned_shapes = prune_shapes(shapes_graph, histogram)
+            else:
+                kept = [shape.node for shape in shapes_graph.shapes]
+            metrics.count('shapes', len(kept))
+            metrics.count('pruned_shapes', len(self.pruned_shapes))
+            shapes_graph = ShapesPartition(shapes_graph, kept)
+            self.progress.update(phase='Validating', shapes=0, total_shapes=len(kept), results=0)
+            with metrics.span('shacl', shapes=len(kept)):
+                if self.shape_workers > 1:
+                    r = validate_parallel(data_graph, shapes_graph, self.shape_workers, self.progress)
+                    self.progress.update(shapes=len(kept))  # shapes without focus nodes are not scheduled
+                else:
+                    # every completed shape is reported, cancelling stops before the next one
+                    shapes_graph.shapes = ProgressShapes(shapes_graph.shapes, self.progress)
+                    r = run_pyshacl(data_graph, shapes_graph)
+            if sparql_constraints is not None:
+                self.progress.update(phase='Validating SPARQL constraints')
+                with metrics.span('sparql', constraints=len(sparql_constraints.constraints)):
+                    r = merge_results(r, sparql_constraints.evaluate(data_graph))
+            span['results'] = count_results(r[1])
+        metrics.count('results', span['results'])
+        return r
+
+    def write_excel_report(self, results, file_name):
+        # the results graph or the frame extracted from it (application.results); streamed in constant memory
+        self.progress.update(phase='Writing report')
+        with self.metrics.span('export', report=file_name) as span:
+            if isinstance(results, Graph):
+                from application.results import results_frame
+
+                results = results_frame(results)
+            span['rows'] = results.height
+            with ExcelReportWriter(file_name) as writer:
+                writer.write_sheet(REPORT_SHEET, REPORT_COLUMNS, results.select(REPORT_FRAME_COLUMNS).iter_rows())
+                # shapes left out of the last validation because nothing in the model can match their targets
+                if self.pruned_shapes:
+                    writer.write_sheet(SKIPPED_SHAPES_SHEET, SKIPPED_SHAPES_COLUMNS,
+                                       ([str(shape), self.describe_targets(shape)] for shape in self.pruned_shapes))
+
+    def describe_targets(self, shape):
+        graph = self.compiled_shapes.graph
+        targets = []
+        for predicate in (SH.targetClass, SH.targetSubjectsOf, SH.targetObjectsOf):
+            for target in graph.objects(shape, predicate):
+                targets.append(f"{predicate.n3(graph.namespace_manager)} {target.n3(graph.namespace_manager)}")
+        return ', '.join(targets) or 'implicit class target'
+
+    @staticmethod
+    def is_url(path):
+        # Check if the path starts with "http://" or "https://"
+        return path.startswith(("http://", "https://"))
+
+
+def count_results(results_graph):
+    # the sh:ValidationResult nodes of a report graph
+    return sum(1 for _ in results_graph.subjects(RDF.type, SH.ValidationResult))
@@ -0,0 +1,100 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Compares two results files of ``benchmarks.run``, typically of two commits.
+
+Records are matched by configuration (size, parser, instance store options) and stage. Where a configuration ran
+several times the median time and the highest peak memory count. A stage is a regression when it is slower or
+needs more memory than ``--threshold`` (a fraction) more than in the baseline, and ignored below ``--min-seconds``
+where timer noise dominates::
+
+    python -m benchmarks.compare baseline.jsonl results.jsonl --threshold 0.1
+
+The exit code is 1 if any stage regressed.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+
+from benchmarks.run import STAGES
+
+CONFIGURATION_KEYS = ('substations', 'parser', 'named_graphs', 'store', 'native_sparql', 'shape_workers')
+DEFAULT_THRESHOLD = 0.1
+DEFAULT_MIN_SECONDS = 0.05
+
+
+def read_results(path):
+    """{(configuration, stage): (median seconds, peak resident MB)} of a results file, and its commits."""
+    runs = {}
+    commits = set()
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            commits.add((record.get('commit') or 'unknown')[:10] + ('+' if record.get('dirty') else ''))
+            key = (tuple(record.get(name) for name in CONFIGURATION_KEYS), record['stage'])
+            runs.setdefault(key, []).append(record)
+    summary = {}
+    for key, records in runs.items():
+        peaks = [record['peak_rss_mb'] for record in records if record.get('peak_rss_mb') is not None]
+        summary[key] = (statistics.median(record['seconds'] for record in records), max(peaks) if peaks else None)
+    return summary, sorted(commits)
+
+
+def change(baseline, current):
+    if baseline is None or current is None or baseline == 0:
+        return None
+    return current / baseline - 1
+
+
+def describe(configuration):
+    values = dict(zip(CONFIGURATION_KEYS, configuration))
+    options = [name for name in ('named_graphs', 'native_sparql') if values[name]]
+    if values['store'] not in (None, 'Memory'):
+        options.append(values['store'])
+    if values['shape_workers'] not in (None, 1):
+        options.append(f"{values['shape_workers']} workers")
+    return f"{values['substations']} {values['parser']}" + (f" ({', '.join(options)})" if options else '')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.compare", description="Compare two benchmark results files.")
+    parser.add_argument("baseline", help="results of the baseline commit")
+    parser.add_argument("current", help="results to compare with the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"relative slow-down or memory growth that is a regression (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--min-seconds", type=float, default=DEFAULT_MIN_SECONDS,
+                        help=f"stages faster than this are not compared by time (default: {DEFAULT_MIN_SECONDS})")
+    args = parser.parse_args(argv)
+
+    baseline, baseline_commits = read_results(args.baseline)
+    current, current_commits = read_results(args.current)
+    print(f"baseline {', '.join(baseline_commits)}, current {', '.join(current_commits)}")
+    print(f"{'configuration':<28} {'stage':<18} {'baseline s':>11} {'current s':>10} {'time':>7} "
+          f"{'baseline MB':>11} {'current MB':>10} {'memory':>7}")
+    regressions = 0
+    order = {stage: index for index, stage in enumerate(STAGES)}
+    for key in sorted(baseline.keys() & current.keys(),
+                      key=lambda key: (key[0][0], str(key[0][1:]), order.get(key[1], len(order)))):
+        configuration, stage = key
+        (base_seconds, base_peak), (seconds, peak) = baseline[key], current[key]
+        time_change = change(base_seconds, seconds) if max(base_seconds, seconds) >= args.min_seconds else None
+        memory_change = change(base_peak, peak)
+        regressed = any(value is not None and value > args.threshold for value in (time_change, memory_change))
+        regressions += regressed
+        print(f"{describe(configuration):<28} {stage:<18} {base_seconds:>11.3f} {seconds:>10.3f} "
+              f"{'' if time_change is None else f'{time_change:+.0%}':>7} "
+              f"{'' if base_peak is None else f'{base_peak:.1f}':>11} {'' if peak is None else f'{peak:.1f}':>10} "
+              f"{'' if memory_change is None else f'{memory_change:+.0%}':>7}{'  REGRESSION' if regressed else ''}")
+    for name, keys in (('baseline', baseline.keys() - current.keys()), ('current', current.keys() - baseline.keys())):
+        if keys:
+            print(f"{len(keys)} stage(s) only in the {name} results")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,489 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+Seeded generator of synthetic CGMES 2.4 models.
+
+Writes the EQ, TP, SSH and SV instance files of one grid model with ``substations`` substations. Every
+substation has a 220 kV and a 110 kV voltage level with a busbar each, a transformer between them and a load on
+the 110 kV side; every third substation has a generator, and the 220 kV busbars are joined by lines into a ring
+(with a chord every tenth substation). A tie line from the first substation to a boundary node carries the net
+interchange of the control area. The files conform to the RDFS based and QoCDC 3.3 constraints the benchmark
+validates with (see ``benchmarks.run``); ``violation_rate`` is the share of substations that get one known
+violation (see ``VIOLATIONS``), and the violations injected are returned and written to the manifest. The same
+seed gives the same files.
+
+Usage::
+
+    python -m benchmarks.generate 1000 --seed 1 --violation-rate 0.01 --output benchmarks/data/grid-1000
+
+The files are also packed into ``<output>.zip``, the form models are usually exchanged in.
+"""
+
+import argparse
+import json
+import os
+import random
+import uuid
+import zipfile
+from xml.sax.saxutils import escape
+
+CIM = 'http://iec.ch/TC57/2013/CIM-schema-cim16#'
+ENTSOE = 'http://entsoe.eu/CIM/SchemaExtension/3/1#'
+NAMESPACES = {
+    'cim': CIM,
+    'entsoe': ENTSOE,
+    'md': 'http://iec.ch/TC57/61970-552/ModelDescription/1#',
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+}
+PROFILES = {
+    'EQ': ['http://entsoe.eu/CIM/EquipmentCore/3/1', 'http://entsoe.eu/CIM/EquipmentOperation/3/1',
+           'http://entsoe.eu/CIM/EquipmentShortCircuit/3/1'],
+    'TP': ['http://entsoe.eu/CIM/Topology/4/1'],
+    'SSH': ['http://entsoe.eu/CIM/SteadyStateHypothesis/1/1'],
+    'SV': ['http://entsoe.eu/CIM/StateVariables/4/1'],
+}
+# the profiles each file depends on
+DEPENDENCIES = {'EQ': [], 'TP': ['EQ'], 'SSH': ['EQ'], 'SV': ['TP', 'SSH']}
+MODELING_AUTHORITY_SET = 'http://www.mavir.hu/OperationalPlanning'
+# a region code of the QoCDC reference data
+CONTROL_AREA_EIC = '10YHU-MAVIR----U'
+SCENARIO_TIME = '2024-01-01T10:30:00Z'
+CREATED = '2024-01-01T08:00:00Z'
+HV, MV = 220.0, 110.0
+GENERATOR_EVERY = 3
+CHORD_EVERY = 10
+# violations that can be injected, each reported by at least one shape
+VIOLATIONS = ['missing_name', 'dangling_terminal', 'low_voltage', 'invalid_datatype']
+
+
+def new_mrid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+class ProfileWriter:
+    """Writes the objects of one profile as CGMES RDF/XML, in the order they are added."""
+
+    def __init__(self, path, profile, model_ids):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.profile = profile
+        namespaces = ' '.join(f'xmlns:{prefix}="{namespace}"' for prefix, namespace in NAMESPACES.items())
+        self.file.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<rdf:RDF {namespaces}>\n')
+        self.write_header(model_ids)
+
+    def write_header(self, model_ids):
+        lines = [f'  <md:FullModel rdf:about="urn:uuid:{model_ids[self.profile]}">',
+                 f'    <md:Model.scenarioTime>{SCENARIO_TIME}</md:Model.scenarioTime>',
+                 f'    <md:Model.created>{CREATED}</md:Model.created>',
+                 f'    <md:Model.description>Synthetic {self.profile} model</md:Model.description>',
+                 '    <md:Model.version>1</md:Model.version>']
+        lines += [f'    <md:Model.profile>{profile}</md:Model.profile>' for profile in PROFILES[self.profile]]
+        lines += [f'    <md:Model.DependentOn rdf:resource="urn:uuid:{model_ids[dependency]}"/>'
+                  for dependency in DEPENDENCIES[self.profile]]
+        lines += [f'    <md:Model.modelingAuthoritySet>{MODELING_AUTHORITY_SET}</md:Model.modelingAuthoritySet>',
+                  '  </md:FullModel>\n']
+        self.file.write('\n'.join(lines))
+
+    def add(self, cls, mrid, properties, define=True):
+        """
+        An object with (property, value) pairs: str values are literals, ``ref(mrid)`` values references to
+        objects and ``enum(value)`` values enumeration literals.
+        """
+        prefix = 'entsoe' if cls.startswith('entsoe:') else 'cim'
+        cls = cls.split(':')[-1]
+        subject = f'rdf:ID="_{mrid}"' if define else f'rdf:about="#_{mrid}"'
+        lines = [f'  <{prefix}:{cls} {subject}>']
+        for name, value in properties:
+            if ':' not in name:
+                name = 'cim:' + name
+            if isinstance(value, Reference):
+                lines.append(f'    <{name} rdf:resource="{value}"/>')
+            else:
+                lines.append(f'    <{name}>{escape(value)}</{name}>')
+        lines.append(f'  </{prefix}:{cls}>\n')
+        self.file.write('\n'.join(lines))
+
+    def close(self):
+        self.file.write('</rdf:RDF>\n')
+        self.file.close()
+
+
+class Reference(str):
+    pass
+
+
+def ref(mrid):
+    return Reference(f'#_{mrid}')
+
+
+def enum(value):
+    return Reference(CIM + value)
+
+
+def number(value):
+    return f'{value:.4f}'.rstrip('0').rstrip('.')
+
+
+class GridGenerator:
+    """Generates one model; ``write`` returns the numbers of objects and injected violations."""
+
+    def __init__(self, substations, seed=1, violation_rate=0.0):
+        if substations < 2:
+            # QoCDC rejects a model with a single substation
+            raise ValueError("A model needs at least two substations")
+        self.substations = substations
+        self.rng = random.Random(seed)
+        self.violation_rate = violation_rate
+        self.violations = {violation: 0 for violation in VIOLATIONS}
+        self.objects = 0
+        self.eq = self.tp = self.ssh = self.sv = None
+        # objects shared by the whole model, set by write_model
+        self.shared = {}
+
+    def mrid(self):
+        return new_mrid(self.rng)
+
+    def violation(self):
+        # the violation injected into the current substation, if any
+        if self.violation_rate and self.rng.random() < self.violation_rate:
+            violation = self.rng.choice(VIOLATIONS)
+            self.violations[violation] += 1
+            return violation
+        return None
+
+    def write(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        model_ids = {profile: self.mrid() for profile in PROFILES}
+        writers = {profile: ProfileWriter(os.path.join(directory, f'{profile}.xml'), profile, model_ids)
+                   for profile in PROFILES}
+        self.eq, self.tp, self.ssh, self.sv = (writers[profile] for profile in PROFILES)
+        try:
+            self.write_model()
+        finally:
+            for writer in writers.values():
+                writer.close()
+        return {'substations': self.substations, 'objects': self.objects,
+                'violations': {name: count for name, count in self.violations.items() if count},
+                'files': [f'{profile}.xml' for profile in PROFILES]}
+
+    def identified(self, name, description=None):
+        self.objects += 1
+        properties = [('IdentifiedObject.name', name)]
+        if description:
+            properties.append(('IdentifiedObject.description', description))
+        return properties
+
+    def add_shared(self, key, cls, name, properties):
+        mrid = self.shared[key] = self.mrid()
+        self.eq.add(cls, mrid, self.identified(name) + properties)
+        return mrid
+
+    def write_model(self):
+        eq, ssh, sv = self.eq, self.ssh, self.sv
+        region = self.add_shared('region', 'GeographicalRegion', 'Region', [])
+        self.add_shared('sub_region', 'SubGeographicalRegion', 'Subregion',
+                        [('SubGeographicalRegion.Region', ref(region))])
+        for voltage in (HV, MV):
+            self.add_shared(voltage, 'BaseVoltage', f'{number(voltage)} kV',
+                            [('BaseVoltage.nominalVoltage', number(voltage))])
+        self.add_shared('load_response', 'LoadResponseCharacteristic', 'Constant power', [
+            ('LoadResponseCharacteristic.exponentModel', 'false'),
+            ('LoadResponseCharacteristic.pConstantPower', '1'), ('LoadResponseCharacteristic.pConstantCurrent', '0'),
+            ('LoadResponseCharacteristic.pConstantImpedance', '0'), ('LoadResponseCharacteristic.qConstantPower', '1'),
+            ('LoadResponseCharacteristic.qConstantCurrent', '0'),
+            ('LoadResponseCharacteristic.qConstantImpedance', '0')])
+        self.add_shared('limit_type', 'OperationalLimitType', 'PATL', [
+            ('OperationalLimitType.direction', enum('OperationalLimitDirectionKind.absoluteValue')),
+            ('entsoe:OperationalLimitType.limitType', Reference(ENTSOE + 'LimitTypeKind.patl'))])
+        load_area = self.add_shared('load_area', 'LoadArea', 'Load area', [])
+        sub_load_area = self.add_shared('sub_load_area', 'SubLoadArea', 'Sub load area',
+                                        [('SubLoadArea.LoadArea', ref(load_area))])
+        self.add_shared('load_group', 'NonConformLoadGroup', 'Loads', [('LoadGroup.SubLoadArea', ref(sub_load_area))])
+
+        substations = [self.write_substation(index) for index in range(self.substations)]
+        # the 220 kV busbars in a ring, with chords
+        lines = []
+        if self.substations > 1:
+            for index in range(self.substations if self.substations > 2 else 1):
+                lines.append((index, (index + 1) % self.substations))
+                if index % CHORD_EVERY == 0 and self.substations > 4:
+                    lines.append((index, (index + self.substations // 2) % self.substations))
+        for index, (first, second) in enumerate(lines):
+            self.write_line(index, substations[first], substations[second])
+
+        # the model exchanges power with its neighbours over one tie line
+        boundary_node, tie_flow_terminal, interchange = self.write_tie_line(substations[0])
+        control_area = self.mrid()
+        eq.add('ControlArea', control_area, self.identified('Control area') +
+               [('entsoe:IdentifiedObject.energyIdentCodeEic', CONTROL_AREA_EIC),
+                ('ControlArea.type', enum('ControlAreaTypeKind.Interchange')),
+                ('ControlArea.EnergyArea', ref(load_area))])
+        ssh.add('ControlArea', control_area, [('ControlArea.netInterchange', number(interchange)),
+                                              ('ControlArea.pTolerance', '10')], define=False)
+        self.objects += 1
+        eq.add('TieFlow', self.mrid(), [('TieFlow.ControlArea', ref(control_area)),
+                                        ('TieFlow.Terminal', ref(tie_flow_terminal)),
+                                        ('TieFlow.positiveFlowIn', 'true')])
+
+        island = self.mrid()
+        nodes = [node for substation in substations for node in substation['nodes']] + [boundary_node]
+        angle_reference = next(substation for substation in substations if substation['generator'])['nodes'][0]
+        self.objects += 1
+        sv.add('TopologicalIsland', island, [('IdentifiedObject.name', 'Island'),
+                                             ('IdentifiedObject.description', 'converged'),
+                                             ('TopologicalIsland.AngleRefTopologicalNode', ref(angle_reference))] +
+               [('TopologicalIsland.TopologicalNodes', ref(node)) for node in nodes])
+
+    def terminal(self, equipment, node, topological_node, sequence, name, flow=None, violation=None):
+        terminal = self.mrid()
+        properties = self.identified(name) + [('ACDCTerminal.sequenceNumber', str(sequence)),
+                                              ('Terminal.ConductingEquipment', ref(equipment))]
+        if violation != 'dangling_terminal':
+            properties.append(('Terminal.ConnectivityNode', ref(node)))
+        self.eq.add('Terminal', terminal, properties)
+        self.tp.add('Terminal', terminal, [('Terminal.TopologicalNode', ref(topological_node))], define=False)
+        self.ssh.add('Terminal', terminal, [('ACDCTerminal.connected', 'true')], define=False)
+        if flow is not None:
+            self.objects += 1
+            self.sv.add('SvPowerFlow', self.mrid(), [('SvPowerFlow.Terminal', ref(terminal)),
+                                                     ('SvPowerFlow.p', number(flow[0])),
+                                                     ('SvPowerFlow.q', number(flow[1]))])
+        return terminal
+
+    def limit_set(self, terminal, name, value):
+        limit_set = self.mrid()
+        self.eq.add('OperationalLimitSet', limit_set, self.identified(f'{name} limits') +
+                    [('OperationalLimitSet.Terminal', ref(terminal))])
+        self.eq.add('CurrentLimit', self.mrid(), self.identified(f'{name} PATL') +
+                    [('OperationalLimit.OperationalLimitSet', ref(limit_set)),
+                     ('OperationalLimit.OperationalLimitType', ref(self.shared['limit_type'])),
+                     ('CurrentLimit.value', value)])
+
+    def node(self, container, name, voltage, violation=None, boundary=False):
+        """A connectivity node and the topological node it is in, with its voltage."""
+        node, topological_node = self.mrid(), self.mrid()
+        properties = self.identified(f'{name} node')
+        if violation == 'missing_name':
+            properties = properties[1:]
+        self.eq.add('ConnectivityNode', node, properties + [('ConnectivityNode.ConnectivityNodeContainer',
+                                                             ref(container))])
+        self.objects += 1
+        tp_properties = [('IdentifiedObject.name', name),
+                         ('TopologicalNode.BaseVoltage', ref(self.shared[voltage])),
+                         ('TopologicalNode.ConnectivityNodeContainer', ref(container))]
+        if boundary:
+            tp_properties += [('entsoe:TopologicalNode.boundaryPoint', 'true'),
+                              ('entsoe:TopologicalNode.fromEndIsoCode', 'HU'),
+                              ('entsoe:TopologicalNode.toEndIsoCode', 'SK')]
+        self.tp.add('TopologicalNode', topological_node, tp_properties)
+        self.tp.add('ConnectivityNode', node, [('ConnectivityNode.TopologicalNode', ref(topological_node))],
+                    define=False)
+        voltage_value = voltage * self.rng.uniform(0.97, 1.03)
+        if violation == 'low_voltage':
+            voltage_value = voltage * 0.2  # below 0.4 per unit
+        self.objects += 1
+        self.sv.add('SvVoltage', self.mrid(), [('SvVoltage.TopologicalNode', ref(topological_node)),
+                                               ('SvVoltage.v', number(voltage_value)),
+                                               ('SvVoltage.angle', number(self.rng.uniform(-10, 10)))])
+        return node, topological_node
+
+    def write_substation(self, index):
+        eq, ssh, rng = self.eq, self.ssh, self.rng
+        violation = self.violation()
+        name = f'S{index + 1}'
+        substation = self.mrid()
+        eq.add('Substation', substation, self.identified(name) + [('Substation.Region',
+                                                                   ref(self.shared['sub_region']))])
+        levels = {}
+        for voltage in (HV, MV):
+            level, busbar = self.mrid(), self.mrid()
+            eq.add('VoltageLevel', level, self.identified(f'{name} {number(voltage)} kV') +
+                   [('VoltageLevel.BaseVoltage', ref(self.shared[voltage])),
+                    ('VoltageLevel.Substation', ref(substation)),
+                    ('VoltageLevel.lowVoltageLimit', number(voltage * 0.9)),
+                    ('VoltageLevel.highVoltageLimit', number(voltage * 1.1))])
+            node, topological_node = self.node(level, f'{name} {number(voltage)} kV', voltage, violation=(
+                violation if (violation, voltage) in (('missing_name', MV), ('low_voltage', HV)) else None))
+            levels[voltage] = (level, node, topological_node)
+            eq.add('BusbarSection', busbar, self.identified(f'{name} {number(voltage)} kV busbar') +
+                   [('Equipment.EquipmentContainer', ref(level)), ('Equipment.aggregate', 'false'),
+                    ('BusbarSection.ipMax', '40')])
+            self.terminal(busbar, node, topological_node, 1, f'{name} {number(voltage)} kV busbar')
+
+        # transformer between the voltage levels, carrying the load
+        p, q = round(rng.uniform(10, 100), 1), round(rng.uniform(0, 30), 1)
+        transformer = self.mrid()
+        eq.add('PowerTransformer', transformer, self.identified(f'{name} transformer') +
+               [('Equipment.EquipmentContainer', ref(substation)), ('Equipment.aggregate', 'false'),
+                ('PowerTransformer.isPartOfGeneratorUnit', 'false')])
+        for end_number, voltage in enumerate((HV, MV), start=1):
+            level, node, topological_node = levels[voltage]
+            flow = (p, q) if end_number == 1 else (-p, -q)
+            terminal = self.terminal(transformer, node, topological_node, end_number,
+                                     f'{name} transformer {end_number}', flow=flow,
+                                     violation=violation if voltage == MV else None)
+            if end_number == 1:
+                self.limit_set(terminal, f'{name} transformer {end_number}', '800')
+            impedance = (0.5, 25.0) if end_number == 1 else (0.0, 0.0)
+            rated_u = number(voltage)
+            if violation == 'invalid_datatype' and end_number == 1:
+                rated_u = 'high'
+            eq.add('PowerTransformerEnd', self.mrid(), self.identified(f'{name} transformer end {end_number}') +
+                   [('PowerTransformerEnd.PowerTransformer', ref(transformer)),
+                    ('TransformerEnd.Terminal', ref(terminal)),
+                    ('TransformerEnd.BaseVoltage', ref(self.shared[voltage])),
+                    ('TransformerEnd.endNumber', str(end_number)), ('TransformerEnd.grounded', 'false'),
+                    ('PowerTransformerEnd.ratedU', rated_u), ('PowerTransformerEnd.ratedS', '300'),
+                    ('PowerTransformerEnd.r', number(impedance[0])), ('PowerTransformerEnd.x', number(impedance[1])),
+                    ('PowerTransformerEnd.b', '0'), ('PowerTransformerEnd.g', '0'),
+                    ('PowerTransformerEnd.r0', number(impedance[0])),
+                    ('PowerTransformerEnd.x0', number(impedance[1])),
+                    ('PowerTransformerEnd.b0', '0'), ('PowerTransformerEnd.g0', '0'),
+                    ('PowerTransformerEnd.phaseAngleClock', '0'),
+                    ('PowerTransformerEnd.connectionKind', enum('WindingConnection.Y'))])
+
+        # load on the 110 kV side
+        level, node, topological_node = levels[MV]
+        load = self.mrid()
+        eq.add('NonConformLoad', load, self.identified(f'{name} load') +
+               [('Equipment.EquipmentContainer', ref(level)), ('Equipment.aggregate', 'false'),
+                ('EnergyConsumer.LoadResponse', ref(self.shared['load_response'])),
+                ('NonConformLoad.LoadGroup', ref(self.shared['load_group']))])
+        self.terminal(load, node, topological_node, 1, f'{name} load', flow=(p, q))
+        ssh.add('NonConformLoad', load, [('EnergyConsumer.p', number(p)), ('EnergyConsumer.q', number(q))],
+                define=False)
+
+        generator = index % GENERATOR_EVERY == 0
+        if generator:
+            self.write_generator(index, name, substation, levels[HV])
+        return {'nodes': [levels[HV][2], levels[MV][2]], 'hv': levels[HV], 'generator': generator, 'name': name}
+
+    def write_generator(self, index, name, substation, level):
+        eq, ssh = self.eq, self.ssh
+        level, node, topological_node = level
+        machine, unit = self.mrid(), self.mrid()
+        p = round(self.rng.uniform(50, 250), 1)
+        eq.add('ThermalGeneratingUnit', unit, self.identified(f'{name} unit') +
+               [('Equipment.EquipmentContainer', ref(substation)), ('Equipment.aggregate', 'false'),
+                ('GeneratingUnit.initialP', number(p)), ('GeneratingUnit.maxOperatingP', '300'),
+                ('GeneratingUnit.minOperatingP', '0'), ('GeneratingUnit.nominalP', '300'),
+                ('GeneratingUnit.genControlSource', enum('GeneratorControlSource.offAGC'))])
+        eq.add('SynchronousMachine', machine, self.identified(f'{name} generator') +
+               [('Equipment.EquipmentContainer', ref(level)), ('Equipment.aggregate', 'false'),
+                ('RotatingMachine.GeneratingUnit', ref(unit)), ('RotatingMachine.ratedS', '350'),
+                ('RotatingMachine.ratedU', number(HV)), ('RotatingMachine.ratedPowerFactor', '0.85'),
+                ('SynchronousMachine.maxQ', '150'), ('SynchronousMachine.minQ', '-100'),
+                ('SynchronousMachine.qPercent', '100'),
+                ('SynchronousMachine.type', enum('SynchronousMachineKind.generator')),
+                ('SynchronousMachine.shortCircuitRotorType', enum('ShortCircuitRotorKind.turboSeries1')),
+                ('SynchronousMachine.r', '0.002'), ('SynchronousMachine.r0', '0.002'),
+                ('SynchronousMachine.r2', '0.02'), ('SynchronousMachine.x0', '0.1'),
+                ('SynchronousMachine.x2', '0.2'), ('SynchronousMachine.satDirectSubtransX', '0.2'),
+                ('SynchronousMachine.earthing', 'false'), ('SynchronousMachine.ikk', '0'),
+                ('SynchronousMachine.voltageRegulationRange', '10')])
+        self.terminal(machine, node, topological_node, 1, f'{name} generator', flow=(-p, -p * 0.2))
+        ssh.add('SynchronousMachine', machine, [
+            ('RotatingMachine.p', number(-p)), ('RotatingMachine.q', number(-p * 0.2)),
+            ('RegulatingCondEq.controlEnabled', 'false'),
+            ('SynchronousMachine.operatingMode', enum('SynchronousMachineOperatingMode.generator')),
+            ('SynchronousMachine.referencePriority', '1' if index == 0 else '0')], define=False)
+        # distinct participation factors, the first unit picks up most of the mismatch
+        normal_pf = number(1 / (index // GENERATOR_EVERY + 1))
+        ssh.add('ThermalGeneratingUnit', unit, [('GeneratingUnit.normalPF', normal_pf)], define=False)
+
+    def line_segment(self, line, name, length):
+        segment = self.mrid()
+        self.eq.add('ACLineSegment', segment, self.identified(name) +
+                    [('Equipment.EquipmentContainer', ref(line)), ('Equipment.aggregate', 'false'),
+                     ('ConductingEquipment.BaseVoltage', ref(self.shared[HV])),
+                     ('Conductor.length', number(length)),
+                     ('ACLineSegment.r', number(0.05 * length)), ('ACLineSegment.x', number(0.4 * length)),
+                     ('ACLineSegment.bch', number(2.8e-6 * length)), ('ACLineSegment.gch', '0'),
+                     ('ACLineSegment.r0', number(0.15 * length)), ('ACLineSegment.x0', number(1.2 * length)),
+                     ('ACLineSegment.b0ch', number(1.8e-6 * length)), ('ACLineSegment.g0ch', '0'),
+                     ('ACLineSegment.shortCircuitEndTemperature', '80')])
+        return segment
+
+    def write_line(self, index, first, second):
+        rng = self.rng
+        name = f'L{index + 1} {first["name"]}-{second["name"]}'
+        line = self.mrid()
+        self.eq.add('Line', line, self.identified(name) + [('Line.Region', ref(self.shared['sub_region']))])
+        segment = self.line_segment(line, name, round(rng.uniform(5, 150), 1))
+        p, q = round(rng.uniform(-100, 100), 1), round(rng.uniform(-20, 20), 1)
+        for sequence, end in enumerate((first, second), start=1):
+            level, node, topological_node = end['hv']
+            flow = (p, q) if sequence == 1 else (-p, -q)
+            terminal = self.terminal(segment, node, topological_node, sequence, f'{name} {sequence}', flow=flow)
+            self.limit_set(terminal, f'{name} {sequence}', '1000')
+
+    def write_tie_line(self, substation):
+        """
+        A line from the substation to a boundary node, where an equivalent injection stands for the neighbouring
+        grid; returns the boundary node, the terminal of the tie flow and the net interchange.
+        """
+        eq, ssh = self.eq, self.ssh
+        name = f'Tie line {substation["name"]}'
+        line = self.mrid()
+        eq.add('Line', line, self.identified(name) + [('Line.Region', ref(self.shared['sub_region']))])
+        boundary_node, boundary_topological_node = self.node(line, f'{name} boundary', HV, boundary=True)
+        segment = self.line_segment(line, name, round(self.rng.uniform(5, 50), 1))
+        # exported power, consumed by the equivalent injection
+        p, q = round(self.rng.uniform(10, 50), 1), round(self.rng.uniform(-10, 10), 1)
+        level, node, topological_node = substation['hv']
+        terminal = self.terminal(segment, node, topological_node, 1, f'{name} 1', flow=(p, q))
+        self.limit_set(terminal, f'{name} 1', '1000')
+        tie_flow_terminal = self.terminal(segment, boundary_node, boundary_topological_node, 2, f'{name} 2',
+                                          flow=(-p, -q))
+        self.limit_set(tie_flow_terminal, f'{name} 2', '1000')
+        injection = self.mrid()
+        eq.add('EquivalentInjection', injection, self.identified(f'{name} neighbour') +
+               [('Equipment.EquipmentContainer', ref(line)), ('Equipment.aggregate', 'false'),
+                ('ConductingEquipment.BaseVoltage', ref(self.shared[HV])),
+                ('EquivalentInjection.regulationCapability', 'false'),
+                ('EquivalentInjection.minP', '-500'), ('EquivalentInjection.maxP', '500'),
+                ('EquivalentInjection.minQ', '-200'), ('EquivalentInjection.maxQ', '200'),
+                ('EquivalentInjection.r', '1'), ('EquivalentInjection.x', '10'),
+                ('EquivalentInjection.r0', '1'), ('EquivalentInjection.x0', '10'),
+                ('EquivalentInjection.r2', '1'), ('EquivalentInjection.x2', '10')])
+        self.terminal(injection, boundary_node, boundary_topological_node, 1, f'{name} neighbour', flow=(p, q))
+        ssh.add('EquivalentInjection', injection, [('EquivalentInjection.p', number(p)),
+                                                   ('EquivalentInjection.q', number(q)),
+                                                   ('EquivalentInjection.regulationStatus', 'false')],
+                define=False)
+        return boundary_topological_node, tie_flow_terminal, -p
+
+
+def pack(directory, files, archive):
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for file in files:
+            zip_file.write(os.path.join(directory, file), file)
+
+
+def generate(substations, directory, seed=1, violation_rate=0.0, archive=True):
+    """Write a model into ``directory`` (and ``<directory>.zip``); returns its manifest."""
+    manifest = GridGenerator(substations, seed, violation_rate).write(directory)
+    manifest.update({'seed': seed, 'violation_rate': violation_rate})
+    if archive:
+        pack(directory, manifest['files'], directory.rstrip('/\\') + '.zip')
+    with open(os.path.join(directory, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="generate", description="Generate a synthetic CGMES 2.4 model.")
+    parser.add_argument("substations", type=int, help="number of substations, at least 2")
+    parser.add_argument("-o", "--output", help="output directory (default: benchmarks/data/grid-<substations>)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed (default: 1)")
+    parser.add_argument("--violation-rate", type=float, default=0.0,
+                        help="share of substations with one injected violation (default: 0)")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.join(os.path.dirname(__file__), 'data', f'grid-{args.substations}')
+    manifest = generate(args.substations, output, args.seed, args.violation_rate)
+    print(json.dumps(manifest))
+
+
+if __name__ == '__main__':
+    main()
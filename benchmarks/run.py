@@ -0,0 +1,284 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+"""
+End-to-end benchmark of the validation pipeline.
+
+Every configuration (model size and parser backend) runs in a fresh interpreter, so the peak memory of one does
+not hide the next. The stages are timed one after the other, as the GUI and the CLI run them:
+
+- ``archive_read``: every member of the zipped model decompressed, without parsing
+- ``parse``: the archive parsed with ``CimGraph.parse`` into the instance store
+- ``merge``: one pass over the merged instance graph, as the validator reads the union of the profiles
+- ``shacl_load``: the shapes parsed and compiled, with an empty shapes cache (writing it included)
+- ``shacl_load_cached``: the same shapes loaded from the cache written by the stage before
+- ``validate``: ``ModelValidator.validate``
+- ``report``: the Excel report written
+
+Each stage is one JSON line in the results file, with the commit, the platform, the seconds it took and the peak
+resident memory of the process after it (the Python allocations too with ``--tracemalloc``). Models are generated
+with ``benchmarks.generate`` below ``benchmarks/data`` on the first run and reused afterwards::
+
+    python -m benchmarks.run --sizes 10 100 1000 --parsers sax fast --output results.jsonl
+    python -m benchmarks.compare baseline.jsonl results.jsonl
+
+The default shapes are the RDFS based constraints of the EQ, TP, SSH, SV and file header profiles and the QoCDC 3.3
+rules, without the two files rdflib cannot load: ``Level2_IGMCGM.ttl`` has a query rdflib does not parse and
+``MainShapeQoCDC33.ttl`` imports a file that is not shipped.
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+from application.metrics import peak_rss_mb
+from benchmarks.generate import generate
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(REPOSITORY, 'benchmarks', 'data')
+CONSTRAINTS_DIR = os.path.join(REPOSITORY, 'CGMES_v2_4_constraints')
+RDFS_PROFILES = ['EquipmentProfileCoreOperationShortCircuit', 'TopologyProfile', 'SteadyStateHypothesisProfile',
+                 'StateVariablesProfile', 'FileHeaderProfile']
+EXCLUDED_SHAPES = ['Level2_IGMCGM.ttl', 'MainShapeQoCDC33.ttl']
+STAGES = ['archive_read', 'parse', 'merge', 'shacl_load', 'shacl_load_cached', 'validate', 'report']
+# stages run untimed when a stage that needs them is timed
+PREREQUISITES = {'merge': ['parse'], 'shacl_load_cached': ['shacl_load'], 'validate': ['parse', 'shacl_load'],
+                 'report': ['validate']}
+DEFAULT_SIZES = [10, 100]
+DEFAULT_PARSERS = ['sax', 'oxigraph', 'fast']
+CHUNK_SIZE = 1024 * 1024
+
+
+def default_shapes():
+    shapes = [os.path.join(CONSTRAINTS_DIR, 'RDFSbasedConstraints', f'{profile}.ttl') for profile in RDFS_PROFILES]
+    shapes += [path for path in sorted(glob.glob(os.path.join(CONSTRAINTS_DIR, 'QoCDC33', '*.ttl')))
+               if os.path.basename(path) not in EXCLUDED_SHAPES]
+    return shapes
+
+
+def model_archive(substations, seed, violation_rate):
+    """The zipped model of this size, generated unless a matching one exists."""
+    directory = os.path.join(DATA_DIR, f'grid-{substations}-seed{seed}-rate{violation_rate:g}')
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = None
+    archive = directory + '.zip'
+    if manifest is None or not os.path.exists(archive):
+        manifest = generate(substations, directory, seed, violation_rate)
+    return archive, manifest
+
+
+def required_stages(stages):
+    required = set()
+    pending = list(stages)
+    while pending:
+        stage = pending.pop()
+        if stage not in required:
+            required.add(stage)
+            pending.extend(PREREQUISITES.get(stage, ()))
+    return required
+
+
+def environment():
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=REPOSITORY, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+class StageRecorder:
+    """Times the stages of one configuration and writes a record per stage."""
+
+    def __init__(self, output, record, trace_python=False):
+        self.output = output
+        self.record = record
+        self.trace_python = trace_python
+        if trace_python:
+            tracemalloc.start()
+
+    def run(self, stage, function):
+        if self.trace_python:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        counters = function() or {}
+        seconds = time.perf_counter() - start
+        record = dict(self.record, stage=stage, seconds=round(seconds, 4), peak_rss_mb=peak_rss_mb(),
+                      python_peak_mb=None, **counters)
+        if self.trace_python:
+            record['python_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        with open(self.output, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+        print(f"{record['substations']:>7} {record['parser']:<9} {stage:<18} {seconds:9.3f} s "
+              f"{record['peak_rss_mb'] or 0:8.1f} MB", flush=True)
+
+
+def run_configuration(config):
+    """The stages of one configuration, in this process; the records are appended to ``config['output']``."""
+    # imported here, so the interpreter running the configurations loads nothing of the application
+    from rdflib import RDF, SH
+
+    from application.pruning import ModelHistogram
+    from application.validator import ModelValidator
+
+    archive, manifest = model_archive(config['substations'], config['seed'], config['violation_rate'])
+    record = dict(config['environment'], substations=config['substations'], parser=config['parser'],
+                  named_graphs=config['named_graphs'], store=config['store'], native_sparql=config['native_sparql'],
+                  shape_workers=config['shape_workers'], objects=manifest['objects'], run=config['run'])
+    recorder = StageRecorder(config['output'], record, config['tracemalloc'])
+    stages = config['stages']
+    required = required_stages(stages)
+    cache_dir = tempfile.mkdtemp(prefix='modshape-benchmark-')
+    # the caches of this run only: the cold load does not find the shapes an earlier run compiled
+    os.environ['MODSHAPE_CACHE_DIR'] = cache_dir
+    validator = ModelValidator(parser=config['parser'], named_graphs=config['named_graphs'], store=config['store'],
+                               native_sparql=config['native_sparql'], shape_workers=config['shape_workers'])
+    validator.load_datatype_mapping([])
+    results = None
+
+    def archive_read():
+        size = 0
+        with zipfile.ZipFile(archive) as zip_file:
+            for member in zip_file.infolist():
+                with zip_file.open(member) as file:
+                    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                        size += len(chunk)
+        return {'bytes': size}
+
+    def parse():
+        validator.process_instance_data_contents([archive])
+        return {'triples': len(validator.merged_instance_graph)}
+
+    def merge():
+        histogram = ModelHistogram.from_graph(validator.merged_instance_graph)
+        return {'triples': histogram.total}
+
+    def shacl_load():
+        validator.load_shacl(config['shapes'])
+        return {'shapes': len(validator.compiled_shapes.shapes_graph.shapes)}
+
+    def validate():
+        nonlocal results
+        conforms, results, _ = validator.validate()
+        return {'conforms': bool(conforms), 'results': sum(1 for _ in results.subjects(RDF.type, SH.ValidationResult))}
+
+    def report():
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.xlsx')
+            validator.write_excel_report(results, path)
+            return {'bytes': os.path.getsize(path)}
+
+    functions = {
+        'archive_read': archive_read,
+        'parse': parse,
+        'merge': merge,
+        'shacl_load': shacl_load,
+        'shacl_load_cached': shacl_load,
+        'validate': validate,
+        'report': report,
+    }
+    try:
+        for stage in STAGES:
+            if stage in stages:
+                recorder.run(stage, functions[stage])
+            elif stage in required:
+                functions[stage]()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.run", description="Benchmark the ModShape pipeline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help=f"model sizes in substations (default: {' '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument("--parsers", nargs="+", default=DEFAULT_PARSERS,
+                        help=f"parser backends (default: {' '.join(DEFAULT_PARSERS)})")
+    parser.add_argument("--stages", nargs="+", default=STAGES, help="stages to time (default: all)")
+    parser.add_argument("--shapes", nargs="+", help="SHACL files (default: RDFS and QoCDC 3.3 constraints)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of every configuration (default: 1)")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the generated models (default: 1)")
+    parser.add_argument("--violation-rate", type=float, default=0.01,
+                        help="share of substations with a violation (default: 0.01)")
+    parser.add_argument("--named-graphs", action="store_true", help="parse every file into its own named graph")
+    parser.add_argument("--store", default="Memory", help="rdflib store of the instance data (default: Memory)")
+    parser.add_argument("--native-sparql", action="store_true", help="run sh:sparql constraints on Oxigraph")
+    parser.add_argument("--shape-workers", type=int, default=1, help="processes validating shapes (default: 1)")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="also record the peak of Python allocations per stage (slower)")
+    parser.add_argument("-o", "--output", default="benchmark-results.jsonl",
+                        help="JSON lines file the records are appended to (default: benchmark-results.jsonl)")
+    parser.add_argument("--configuration", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.configuration:
+        # a child process running one configuration
+        run_configuration(json.loads(args.configuration))
+        return 0
+
+    from application.validator import PARSER_FORMATS
+
+    for name in args.parsers:
+        if name not in PARSER_FORMATS:
+            parser.error(f"unknown parser '{name}', expected one of {', '.join(PARSER_FORMATS)}")
+    for name in args.stages:
+        if name not in STAGES:
+            parser.error(f"unknown stage '{name}', expected one of {', '.join(STAGES)}")
+
+    base = {
+        'environment': environment(),
+        'shapes': [os.path.abspath(path) for path in args.shapes or default_shapes()],
+        'stages': args.stages,
+        'seed': args.seed,
+        'violation_rate': args.violation_rate,
+        'named_graphs': args.named_graphs,
+        'store': args.store,
+        'native_sparql': args.native_sparql,
+        'shape_workers': args.shape_workers,
+        'tracemalloc': args.tracemalloc,
+        'output': os.path.abspath(args.output),
+    }
+    failed = 0
+    for substations in args.sizes:
+        # generated once, before any configuration is timed
+        model_archive(substations, args.seed, args.violation_rate)
+        for parser_name in args.parsers:
+            for run in range(args.repeat):
+                config = dict(base, substations=substations, parser=parser_name, run=run)
+                process = subprocess.run([sys.executable, '-m', 'benchmarks.run', '--configuration',
+                                          json.dumps(config)], cwd=REPOSITORY, stdout=subprocess.PIPE, text=True)
+                # the stage lines only, not the timings the pipeline prints itself
+                for line in process.stdout.splitlines():
+                    if any(f' {stage} ' in line for stage in STAGES):
+                        print(line, flush=True)
+                if process.returncode != 0:
+                    failed += 1
+                    print(f"{substations} {parser_name}: failed with exit code {process.returncode}", flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
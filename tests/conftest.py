@@ -0,0 +1,24 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+import os
+
+import pytest
+
+from benchmarks.generate import generate
+from benchmarks.run import CONSTRAINTS_DIR, default_shapes
+
+DATATYPE_MAPPING = [os.path.join(CONSTRAINTS_DIR, 'DatatypeMapping', 'rdfs_info_CGMES2415simple.json')]
+
+
+@pytest.fixture(scope='session')
+def shacl_files():
+    return default_shapes()
+
+
+@pytest.fixture(scope='session')
+def model_files(tmp_path_factory):
+    """Instance files of a small synthetic model with injected violations."""
+    directory = str(tmp_path_factory.mktemp('model') / 'grid')
+    manifest = generate(3, directory, seed=3, violation_rate=0.5, archive=False)
+    return [os.path.join(directory, file) for file in manifest['files']]
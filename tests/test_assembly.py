@@ -0,0 +1,80 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+import os
+
+from rdflib import RDF, SH, Graph, URIRef
+
+from application.assembly import ModelAssembly, split_shapes
+from application.imports import ImportResolver
+from application.validator import ModelValidator
+from benchmarks.run import CONSTRAINTS_DIR
+from benchmarks.generate import generate
+from tests.conftest import DATATYPE_MAPPING
+from tests.test_stores import validation_results, result_rows
+
+BUNDLE = os.path.join(CONSTRAINTS_DIR, 'MainShapeQoCDC33.ttl')
+CGM_LEVELS = ['Level2_CGM', 'Level2_IGMCGM', 'Level3_IGMCGM', 'Level4_IGMCGM', 'Level5_IGMCGM', 'Level6_IGMCGM',
+              'Level7_CGM', 'Level7_IGMCGM', 'Level8_CGM', 'Level8_IGMCGM']
+
+
+def shapes_of(level):
+    graph = Graph().parse(os.path.join(CONSTRAINTS_DIR, 'QoCDC33', f'{level}.ttl'))
+    return {shape for shape_type in (SH.NodeShape, SH.PropertyShape) for shape in graph.subjects(RDF.type, shape_type)
+            if isinstance(shape, URIRef)}
+
+
+def test_bundle_imports_of_the_cgm_scope_are_split_off():
+    igm_files, cgm_files = split_shapes([BUNDLE], ImportResolver(use_cache=False))
+    assert igm_files == [BUNDLE]
+    assert [os.path.splitext(os.path.basename(path))[0] for path in cgm_files] == CGM_LEVELS
+
+
+def test_bundle_shapes_are_compiled_in_their_scope(tmp_path, monkeypatch):
+    monkeypatch.setenv('MODSHAPE_CACHE_DIR', str(tmp_path))
+    igm_shapes, cgm_shapes = ModelAssembly(ModelValidator()).compile_shapes([BUNDLE])
+    for level in ('Level2_CGM', 'Level7_IGMCGM'):
+        shapes = shapes_of(level)
+        assert shapes and all((shape, RDF.type, None) in cgm_shapes.graph for shape in shapes)
+        assert not any((shape, None, None) in igm_shapes.graph for shape in shapes)
+    shapes = shapes_of('Level2_IGM')
+    assert shapes and all((shape, RDF.type, None) in igm_shapes.graph for shape in shapes)
+    assert not any((shape, None, None) in cgm_shapes.graph for shape in shapes)
+
+
+def assembled(members, shacl_files):
+    validator = ModelValidator(store='Oxigraph', native_sparql=True)
+    validator.load_datatype_mapping(DATATYPE_MAPPING)
+    assembly = ModelAssembly(validator)
+    for name, files in members.items():
+        assembly.load_member(name, files)
+    return assembly, validator.compile_shacl(shacl_files)
+
+
+def without_messages(rows):
+    # some messages name one of several nodes, whichever a query meets first
+    conforms, rows = rows
+    return conforms, sorted((row[:3] + row[4:] for row in rows), key=str)
+
+
+def test_native_sparql_runs_on_the_named_graphs_of_a_union(model_files, shacl_files, tmp_path):
+    directory = str(tmp_path / 'other')
+    other_files = [os.path.join(directory, file) for file in generate(3, directory, seed=4, archive=False)['files']]
+    assembly, shapes = assembled({'A': model_files, 'B': other_files}, shacl_files)
+    # the named graphs of the members are queried, nothing is copied, and lookups skip the duplicate checks
+    view = assembly.union()
+    assert view.disjoint and view.dataset[0] is assembly.store.inner
+    _, cgm_result = assembly.validate(cgm_shapes=shapes)
+    assert without_messages(result_rows(cgm_result)) == \
+        without_messages(validation_results(model_files + other_files, shacl_files, store='Oxigraph',
+                                            native_sparql=True))
+
+
+def test_members_sharing_triples_are_copied_for_native_sparql(model_files, shacl_files):
+    # the profiles of one model repeat the rdf:type of the objects they describe
+    assembly, shapes = assembled({'A': model_files[:2], 'B': model_files[2:]}, shacl_files)
+    view = assembly.union()
+    assert not view.disjoint and view.dataset is None
+    _, cgm_result = assembly.validate(cgm_shapes=shapes)
+    assert result_rows(cgm_result) == validation_results(model_files, shacl_files, store='Oxigraph',
+                                                         native_sparql=True)
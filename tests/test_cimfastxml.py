@@ -0,0 +1,61 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+from array import array
+
+from application import cimfastxml, modelcache
+from application.validator import ModelValidator
+
+HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" '
+          'xmlns:cim="http://iec.ch/TC57/2013/CIM-schema-cim16#">\n')
+NODE = '<cim:Terminal rdf:ID="_t{0}"><cim:IdentifiedObject.name>t{0}</cim:IdentifiedObject.name></cim:Terminal>\n'
+# a nested node element, outside the subset of the fast path
+NESTED = ('<cim:Terminal rdf:ID="_nested"><cim:Terminal.ConductingEquipment><cim:Breaker rdf:ID="_b"/>'
+          '</cim:Terminal.ConductingEquipment></cim:Terminal>\n')
+
+
+def test_fallback_after_flushed_batches_counts_every_triple_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(cimfastxml, 'BATCH_SIZE', 10)
+    monkeypatch.setenv('MODSHAPE_CACHE_DIR', str(tmp_path / 'cache'))
+    path = tmp_path / 'EQ.xml'
+    path.write_text(HEADER + ''.join(NODE.format(index) for index in range(100)) + NESTED + '</rdf:RDF>\n')
+
+    validator = ModelValidator(parser='fast', cache_models=True)
+    validator.load_datatype_mapping([])
+    validator.load_instance_data([str(path)])
+    triples = len(validator.merged_instance_graph)
+    assert triples == 100 * 2 + 3
+    assert validator.model_histogram.total == triples
+    assert validator.metrics.counters['triples'] == triples
+
+    entry = modelcache.read_entry(modelcache.entry_path(str(path), 'fast', validator.datatypes_mapping))
+    ids = array('l')
+    for ids_bytes in entry[1].values():
+        ids.frombytes(ids_bytes)
+    assert len(ids) == triples * 3
+
+
+def test_element_without_namespace_falls_back(tmp_path, monkeypatch):
+    fallbacks = []
+    parse_fast = cimfastxml.CIMFastXMLParser.parse_fast
+
+    def recorded(self, *args, **kwargs):
+        try:
+            parse_fast(self, *args, **kwargs)
+        except cimfastxml.FallBack as e:
+            fallbacks.append(str(e))
+            raise
+
+    monkeypatch.setattr(cimfastxml.CIMFastXMLParser, 'parse_fast', recorded)
+    path = tmp_path / 'EQ.xml'
+    # Terminal has no namespace, the fast path must not make it relative to the document
+    path.write_text(HEADER + NODE.format(0) + '<Terminal rdf:ID="_plain"/>\n</rdf:RDF>\n')
+
+    graphs = []
+    for parser in ('fast', 'sax'):
+        validator = ModelValidator(parser=parser)
+        validator.load_datatype_mapping([])
+        validator.load_instance_data([str(path)])
+        graphs.append(set(validator.merged_instance_graph))
+    assert graphs[0] == graphs[1]
+    assert fallbacks == ['element Terminal without a namespace']
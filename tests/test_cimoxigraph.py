@@ -0,0 +1,35 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+import pytest
+from rdflib import BNode
+
+from application import cimoxigraph
+from application.validator import ModelValidator
+from tests.conftest import DATATYPE_MAPPING
+
+
+def parsed(model_files, **options):
+    validator = ModelValidator(store='Oxigraph', **options)
+    validator.load_datatype_mapping(DATATYPE_MAPPING)
+    validator.load_instance_data(model_files)
+    return validator
+
+
+def named_triples(graph):
+    # the triples with blank nodes aside, their labels differ from parse to parse
+    return {triple for triple in graph if not any(isinstance(term, BNode) for term in triple)}
+
+
+@pytest.mark.parametrize('named_graphs', [False, True])
+def test_native_load_parses_like_the_sax_parser(model_files, named_graphs, monkeypatch):
+    expected = parsed(model_files, parser='sax', named_graphs=named_graphs)
+    # into an Oxigraph store no triple is converted to rdflib terms
+    monkeypatch.setattr(cimoxigraph, 'TermConverter', None)
+    native = parsed(model_files, parser='oxigraph', named_graphs=named_graphs)
+    assert named_triples(native.merged_instance_graph) == named_triples(expected.merged_instance_graph)
+    assert len(native.merged_instance_graph) == len(expected.merged_instance_graph)
+    assert native.model_histogram.predicates == expected.model_histogram.predicates
+    assert native.model_histogram.classes == expected.model_histogram.classes
+    assert native.model_histogram.total == expected.model_histogram.total
+    assert native.retyped_literals() > 0
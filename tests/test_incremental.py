@@ -0,0 +1,89 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+import pytest
+from rdflib import Literal, URIRef
+
+from application.incremental import DM_NS, IncrementalValidator
+from application.pruning import ModelHistogram
+from application.validator import ModelValidator
+from benchmarks.generate import CIM, NAMESPACES
+from tests.conftest import DATATYPE_MAPPING
+from tests.test_stores import result_rows
+
+OPTIONS = [{}, {'store': 'Oxigraph', 'native_sparql': True}]
+
+
+def loaded_validator(model_files, shacl_files, **options):
+    validator = ModelValidator(**options)
+    validator.load_datatype_mapping(DATATYPE_MAPPING)
+    validator.load_shacl(shacl_files)
+    validator.load_instance_data(model_files)
+    return validator
+
+
+def generate_difference(graph, seed=1, changes=30):
+    """Reverse and forward differences to a model: literals changed or made invalid, names and references removed."""
+    rng = random.Random(seed)
+    statements = sorted(graph, key=str)
+    name, connectivity_node = URIRef(CIM + 'IdentifiedObject.name'), URIRef(CIM + 'Terminal.ConnectivityNode')
+    reverse, forward = [], []
+    literals = [triple for triple in statements if isinstance(triple[2], Literal) and triple[1] != name]
+    for s, p, o in rng.sample(literals, changes):
+        reverse.append((s, p, o))
+        value = str(not o.value).lower() if isinstance(o.value, bool) else rng.choice(['-1', '0', 'invalid'])
+        forward.append((s, p, Literal(value, datatype=o.datatype)))
+    reverse.extend(rng.sample([triple for triple in statements if triple[1] in (name, connectivity_node)], 10))
+    return reverse, forward
+
+
+def statements_xml(triples):
+    prefixes = {namespace: prefix for prefix, namespace in NAMESPACES.items()}
+    elements = []
+    for s, p, o in triples:
+        namespace, local = p[:p.rindex('#') + 1], p[p.rindex('#') + 1:]
+        tag = f'{prefixes[namespace]}:{local}'
+        value = f'<{tag} rdf:resource={quoteattr(o)}/>' if isinstance(o, URIRef) else f'<{tag}>{escape(o)}</{tag}>'
+        elements.append(f'<rdf:Description rdf:about={quoteattr(s)}>{value}</rdf:Description>')
+    return '\n'.join(elements)
+
+
+def write_difference(path, reverse, forward):
+    namespaces = ' '.join(f'xmlns:{prefix}="{namespace}"' for prefix, namespace in NAMESPACES.items())
+    path.write_text(f'''<?xml version="1.0" encoding="UTF-8"?>
+<rdf:RDF {namespaces} xmlns:dm="{DM_NS}">
+<dm:DifferenceModel rdf:about="urn:uuid:00000000-0000-0000-0000-000000000001">
+<dm:reverseDifferences rdf:parseType="Statements">
+{statements_xml(reverse)}
+</dm:reverseDifferences>
+<dm:forwardDifferences rdf:parseType="Statements">
+{statements_xml(forward)}
+</dm:forwardDifferences>
+</dm:DifferenceModel>
+</rdf:RDF>
+''')
+
+
+@pytest.mark.parametrize('options', OPTIONS)
+def test_difference_model_validates_like_the_patched_model(model_files, shacl_files, tmp_path, options):
+    validator = loaded_validator(model_files, shacl_files, **options)
+    incremental = IncrementalValidator(validator)
+    base_rows = result_rows(validator.validate())
+    assert result_rows(incremental.validate()) == base_rows
+
+    reverse, forward = generate_difference(validator.merged_instance_graph)
+    path = tmp_path / 'difference.xml'
+    write_difference(path, reverse, forward)
+    incremental_rows = result_rows(incremental.apply_files([str(path)]))
+
+    patched = loaded_validator(model_files, shacl_files, **options)
+    graph = patched.merged_instance_graph
+    for triple in reverse:
+        graph.remove(triple)
+    graph.addN((s, p, o, graph) for s, p, o in forward)
+    expected = result_rows(patched.validate(histogram=ModelHistogram.from_graph(graph)))
+    assert expected != base_rows, "the difference changes the results"
+    assert incremental_rows == expected
@@ -0,0 +1,29 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+import pytest
+
+from application.metrics import PROC_CLEAR_REFS, Metrics, peak_rss_mb, reset_rss_high_water
+
+ALLOCATION_MB = 200
+
+
+@pytest.mark.skipif(not reset_rss_high_water(), reason=f"needs a writable {PROC_CLEAR_REFS}")
+def test_spans_record_their_own_resident_peak():
+    metrics = Metrics()
+    with metrics.span('outer'):
+        with metrics.span('large'):
+            block = bytearray(ALLOCATION_MB * 1024 * 1024)
+            block[::4096] = b'x' * len(block[::4096])  # touched, so that it is resident
+            del block
+        with metrics.span('small'):
+            pass
+    *spans, run = metrics.finish()
+    records = {record['name']: record for record in spans}
+    assert run['peak_rss_mb'] >= records['large']['peak_rss_mb']
+    # the next run starts from its own high-water mark
+    next_run = metrics.finish()[-1]
+    assert records['large']['peak_rss_mb'] - records['small']['peak_rss_mb'] > ALLOCATION_MB / 2
+    assert records['outer']['peak_rss_mb'] >= records['large']['peak_rss_mb']
+    assert peak_rss_mb() >= records['large']['peak_rss_mb']
+    assert next_run['peak_rss_mb'] < records['large']['peak_rss_mb']
@@ -0,0 +1,32 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+import os
+
+import pytest
+
+from application.validator import ModelValidator
+from tests.conftest import DATATYPE_MAPPING
+from tests.test_shapecache import damage
+
+
+def loaded_model(model_files):
+    # the triples and histogram of the model, and how many files came from the cache
+    validator = ModelValidator(cache_models=True)
+    validator.load_datatype_mapping(DATATYPE_MAPPING)
+    validator.load_instance_data(model_files)
+    histogram = validator.model_histogram
+    model = set(validator.merged_instance_graph), histogram.predicates, histogram.classes, histogram.total
+    return model, validator.metrics.counters['cached_files']
+
+
+@pytest.mark.parametrize('truncate', [True, False])
+def test_cached_models_equal_parsed_ones(model_files, tmp_path, monkeypatch, truncate):
+    monkeypatch.setenv('MODSHAPE_CACHE_DIR', str(tmp_path))
+    model, cached = loaded_model(model_files)
+    assert cached == 0
+    assert loaded_model(model_files) == (model, len(model_files))
+    # a damaged entry is parsed again, and replaced
+    damage(os.path.join(str(tmp_path), 'models', '*.model'), truncate)
+    assert loaded_model(model_files) == (model, 0)
+    assert loaded_model(model_files) == (model, len(model_files))
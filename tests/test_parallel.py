@@ -0,0 +1,13 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+import pytest
+
+from tests.test_stores import validation_results
+
+
+@pytest.mark.parametrize('options', [{}, {'store': 'Oxigraph', 'native_sparql': True}])
+def test_shapes_split_over_workers_validate_like_serial(model_files, shacl_files, options):
+    expected = validation_results(model_files, shacl_files, **options)
+    assert expected[1], "the model has violations to compare"
+    assert validation_results(model_files, shacl_files, shape_workers=2, **options) == expected
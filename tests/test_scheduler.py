@@ -0,0 +1,37 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+from application.scheduler import MEGABYTE, RunningJob, Scheduler
+
+
+class AliveProcess:
+    pid = -1
+
+    def is_alive(self):
+        return True
+
+
+class DryScheduler(Scheduler):
+    """Admits jobs without starting processes."""
+
+    def start(self, record, admitted_mb):
+        record['state'] = 'running'
+        self.running[record['id']] = RunningJob(record, AliveProcess(), None, admitted_mb)
+
+
+def queue(scheduler, job_id, lane, megabytes):
+    scheduler.jobs[job_id] = {'id': job_id, 'lane': lane, 'state': 'queued', 'name': job_id,
+                              'job': {'store': 'Memory'}, 'bytes': megabytes * MEGABYTE, 'attempts': 0}
+
+
+def test_urgent_job_runs_beside_a_job_estimated_beyond_the_budget(tmp_path):
+    (tmp_path / 'incoming').mkdir()
+    scheduler = DryScheduler(str(tmp_path), workers=4, memory_mb=16000)
+    queue(scheduler, 'cgm', 'bulk', 1200)
+    scheduler.admit()
+    assert scheduler.estimate_mb(scheduler.jobs['cgm']) > scheduler.memory_mb
+    queue(scheduler, 'normal', 'normal', 1)
+    queue(scheduler, 'urgent', 'urgent', 1)
+    scheduler.admit()
+    assert {job_id: record['state'] for job_id, record in scheduler.jobs.items()} == \
+        {'cgm': 'running', 'normal': 'queued', 'urgent': 'running'}
@@ -0,0 +1,47 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+import glob
+import os
+
+import pytest
+
+from application.validator import ModelValidator
+
+
+def compiled_shapes(shacl_files):
+    # the compiled shapes, and whether they were read from the files rather than the cache
+    validator = ModelValidator(native_sparql=True)
+    reads = []
+    read_shacl = validator.read_shacl
+    validator.read_shacl = lambda *args: reads.append(args) or read_shacl(*args)
+    compiled = validator.compile_shacl(shacl_files)
+    constraints = [(constraint.shape, constraint.node, constraint.query)
+                   for constraint in compiled.sparql_constraints.constraints]
+    return (set(compiled.graph), sorted(constraints, key=str), compiled.imports), bool(reads)
+
+
+def damage(pattern, truncate):
+    entries = glob.glob(pattern)
+    assert entries
+    for entry in entries:
+        with open(entry, 'r+b') as file:
+            if truncate:
+                file.truncate(os.path.getsize(entry) // 2)
+            else:
+                file.seek(-1, os.SEEK_END)
+                last = file.read(1)
+                file.seek(-1, os.SEEK_END)
+                file.write(bytes([last[0] ^ 0xFF]))
+
+
+@pytest.mark.parametrize('truncate', [True, False])
+def test_cached_shapes_equal_compiled_ones(shacl_files, tmp_path, monkeypatch, truncate):
+    monkeypatch.setenv('MODSHAPE_CACHE_DIR', str(tmp_path))
+    compiled, read = compiled_shapes(shacl_files)
+    assert read
+    assert compiled_shapes(shacl_files) == (compiled, False)
+    # a damaged entry is compiled again, and replaced
+    damage(os.path.join(str(tmp_path), 'shapes', '*.pickle'), truncate)
+    assert compiled_shapes(shacl_files) == (compiled, True)
+    assert compiled_shapes(shacl_files) == (compiled, False)
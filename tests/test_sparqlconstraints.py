@@ -0,0 +1,60 @@
+# Licensed under the Mozilla Public License 2.0.
+# Copyright(c) 2023, gridDigIt Kft. All rights reserved.
+
+import pyoxigraph
+import pytest
+from rdflib import Graph
+
+from application.sparqlconstraints import chains_operators
+
+CHAINED = [
+    '?a - ?b - ?c',
+    '?a - ?b + ?c',
+    '?a / ?b * ?c',
+    '?a*?b/?c/?b',
+    '?a/?b/?c',
+    '(?a+0)/(?b)/(?c)',
+    '?a - ?b * ?c - ?b',
+    '?a - -1 - ?b',
+    'abs(?a) - xsd:integer(?b) - ?c',
+    '"8"^^xsd:integer / ?b / ?c',
+]
+NOT_CHAINED = [
+    '?a - ?b',
+    '?a + ?b - ?c',
+    '?a * ?b / ?c',
+    '(?a - ?b) - ?c',
+    '?a / (?b / ?c)',
+    '?a / ?b + ?c / ?b',
+    '-?a - ?b',
+    'IF(?a - ?b > 0, ?a - ?c, ?b - ?c)',
+]
+QUERY = """PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+SELECT ?result WHERE { BIND(8 AS ?a) BIND(4 AS ?b) BIND(2 AS ?c) BIND((%s) AS ?result) }"""
+
+
+@pytest.mark.parametrize('expression', CHAINED)
+def test_chains_found(expression):
+    assert chains_operators(f"SELECT $this WHERE {{ $this ?p ?o . FILTER ({expression} > 1) }}")
+    assert chains_operators(f"SELECT $this ({expression} AS ?value) WHERE {{ $this ?p ?o }}")
+
+
+@pytest.mark.parametrize('expression', NOT_CHAINED)
+def test_no_chains(expression):
+    assert not chains_operators(f"SELECT $this WHERE {{ $this ?p ?o . BIND ({expression} AS ?x) }}")
+
+
+def test_paths_comments_and_strings_are_not_expressions():
+    assert not chains_operators("""SELECT $this WHERE {
+        $this cim:A.b/cim:B.c/cim:C.d ?value .  # a / b / c
+        $this (cim:A.e|cim:A.f)/cim:B.c/cim:C.d ?other .
+        FILTER (?value != "a - b - c" && ?other != <http://example.com/a/b/c>)
+    }""")
+
+
+@pytest.mark.parametrize('expression', CHAINED + NOT_CHAINED)
+def test_oxigraph_agrees_where_no_chain_is_found(expression):
+    rdflib_value = Graph().query(QUERY % expression).bindings[0]['result']
+    oxigraph_value = next(iter(pyoxigraph.Store().query(QUERY % expression)))['result']
+    if not chains_operators(QUERY % expression):
+        assert float(oxigraph_value.value) == float(rdflib_value)